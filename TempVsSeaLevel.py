@@ -1,174 +1,287 @@
 import logging
 import pandas as pd
-import os
-import matplotlib.pyplot as plt
-import statsmodels.api as sm
 import numpy as np
 import argparse
-from globalTemp import get_temp_csv, create_temp_local
-from seaLevels import get_sea_csv, create_sea_local
+from concurrent.futures import ThreadPoolExecutor
+from fetch import FetchError
+from globalTemp import get_temp_csv, load_temp
+from seaLevels import get_sea_csv, load_level
+from plots import PlotSpec, Series, render_plots
+from output import add_output_arguments, select_rows, write_rows, closed_pipe
+from regression import fit_ols, rolling_ols
+from bootstrap import bootstrap_ols, METHODS
+from lag import xcorr, best_lag, lagged_pairs
+from align import align
+from modelsearch import design, search, MAX_TERMS
+from memo import memoize
+from datadir import add_data_dir_argument, apply_data_dir
+import instrument
 
-### Adding a log handler for bugs
-logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
-fh = logging.FileHandler('logfile_TempVsSea.log', 'w')
-fh.setLevel(logging.DEBUG)
-logger.addHandler(fh)
-logging.getLogger('matplotlib.font_manager').disabled = True    # Disables annoying matplot messages
+### Adding a log handler for bugs, installed by main() so importing the module has no side effects
+def setup_logging():
+    '''Attaches the DEBUG file handler for this program to the root logger'''
+    instrument.setup_logging('logfile_TempVsSea.log')
+
+### Predictor columns selectable through -r
+PREDICTORS = {'annual': 'Annual Avg Temp', '5year': '5-Year Avg Temp'}
+
+### Plots available through -pl, 'all' renders every one of them
+MERGED_PLOTS = {
+    'annual': PlotSpec('TempVsSeaLevel.png', [Series('Annual Avg Temp', 'Sea Level', 'ro')],
+                       'Annual Avg Temp (Relative to 1951-1980 Avg)', 'Sea Level (GMSL)',
+                       title='Average Temp VS Sea Level'),
+    '5year': PlotSpec('Temp5YearVsSeaLevel.png', [Series('5-Year Avg Temp', 'Sea Level', 'ro')],
+                      '5-Year Avg Temp (Relative to 1951-1980 Avg)', 'Sea Level (GMSL)',
+                      title='5-Year Average Temp VS Sea Level'),
+    'norm': PlotSpec('AnnualTemp+SeaNormalized.png',
+                     [Series('Year', 'Norm Temp', 'ro', 'Avg Temp'),
+                      Series('Year', 'Norm Sea', 'bo', 'Sea Level')],
+                     'Year', 'Global Sea Level/Avg Temp',
+                     title='Annual Avg Temp and Sea Level (Normalized)', legend='upper left'),
+}
+
+### Columns drawn by MERGED_PLOTS
+def plot_columns(merged):
+    '''Returns the merged columns plus the normalized temp and sea arrays the 'norm' plot draws'''
+    columns = dict(merged.columns)
+    # This creates normalized arrays of temp and sea data over the common years
+    columns['Norm Temp'] = merged['Annual Avg Temp']/np.linalg.norm(merged['Annual Avg Temp'])
+    columns['Norm Sea'] = merged['Sea Level']/np.linalg.norm(merged['Sea Level'])
+    return columns
+
+### Fetches, cleans and loads one source, run on its own worker thread by callfiles
+def acquire(get_csv, load):
+    '''Creates the clean CSV of one source if it doesn't exist, then loads it
+
+    Returns:    table - DataTable of the clean data'''
+    get_csv()
+    return load()
 
 ### Create function to run with __main__ to allow for correct argument parsing
-def callfiles():
-    '''Brings in Global Temp and Sea Level Files
+def callfiles(years=None, reach=0):
+    '''Brings in Global Temp and Sea Level Files. Both sources are fetched, cleaned and
+        loaded concurrently, so a cold start costs about as much as the slower of the two.
+        An error on either side is raised here once both workers have finished.
+        Only the rows in the (start, end) range of years are kept, plus reach earlier years
+        of temp for lagged fits.
     
-    Returns:    df_merge - merged dataframe of Temp and Sea Data
-                data_temp - numpy array of Temp Data
-                data_sea - numpy array of Sea Data'''
-
-    # Creates CSVs needed for analysis if they don't exist
-    if os.path.exists('GlobalTempClean.csv') == False:
-        get_temp_csv()
-    if os.path.exists('SeaLevelClean.csv') == False:
-        get_sea_csv()
-
-    # Create local dataframes and arrays of the clean Temp and Sea Data
-    df_temp, data_temp = create_temp_local()
-    df_sea, data_sea = create_sea_local()
-
-    # This handy bit of code merges the two dataframes on 'Year'
-    df_merge = pd.merge(left=df_temp, right=df_sea,
-                            left_on='Year', right_on='Year')
-    return df_merge, data_temp, data_sea
-
-### Configuring arg parser (Adding Command line arguments)
-parser = argparse.ArgumentParser(
-    description='Imports seaLevel.py and globalTemp.py files, and creates clean CSVs\
-        of both datasets if needed. Gives analysis options for both sets.')
-plot = None
-display = None
-regression = None
-
-# Prints the pandas dataframe of clean temp data
-parser.add_argument('-p', '--print', default=False, dest='display',
-                    action='store_true', help='Displays the Merged GlobalTemp and SeaLevel dataset')
-
-# Multivariable use for creating plots of data
-parser.add_argument('-pl', '--plot', metavar='<plot type>',
-                    choices=['annual', '5year', 'norm', 'all'], dest='plot', action='store',
-                    help='Chooses which plot to output, or allows all plots to be output. \n \
-                        Options are "annual" for annual avg temp VS sea level, "5year" for 5 year avg temp VS sea level,\
-                        "norm" which plots Year VS normalized sets of avg temp and sea level,\
-                        and "all" which outputs all plots')
-
-# Fetches average temp and average increase per year
-parser.add_argument('-r', '--regression', metavar='<variable>', dest='regression',
-                    choices=['annual', '5year'],
-                    action='store', help='Performs an OLS regression on Global Temp vs Sea Level.\n \
-                        Options are "annual" for comparing the annual avg temp to sea level, and\
-                            "5year" for comparing 5 year avg to sea level')
-
-args = parser.parse_args()
-plot = args.plot
-display = args.display
-regression = args.regression
+    Returns:    merged - DataTable of Temp and Sea Data aligned on their common years
+                data_temp - DataTable of typed Temp Data columns
+                data_sea - DataTable of typed Sea Data columns'''
 
-if __name__ == "__main__":
-    df_merge, data_temp, data_sea = callfiles()
-    if display == True:
-        print(df_merge.to_string())
-        logging.debug('Data displayed...')
-    if plot != None:
-        if plot == 'annual':
-            plt.plot(df_merge['Annual Avg Temp'], df_merge['Sea Level'],'ro')
-            plt.xlabel('Annual Avg Temp (Relative to 1951-1980 Avg)')
-            plt.ylabel('Sea Level (GMSL)')
-            plt.title('Average Temp VS Sea Level')
-            plt.savefig('TempVsSeaLevel.png')
-        elif plot == '5year':
-            plt.plot(df_merge['5-Year Avg Temp'], df_merge['Sea Level'], 'ro')
-            plt.xlabel('5-Year Avg Temp (Relative to 1951-1980 Avg)')
-            plt.ylabel('Sea Level (GMSL)')
-            plt.title('5-Year Average Temp VS Sea Level')
-            plt.savefig('Temp5YearVsSeaLevel.png')
-        elif plot == 'norm':
-            norm_temp = (data_temp[:-3, 1]/np.linalg.norm(data_temp[:-3, 1]))
-            norm_sea = (data_sea[:, 1]/np.linalg.norm(data_sea[:, 1]))
-            # This creates normalized arrays of temp and sea data
-            plt.plot(df_merge['Year'], norm_temp, 'ro', label='Avg Temp')
-            plt.plot(df_merge['Year'], norm_sea, 'bo', label='Sea Level')
-            plt.xlabel('Year')
-            plt.ylabel('Global Sea Level/Avg Temp')
-            plt.title('Annual Avg Temp and Sea Level (Normalized)')
-            plt.legend(loc="upper left")
-            plt.savefig('AnnualTemp+SeaNormalized.png')
-        else:
-            plt.plot(df_merge['Annual Avg Temp'], df_merge['Sea Level'], 'ro')
-            plt.xlabel('Annual Avg Temp (Relative to 1951-1980 Avg)')
-            plt.ylabel('Sea Level (GMSL)')
-            plt.title('Average Temp VS Sea Level')
-            plt.savefig('TempVsSeaLevel.png')
-            plt.close()
-            plt.plot(df_merge['5-Year Avg Temp'], df_merge['Sea Level'], 'ro')
-            plt.xlabel('5-Year Avg Temp (Relative to 1951-1980 Avg)')
-            plt.ylabel('Sea Level (GMSL)')
-            plt.title('5-Year Average Temp VS Sea Level')
-            plt.savefig('Temp5YearVsSeaLevel.png')
-            plt.close()
-            norm_temp = (data_temp[:-3, 1]/np.linalg.norm(data_temp[:-3, 1]))
-            norm_sea = (data_sea[:, 1]/np.linalg.norm(data_sea[:, 1]))
-            plt.plot(df_merge['Year'], norm_temp, 'ro', label='Avg Temp')
-            plt.plot(df_merge['Year'], norm_sea, 'bo', label='Sea Level')
-            plt.xlabel('Year')
-            plt.ylabel('Global Sea Level/Avg Temp')
-            plt.title('Annual Avg Temp and Sea Level (Normalized)')
-            plt.legend(loc="upper left")
-            plt.savefig('AnnualTemp+SeaNormalized.png')
-        logging.debug('Plot(s) created...')
-    if regression != None:
-        if regression == 'annual':
-            mod=sm.OLS(df_merge['Sea Level'], df_merge['Annual Avg Temp'])
-            results=mod.fit()
-            print(results.summary())
-        elif regression == '5year':
-            mod=sm.OLS(df_merge['Sea Level'], df_merge['5-Year Avg Temp'])
-            results=mod.fit()
-            print(results.summary())
-        logging.debug('Regression Analysis Complete...')
-    print('\n'+'Done!')
-    logging.debug('TempVsSea Program successfully ran!')
+    # Network and parsing release the GIL, so two threads overlap both sources
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        temp = pool.submit(acquire, get_temp_csv, load_temp)
+        sea = pool.submit(acquire, get_sea_csv, load_level)
+        data_temp = temp.result()
+        data_sea = sea.result()
+
+    # Slices found by binary search, so only the selected years are aligned
+    if years is not None:
+        start, end = years
+        data_sea = data_sea.years(years)
+        data_temp = data_temp.years((None if start is None else start - reach, end))
+
+    # Builds the common year index once, every later step uses the aligned columns
+    with instrument.span('merge'):
+        merged = align(data_temp, data_sea)
+    return merged, data_temp, data_sea
+
+### Main function, which examines command line args then performs duty
+def main():
+    ### Configuring arg parser (Adding Command line arguments)
+    parser = argparse.ArgumentParser(
+        description='Imports seaLevel.py and globalTemp.py files, and creates clean CSVs\
+            of both datasets if needed. Gives analysis options for both sets.')
+    plot = None
+    display = None
+    regression = None
 
+    # Prints the pandas dataframe of clean temp data
+    parser.add_argument('-p', '--print', default=False, dest='display',
+                        action='store_true', help='Displays the Merged GlobalTemp and SeaLevel dataset')
 
+    # Multivariable use for creating plots of data
+    parser.add_argument('-pl', '--plot', metavar='<plot type>',
+                        choices=['annual', '5year', 'norm', 'all'], dest='plot', action='store',
+                        help='Chooses which plot to output, or allows all plots to be output. \n \
+                            Options are "annual" for annual avg temp VS sea level, "5year" for 5 year avg temp VS sea level,\
+                            "norm" which plots Year VS normalized sets of avg temp and sea level,\
+                            and "all" which outputs all plots')
 
+    # Fetches average temp and average increase per year
+    parser.add_argument('-r', '--regression', metavar='<variable>', dest='regression',
+                        choices=['annual', '5year'],
+                        action='store', help='Performs an OLS regression on Global Temp vs Sea Level.\n \
+                            Options are "annual" for comparing the annual avg temp to sea level, and\
+                                "5year" for comparing 5 year avg to sea level')
 
+    # Adds a constant term to the regression, which otherwise goes through the origin
+    parser.add_argument('-i', '--intercept', default=False, dest='intercept',
+                        action='store_true', help='Fits the -r regression with an intercept \
+                            (by default the line is forced through the origin)')
 
-### Unused main() function
-# def main(raw_args=None):
-#     parser = argparse.ArgumentParser(
-#         description='Imports seaLevel.py and globalTemp.py files, and creates clean CSVs\
-#             of both datasets if needed. Gives analysis options for both sets.')
-#     plot = None
-#     display = None
-#     regression = None
+    # Tracks how the temp -> sea level slope changes over time
+    parser.add_argument('-rw', '--rolling', metavar='<years>', dest='rolling', type=int,
+                        action='store', help='Fits sea level on temp (with intercept) over every \
+                            sliding window of this many years and displays slope and R-squared per window. \
+                            Uses the -r variable, annual avg temp by default')
 
-#     # Prints the pandas dataframe of clean temp data
-#     parser.add_argument('-p', '--print', default=False, dest='display',
-#                         action='store_true', help='Displays the Merged GlobalTemp and SeaLevel dataset')
+    # Confidence intervals for the regression using the GMSL uncertainty column
+    parser.add_argument('-b', '--bootstrap', metavar='<samples>', dest='bootstrap', type=int,
+                        action='store', help='Refits sea level on temp this many times with sea \
+                            level perturbed by its GMSL uncertainty and prints 95%% confidence intervals. \
+                            Uses the -r variable and -i flag, annual avg temp by default')
+    parser.add_argument('--method', default='pairs', choices=METHODS, dest='method',
+                        help='Bootstrap method: "pairs" also resamples years with replacement, \
+                            "mc" only perturbs sea level (default pairs)')
+    parser.add_argument('--seed', default=0, type=int, dest='seed',
+                        help='Seed of the bootstrap, results are reproducible for a given seed')
 
-#     # Multivariable use for creating plots of data
-#     parser.add_argument('-pl', '--plot', metavar='<plot type>',
-#                         choices=['annual', '5year', 'norm', 'all'], dest='plot', action='store',
-#                         help='Chooses which plot to output, or allows all plots to be output. \n \
-#                             Options are "annual" for annual avg temp VS sea level, "5year" for 5 year avg temp VS sea level,\
-#                             "norm" which plots Year VS normalized sets of avg temp and sea level,\
-#                             and "all" which outputs all plots')
+    # Finds the delay between temp and sea level and regresses on the lagged temp
+    parser.add_argument('-lg', '--lag', metavar='<max lag>', dest='lag', type=int, nargs='?',
+                        const=30, action='store', help='Cross-correlates sea level with temp over \
+                            all lags up to this many years (30 if omitted), reports the best lag and \
+                            fits sea level on temp from that many years earlier. Uses the -r variable and -i flag')
 
-#     # Fetches average temp and average increase per year
-#     parser.add_argument('-r', '--regression', metavar='<variable>', dest='regression',
-#                         choices=['annual', '5year'],
-#                         action='store', help='Performs an OLS regression on Global Temp vs Sea Level.\n \
-#                             Options are "annual" for comparing the annual avg temp to sea level, and\
-#                                 5year for comparing 5 year avg to sea level')
+    # Ranks sea level models built from lagged temps and a year trend
+    parser.add_argument('-ms', '--model-search', metavar='<max lag>', dest='search', type=int,
+                        nargs='?', const=10, action='store', help='Fits sea level (with intercept) on \
+                            every combination of up to --max-terms predictors among annual and 5 year \
+                            avg temp lagged 0 to this many years (10 if omitted) and a year trend, and \
+                            displays the models ranked by --criterion (the first 20, or --top)')
+    parser.add_argument('--max-terms', default=MAX_TERMS, type=int, dest='max_terms',
+                        help='Largest number of predictors in a -ms model (default %d)' % MAX_TERMS)
+    parser.add_argument('--criterion', default='bic', choices=['aic', 'bic'], dest='criterion',
+                        help='Information criterion -ms ranks models by, lowest first (default bic)')
 
-#     args = parser.parse_args(None)
-#     plot = args.plot
-#     display = args.display
-#     regression = args.regression
+    # Row selection and output format of -p
+    add_output_arguments(parser)
+
+    # Records a timing and peak memory report of every stage
+    instrument.add_profile_argument(parser)
+
+    # Folder of the data files, e.g. on a volume shared by parallel jobs
+    add_data_dir_argument(parser)
+
+    args = parser.parse_args()
+    setup_logging()
+    apply_data_dir(args)
+    instrument.apply_profile(args)
+    plot = args.plot
+    display = args.display
+    regression = args.regression
+
+    try:
+        # Lagged fits may reach back into temp years before the first selected year
+        merged, data_temp, data_sea = callfiles(args.years, max(args.lag or 0, args.search or 0))
+    except FetchError:
+        print('Error querying data')
+        raise SystemExit(1)
+    except ValueError:
+        print('Error Cleaning Data')
+        raise SystemExit(1)
+    if display == True:
+        rows = select_rows(merged, None, None, args.top, args.page, args.page_size)
+        write_rows(merged, rows, args.format)
+        logging.debug('Data displayed...')
+    if len(merged) == 0:
+        print('No common temp and sea level data in the selected years')
+        raise SystemExit(1)
+    if plot != None:
+        columns = plot_columns(merged)
+        names = list(MERGED_PLOTS) if plot == 'all' else [plot]
+        render_plots([(MERGED_PLOTS[name], columns) for name in names])
+        logging.debug('Plot(s) created...')
+    if regression != None and len(merged) < 3:
+        print('Regression needs at least 3 years, only %d selected' % len(merged))
+    elif regression != None:
+        predictor = PREDICTORS[regression]
+        with instrument.span('regression'):
+            results = memoize('ols', {'predictor': predictor, 'intercept': args.intercept},
+                              merged.columns, lambda: fit_ols(merged['Sea Level'], merged[predictor],
+                                                              intercept=args.intercept, names=[predictor],
+                                                              yname='Sea Level'))
+        print(results.summary())
+        logging.debug('Regression Analysis Complete...')
+    if args.rolling != None and len(merged) < 3:
+        print('Rolling regression needs at least 3 years, only %d selected' % len(merged))
+    elif args.rolling != None and not 2 < args.rolling <= len(merged):
+        print('Rolling window must be between 3 and %d years' % len(merged))
+    elif args.rolling != None:
+        predictor = PREDICTORS[regression or 'annual']
+        with instrument.span('rolling regression', window=args.rolling):
+            slope, intercept, rsquared = memoize(
+                'rolling', {'predictor': predictor, 'window': args.rolling}, merged.columns,
+                lambda: rolling_ols(merged['Sea Level'], merged[predictor], args.rolling))
+        years = merged['Year']
+        print(pd.DataFrame({'Start Year': years[:len(slope)], 'End Year': years[args.rolling-1:],
+                            'Slope': slope, 'Intercept': intercept,
+                            'R-squared': rsquared}).to_string())
+        logging.debug('Rolling Regression Complete...')
+    if args.bootstrap != None and args.bootstrap < 1:
+        print('Bootstrap needs at least 1 sample')
+    elif args.bootstrap != None and len(merged) < 3:
+        print('Bootstrap needs at least 3 years, only %d selected' % len(merged))
+    elif args.bootstrap != None:
+        predictor = PREDICTORS[regression or 'annual']
+        params = {'predictor': predictor, 'samples': args.bootstrap,
+                  'intercept': args.intercept, 'method': args.method, 'seed': args.seed}
+        with instrument.span('bootstrap', samples=args.bootstrap):
+            boot = memoize('bootstrap', params, merged.columns, lambda: bootstrap_ols(
+                merged['Sea Level'], merged[predictor], merged['Uncertainty'], args.bootstrap,
+                intercept=args.intercept, method=args.method, seed=args.seed))
+        print('Bootstrap of Sea Level on %s (%d %s samples, seed %d):'
+              % (predictor, args.bootstrap, args.method, args.seed))
+        print('Slope: %.4f, 95%% CI [%.4f, %.4f]' % ((boot.slope.mean(),) + boot.slope_ci))
+        if args.intercept:
+            print('Intercept: %.4f, 95%% CI [%.4f, %.4f]'
+                  % ((boot.intercept.mean(),) + boot.intercept_ci))
+        logging.debug('Bootstrap Complete...')
+    if args.lag != None and (args.lag < 0 or len(merged) < 3):
+        print('Lag analysis needs a max lag of at least 0 and at least 3 years, %d selected'
+              % len(merged))
+    elif args.lag != None:
+        predictor = PREDICTORS[regression or 'annual']
+        with instrument.span('cross-correlation'):
+            lags, corr = xcorr(merged[predictor], merged['Sea Level'], args.lag)
+        lag, best = best_lag(lags, corr)
+        print('Cross-correlation of Sea Level with %s, lags up to %d years:' % (predictor, lags[-1]))
+        print('Correlation at lag 0: %.4f' % corr[lags == 0][0])
+        print('Best lag: %d years (correlation %.4f)' % (lag, best))
+        # The lagged fit may reach back into temp years before the sea level record starts
+        years, x, y = lagged_pairs(data_temp['Year'], data_temp[predictor],
+                                   data_sea['Year'], data_sea['Sea Level'], lag)
+        if len(y) < 3:
+            print('Only %d years have temp %d years earlier, too few to fit' % (len(y), lag))
+        else:
+            print(fit_ols(y, x, intercept=args.intercept, names=['%s (lag %d)' % (predictor, lag)],
+                          yname='Sea Level').summary())
+        logging.debug('Lag Analysis Complete...')
+    if args.search != None and (args.search < 0 or args.max_terms < 1):
+        print('Model search needs a max lag of at least 0 and --max-terms of at least 1')
+    elif args.search != None:
+        # Lagged temps may reach back into temp years before the sea level record starts
+        names, X, y, years = design(data_temp, data_sea, list(PREDICTORS.values()),
+                                    range(args.search + 1))
+        if len(y) < min(args.max_terms, len(names)) + 2:
+            print('Only %d years have temp for every lag up to %d, too few to fit %d predictors'
+                  % (len(y), args.search, args.max_terms))
+        else:
+            with instrument.span('model search', predictors=len(names), max_terms=args.max_terms):
+                ranked = search(names, X, y, args.max_terms, args.criterion)
+            print('%d models of Sea Level on up to %d of %d predictors, %d-%d (%d years), by %s:'
+                  % (len(ranked), args.max_terms, len(names), years[0], years[-1], len(years),
+                     args.criterion.upper()))
+            print(ranked.head(20 if args.top is None else args.top).to_string())
+            logging.debug('Model Search Complete...')
+    instrument.finish(args)
+    print('\n'+'Done!')
+    logging.debug('TempVsSea Program successfully ran!')
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except BrokenPipeError:
+        closed_pipe()   # Output piped into a reader that stopped early
@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+from records import DataTable
+
+### Source-separated monthly temperature store and window aggregation
+# Raw temperature rows are keyed by (source, month) rather than by their position in the
+# file, so rows may come in any order, at monthly or annual resolution, and a source may
+# skip dates. pivot() groups them into a monthly table with one column per source, and
+# aggregate() turns that table into annual, 5-year, decadal or any N-month window means.
+# Window bounds come from a binary search of the sorted months and every window sum from one
+# segmented reduction per source, so every resolution is one pass over the monthly data.
+# (Differences of a running prefix sum would cost the same, but lose the exact value of a
+# one-month window to cancellation, and the annual clean file must match the raw values.)
+# Large files are reduced chunk by chunk with month_sums(); merge_sums() combines the sums of
+# separate chunks and merge_runs() streams them back in ascending blocks of whole years, so
+# only about one block of sums is held rather than every raw row or every month.
+
+LEVELS = {'monthly': 1, 'annual': 12, '5year': 60, 'decade': 120}
+
+
+def month_index(dates):
+    '''Returns year*12 + month-1 for an array of 'YYYY-MM-DD' (or 'YYYY-MM', 'YYYY') strings;
+        dates without a month count as January. Years may have any number of digits.'''
+    parts = pd.Series(dates, dtype=str).str.partition('-')
+    years = parts[0].to_numpy(dtype=np.int64)
+    months = pd.to_numeric(parts[2].str.slice(0, 2), errors='coerce')
+    return years*12 + np.nan_to_num(months.to_numpy(dtype=float), nan=1).astype(int) - 1
+
+
+def month_sums(codes, months, values, sources):
+    '''Sums (source code, month, value) rows per source and month, for codes below sources
+        (rows with a negative code are dropped).
+
+    Returns:    months - ascending months holding at least one value
+                sums - (sources, months) array of value sums
+                counts - (sources, months) array of value counts'''
+    keep = codes >= 0
+    codes, months, values = codes[keep].astype(np.int64), months[keep], values[keep]
+    unique, rows = np.unique(months, return_inverse=True)
+    flat = codes * len(unique) + rows
+    size = sources * len(unique)
+    sums = np.bincount(flat, weights=values, minlength=size).reshape(sources, -1)
+    counts = np.bincount(flat, minlength=size).reshape(sources, -1)
+    return unique, sums, counts
+
+
+def merge_sums(parts):
+    '''Combines the month_sums() results of separate chunks into one, in the same form'''
+    months = np.concatenate([part[0] for part in parts])
+    unique, rows = np.unique(months, return_inverse=True)
+    merged = [unique]
+    for k in (1, 2):
+        stacked = np.concatenate([part[k] for part in parts], axis=1)
+        merged.append(np.stack([np.bincount(rows, weights=row, minlength=len(unique))
+                                for row in stacked]))
+    return tuple(merged)
+
+
+def merge_runs(runs, rows):
+    '''Merges month_sums() results that each hold ascending months (e.g. those of separate
+        chunks) and yields them combined in ascending blocks of whole years, in the form of
+        merge_sums(). runs are functions returning each result, called again for every
+        block, so runs memory-mapped from disk are only mapped while a block is read. Each
+        block takes at most rows months from all runs together (or a single year holding
+        more), so memory does not grow with the size of the runs.'''
+    sizes = [len(run()[0]) for run in runs]
+    positions = [0] * len(runs)
+    while True:
+        live = [i for i in range(len(runs)) if positions[i] < sizes[i]]
+        if not live:
+            return
+        loaded = {i: runs[i]() for i in live}
+
+        def taken(year):
+            return sum(int(np.searchsorted(loaded[i][0], year*12)) - positions[i] for i in live)
+
+        # The block ends with the last year that keeps it within rows months (binary search
+        # over the years), or with the first year when that alone holds more
+        low = min(int(loaded[i][0][positions[i]]) for i in live) // 12 + 1
+        high = max(int(loaded[i][0][-1]) for i in live) // 12 + 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if taken(middle) <= rows:
+                low = middle
+            else:
+                high = middle - 1
+        end = low * 12
+        parts = []
+        for i in live:
+            months, sums, counts = loaded.pop(i)
+            start = positions[i]
+            positions[i] = start + int(np.searchsorted(months[start:], end))
+            parts.append((months[start:positions[i]], sums[:, start:positions[i]],
+                          counts[:, start:positions[i]]))
+        yield merge_sums(parts)
+
+
+def monthly_table(months, sums, counts, sources):
+    '''Returns the monthly table of month_sums() or merge_sums() results, see pivot'''
+    with np.errstate(invalid='ignore'):
+        means = sums / counts
+    return DataTable(dict({'Month': months.astype('int32')},
+                          **{source: means[i] for i, source in enumerate(sources)}))
+
+
+def pivot(codes, months, values, sources):
+    '''Groups (source code, month, value) rows into a monthly table. codes index into
+        sources (rows with a negative code are dropped); several values for one source and
+        month are averaged.
+
+    Returns:    monthly - DataTable of 'Month' (year*12 + month-1, ascending, every month
+                holding at least one value) and one float column per source, NaN where a
+                source has no value for that month'''
+    return monthly_table(*month_sums(codes, months, values, len(sources)), sources)
+
+
+def aggregate(monthly, window, anchor=0):
+    '''Averages every source column of a monthly table over consecutive windows of window
+        months (or a LEVELS name). Windows start at anchor + k*window, so with the default
+        anchor annual windows run January to December, 5-year windows start in years
+        divisible by 5 and decades in years divisible by 10. Each mean uses the months a
+        source has in the window; windows without any month are left out.
+
+    Returns:    table - DataTable of 'Year' and 'Month' (1-12) of each window start, and
+                one mean column per source'''
+    window = LEVELS.get(window, window)
+    month = monthly['Month'].astype(np.int64)
+    sources = [name for name in monthly.names if name != 'Month']
+    if len(month) == 0:
+        starts = np.empty(0, dtype=np.int64)
+    else:
+        first = anchor + (month[0] - anchor) // window * window
+        starts = np.arange(first, month[-1] + 1, window)
+    lo = np.searchsorted(month, starts)
+    hi = np.searchsorted(month, starts + window)
+    nonempty = hi > lo
+    starts, lo, hi = starts[nonempty], lo[nonempty], hi[nonempty]
+    columns = {'Year': (starts // 12).astype('int32'), 'Month': (starts % 12 + 1).astype('int32')}
+    for source in sources:
+        values = monthly[source]
+        present = ~np.isnan(values)
+        if len(lo) == 0:
+            columns[source] = np.empty(0)
+            continue
+        # Non-empty windows tile the months from lo[0] to the end, so each sum runs from its
+        # lo to the next one
+        total = np.add.reduceat(np.where(present, values, 0.0), lo)
+        count = np.add.reduceat(present.astype(np.int64), lo)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            columns[source] = total / count
+    return DataTable(columns)
@@ -0,0 +1,56 @@
+import numpy as np
+from records import DataTable
+
+### Year alignment of any number of DataTables
+# The year index shared by every table is built once, then each table contributes its
+# columns reordered onto that index. When a table's matching rows already form one
+# ascending run (the usual case for yearly files) its columns are sliced, so the aligned
+# table holds views of the source arrays rather than copies.
+
+
+def _sorted_years(table):
+    '''Returns the table's years in ascending order plus the permutation that sorts them
+        (None when the table is already sorted)'''
+    years = table['Year']
+    if len(years) < 2 or np.all(years[1:] > years[:-1]):
+        return years, None
+    order = np.argsort(years, kind='stable')
+    return years[order], order
+
+
+def year_index(*tables):
+    '''Returns the sorted array of years present in every table'''
+    common = None
+    for years, order in map(_sorted_years, tables):
+        if common is None:
+            common = np.unique(years)
+            continue
+        # Sorted merge of the running index against this table's sorted years
+        pos = np.searchsorted(years, common)
+        hit = pos < len(years)
+        hit[hit] = years[pos[hit]] == common[hit]
+        common = common[hit]
+    return common
+
+
+def align(*tables):
+    '''Aligns the tables on the years they have in common. Column names other than 'Year'
+        must be unique across tables.
+
+    Returns:    aligned - a DataTable with 'Year' followed by every table's value columns'''
+    years = year_index(*tables)
+    columns = {'Year': years}
+    for table in tables:
+        sorted_years, order = _sorted_years(table)
+        rows = np.searchsorted(sorted_years, years)
+        if order is not None:
+            rows = order[rows]
+        if len(rows) and rows[-1] - rows[0] == len(rows) - 1 and np.all(np.diff(rows) == 1):
+            rows = slice(rows[0], rows[-1] + 1)     # One contiguous run, take a view
+        for name in table.names:
+            if name == 'Year':
+                continue
+            if name in columns:
+                raise ValueError('Column %r appears in more than one table' % name)
+            columns[name] = table[name][rows]
+    return DataTable(columns)
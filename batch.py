@@ -0,0 +1,171 @@
+import os
+import shutil
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from datacache import CacheWriter, read_cache, cache_dir
+from records import DataTable
+from align import align
+from regression import fit_ols
+from globalTemp import iter_clean_temp, TEMP_COLUMNS, TEMP_DTYPES
+from seaLevels import iter_clean_level, SEA_COLUMNS, SEA_DTYPES
+
+### Batch analysis of many (temperature, sea level) series pairs
+# The manifest is a CSV with a name, temp and sea column, the last two being raw files in
+# the GlobalTempData / SeaLevelData layouts (relative paths are taken from the manifest's
+# folder). Each run goes through three steps:
+#   1. clean  - every distinct raw file is cleaned into its typed binary cache, in a
+#               process pool; files whose cache is current are not parsed again
+#   2. pack   - all cleaned columns are copied into one shared memory block
+#   3. analyze- workers attach to the block, build zero-copy DataTables for their pair,
+#               align them and fit sea level on annual temp; only scalars come back
+# Results are collected column by column into one table, written as CSV.
+
+SOURCES = {'temp': (iter_clean_temp, TEMP_COLUMNS, TEMP_DTYPES),
+           'sea': (iter_clean_level, SEA_COLUMNS, SEA_DTYPES)}
+RESULT_COLUMNS = ['Years', 'First Year', 'Last Year', 'Mean Temp', 'Mean Sea Level',
+                  'Sea Level Trend', 'Slope', 'Slope Std Err', 'Intercept', 'R-squared']
+
+_shared = {}    # The shared memory block, attached once per worker by _attach_block
+
+
+def read_manifest(path):
+    '''Returns the manifest as a dataframe with absolute temp and sea paths'''
+    manifest = pd.read_csv(path, dtype=str)
+    folder = os.path.dirname(os.path.abspath(path))
+    for kind in SOURCES:
+        manifest[kind] = [os.path.join(folder, p) for p in manifest[kind]]
+    return manifest
+
+
+def clean_source(kind, path):
+    '''Cleans one raw file into its binary cache unless the cache is already current. The
+        first chunk is parsed before the cache is created, and a cache folder created for a
+        file that fails to clean is removed again.
+
+    Returns:    error - None on success, otherwise a message describing the failure'''
+    parse, names, dtypes = SOURCES[kind]
+    created = not os.path.isdir(cache_dir(path))
+    try:
+        if read_cache(path, names) is None:
+            chunks = parse(path)
+            first = next(chunks, None)      # Opens the file and parses its first chunk
+            cache = CacheWriter(path, names, dtypes)
+            if first is not None:
+                cache.append(*first)
+            for chunk in chunks:
+                cache.append(*chunk)
+            cache.commit()
+        return None
+    except Exception as error:
+        if created:
+            shutil.rmtree(cache_dir(path), ignore_errors=True)
+        return '%s: %s' % (os.path.basename(path), error)
+
+
+def pack(tables):
+    '''Copies every column of every table into one new shared memory block
+
+    Returns:    shm - the SharedMemory block (the caller closes and unlinks it)
+                layouts - per table, a list of (name, dtype, offset, rows) entries'''
+    layouts, offset = [], 0
+    for table in tables:
+        layout = []
+        for name in table.names:
+            layout.append((name, table[name].dtype.str, offset, len(table)))
+            offset += -(-table[name].nbytes // 8) * 8     # Keeps every column 8-byte aligned
+        layouts.append(layout)
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for table, layout in zip(tables, layouts):
+        for name, dtype, start, rows in layout:
+            np.ndarray(rows, dtype=dtype, buffer=shm.buf, offset=start)[:] = table[name]
+    return shm, layouts
+
+
+def _attach_block(name):
+    _shared['shm'] = shared_memory.SharedMemory(name=name)
+
+
+def _view(layout):
+    '''Returns a DataTable whose columns are views into the attached shared memory block'''
+    buf = _shared['shm'].buf
+    return DataTable({name: np.ndarray(rows, dtype=dtype, buffer=buf, offset=start)
+                      for name, dtype, start, rows in layout})
+
+
+def analyze(temp_layout, sea_layout):
+    '''Aligns one pair and computes its statistics and temp -> sea level fit
+
+    Returns:    row - tuple of values in RESULT_COLUMNS order'''
+    merged = align(_view(temp_layout), _view(sea_layout))
+    if len(merged) < 3:
+        return (len(merged),) + (np.nan,) * (len(RESULT_COLUMNS) - 1)
+    years, temp, sea = merged['Year'], merged['Annual Avg Temp'], merged['Sea Level']
+    fit = fit_ols(sea, temp)
+    trend = np.polyfit(years, sea, 1)[0]
+    return (len(merged), years[0], years[-1], temp.mean(), sea.mean(), trend,
+            fit.params[1], fit.bse[1], fit.params[0], fit.rsquared)
+
+
+def run_batch(manifest, processes=None):
+    '''Runs clean -> load -> align -> regress for every pair of the manifest dataframe
+
+    Returns:    results - dataframe with one row per pair, RESULT_COLUMNS plus an Error column'''
+    workers = processes or os.cpu_count() or 1
+    sources = sorted({(kind, path) for kind in SOURCES for path in manifest[kind]})
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        errors = dict(zip(sources, pool.map(clean_source, [k for k, p in sources],
+                                            [p for k, p in sources])))
+    logging.debug('Batch sources cleaned...')
+
+    tables = {source: DataTable(read_cache(source[1], SOURCES[source[0]][1]))
+              for source, error in errors.items() if error is None}
+    keys = list(tables)
+    shm, layouts = pack([tables[key] for key in keys])
+    layouts = dict(zip(keys, layouts))
+    try:
+        todo = [i for i, (t, s) in enumerate(zip(manifest['temp'], manifest['sea']))
+                if ('temp', t) in layouts and ('sea', s) in layouts]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach_block,
+                                 initargs=(shm.name,)) as pool:
+            rows = list(pool.map(analyze, [layouts['temp', manifest['temp'][i]] for i in todo],
+                                 [layouts['sea', manifest['sea'][i]] for i in todo],
+                                 chunksize=max(1, len(todo) // (workers * 4))))
+    finally:
+        shm.close()
+        shm.unlink()
+    logging.debug('Batch pairs analyzed...')
+
+    # Collected column by column into the output table
+    columns = {name: np.full(len(manifest), np.nan) for name in RESULT_COLUMNS}
+    for column, values in zip(RESULT_COLUMNS, zip(*rows) if rows else []):
+        columns[column][todo] = values
+    results = pd.DataFrame({'Name': manifest['name'].to_numpy(), **columns})
+    counts = ['Years', 'First Year', 'Last Year']
+    results[counts] = results[counts].astype('Int64')    # Whole numbers, empty on failure
+    results['Error'] = [errors.get(('temp', t)) or errors.get(('sea', s)) or ''
+                        for t, s in zip(manifest['temp'], manifest['sea'])]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Runs the temp VS sea level analysis for every (temp, sea level) pair of a \
+            manifest CSV with name, temp and sea columns, spread over all cores.')
+    parser.add_argument('manifest', help='Manifest CSV of raw temp and sea level files')
+    parser.add_argument('-o', '--output', default='BatchResults.csv',
+                        help='CSV the results table is written to (default BatchResults.csv)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Number of worker processes (default one per CPU)')
+    args = parser.parse_args()
+    results = run_batch(read_manifest(args.manifest), args.jobs)
+    results.to_csv(args.output, index=False)
+    print('%d pairs analyzed, %d failed, results in %s'
+          % (len(results), (results['Error'] != '').sum(), args.output))
+
+
+if __name__ == "__main__":
+    main()
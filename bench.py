@@ -0,0 +1,142 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+from globalTemp import clean_data_temp, load_temp, TEMP_PLOTS
+from seaLevels import clean_data_level, load_level
+from align import align
+from regression import fit_ols
+from plots import render
+
+### Offline benchmark of the data pipeline on synthetic raw files
+# The generators write raw files in the source layouts (two rows per year for temp, GCAG
+# annual mean then GISTEMP five-year mean dated YYYY-MM; one date-prefixed row per year for
+# GMSL), so every stage runs the same code as the programs do on real data:
+#   clean       - raw file -> clean CSV + binary cache, for both sources
+#   load        - clean data -> DataTables, for both sources
+#   merge       - year alignment of the two tables
+#   stats       - mean, standard deviation and extremes of every value column
+#   regression  - OLS trend of sea level on year over the whole table (as the OLS plots),
+#                 plus sea level on annual temp over the merged table (as -r)
+#   plot        - one rendered figure, skipped above --plot-max rows
+# Years simply count up from FIRST_YEAR (the parsers take years of any width), so every
+# year is distinct and every table grows with the size, as in the first runs of the bench.
+# Results are appended as one JSON line per size so runs can be compared between commits.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIRST_YEAR = 1000
+BLOCK_ROWS = 1000000    # Rows formatted per write while generating
+SIZES = [10**3, 10**4, 10**5, 10**6]
+
+
+def _years(start, stop):
+    return FIRST_YEAR + np.arange(start, stop)
+
+
+def write_raw_temp(path, rows, seed=0):
+    '''Writes a synthetic GlobalTempData file holding rows years (2*rows raw rows)'''
+    rng = np.random.default_rng(seed)
+    with open(path, 'w') as f:
+        f.write('Country,Code,Indicator,Source,Date,Mean\n')
+        for start in range(0, rows, BLOCK_ROWS):
+            years = _years(start, min(rows, start + BLOCK_ROWS))
+            trend = 0.008 * (years - 1950)
+            annual = trend + rng.normal(0, 0.1, len(years))
+            five = trend + rng.normal(0, 0.03, len(years))
+            f.write(''.join('World,WLD,Temp,GCAG,"%d-12",%.4f\nWorld,WLD,Temp,GISTEMP,"%d-12",%.2f\n'
+                            % (y, a, y, b) for y, a, b in zip(years.tolist(), annual.tolist(),
+                                                               five.tolist())))
+
+
+def write_raw_level(path, rows, seed=1):
+    '''Writes a synthetic SeaLevelData file holding rows years'''
+    rng = np.random.default_rng(seed)
+    with open(path, 'w') as f:
+        f.write('Time,GMSL,GMSL uncertainty\n')
+        for start in range(0, rows, BLOCK_ROWS):
+            years = _years(start, min(rows, start + BLOCK_ROWS))
+            level = 1.5 * (years - 1990) + rng.normal(0, 5, len(years))
+            uncert = rng.uniform(5, 25, len(years))
+            f.write(''.join('%d-06-15,%.1f,%.1f\n' % row for row in zip(years.tolist(), level.tolist(),
+                                                                       uncert.tolist())))
+
+
+def _timed(stage, times, function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    times[stage] = min(times.get(stage, np.inf), time.perf_counter() - start)
+    return result
+
+
+def stats(table):
+    return {name: (table[name].mean(), table[name].std(), table[name].min(), table[name].max())
+            for name in table.names[1:]}
+
+
+def run_size(rows, repeat=1, plot_max=10**6):
+    '''Generates raw files of rows years in the current folder and times every stage
+
+    Returns:    times - dict of stage -> best wall time in seconds over repeat runs'''
+    write_raw_temp('GlobalTempData.csv', rows)
+    write_raw_level('SeaLevelData.csv', rows - rows // 40)     # Sea level ends a few years earlier
+    times = {}
+    for _ in range(repeat):
+        _timed('clean', times, lambda: (clean_data_temp(), clean_data_level()))
+        temp, sea = _timed('load', times, lambda: (load_temp(), load_level()))
+        merged = _timed('merge', times, align, temp, sea)
+        _timed('stats', times, lambda: (stats(temp), stats(sea)))
+        _timed('regression', times, lambda: (
+            fit_ols(sea['Sea Level'], sea['Year']),
+            fit_ols(merged['Sea Level'], merged['Annual Avg Temp'])))
+        if rows <= plot_max:
+            _timed('plot', times, render, TEMP_PLOTS['annual']._replace(output='bench.png'),
+                   temp.columns)
+    return times
+
+
+def commit():
+    '''Returns the current git commit of the repository, or None outside a checkout'''
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Times the clean, load, merge, stats, regression \
+        and plot stages on synthetic raw files of increasing size')
+    parser.add_argument('-s', '--sizes', type=float, nargs='+', default=SIZES,
+                        help='Years (rows) per synthetic file, e.g. -s 1e3 1e6 1e8 (default 1e3 to 1e6)')
+    parser.add_argument('-n', '--repeat', type=int, default=1,
+                        help='Runs per size, the best time of each stage is kept (default 1)')
+    parser.add_argument('--plot-max', type=float, default=1e6,
+                        help='Largest size the plot stage is run at (default 1e6)')
+    parser.add_argument('-d', '--dir', default=None,
+                        help='Folder the synthetic files are written to (default a temporary folder)')
+    parser.add_argument('-o', '--output', default=os.path.join(HERE, 'bench_results.jsonl'),
+                        help='JSON lines file results are appended to')
+    args = parser.parse_args()
+
+    cwd, output = os.getcwd(), os.path.abspath(args.output)
+    info = {'time': time.time(), 'commit': commit(), 'python': sys.version.split()[0],
+            'numpy': np.__version__}
+    with tempfile.TemporaryDirectory(dir=args.dir) as folder:
+        os.chdir(folder)
+        try:
+            for size in args.sizes:
+                times = run_size(int(size), args.repeat, args.plot_max)
+                print('%-10d ' % size + '  '.join('%s %.3fs' % item for item in times.items()))
+                with open(output, 'a') as f:
+                    f.write(json.dumps(dict(info, rows=int(size),
+                                            stages={k: round(v, 5) for k, v in times.items()})) + '\n')
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
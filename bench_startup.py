@@ -0,0 +1,61 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+### Startup-time benchmark for the three command line programs
+# Each case is timed in a fresh interpreter, the way cron and shell pipelines call us.
+# Results are appended as one JSON line per run so they can be compared between commits.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+MODULES = ['globalTemp', 'seaLevels', 'TempVsSeaLevel']
+HEAVY = ['matplotlib', 'statsmodels', 'requests']
+
+
+def time_command(command, repeat):
+    '''Runs command repeat times in a fresh interpreter
+
+    Returns:    best - fastest wall time in seconds
+                median - median wall time in seconds'''
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=HERE, check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return times[0], times[len(times) // 2]
+
+
+def heavy_modules(module):
+    '''Returns which of the heavy stacks get imported by a plain import of module'''
+    code = 'import sys, %s; print(",".join(m for m in %r if m in sys.modules))' % (module, HEAVY)
+    out = subprocess.run([sys.executable, '-c', code], cwd=HERE, check=True,
+                         capture_output=True, text=True).stdout.strip()
+    return out.split(',') if out else []
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Times interpreter startup of the command line programs')
+    parser.add_argument('-n', '--repeat', type=int, default=5, help='Runs per case (default 5)')
+    parser.add_argument('-o', '--output', default='bench_startup.jsonl',
+                        help='JSON lines file results are appended to')
+    args = parser.parse_args()
+
+    cases = {'python': [sys.executable, '-c', 'pass']}
+    for module in MODULES:
+        cases['import ' + module] = [sys.executable, '-c', 'import ' + module]
+        cases[module + ' --help'] = [sys.executable, module + '.py', '--help']
+    results = {'time': time.time(), 'python': sys.version.split()[0], 'cases': {}}
+    for name, command in cases.items():
+        best, median = time_command(command, args.repeat)
+        results['cases'][name] = {'best_s': round(best, 4), 'median_s': round(median, 4)}
+        print('%-28s best %.3fs  median %.3fs' % (name, best, median))
+    results['heavy_imports'] = {module: heavy_modules(module) for module in MODULES}
+    with open(args.output, 'a') as f:
+        f.write(json.dumps(results) + '\n')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+### Bootstrap / Monte Carlo confidence intervals for the temp -> sea level fit
+# Every replicate perturbs sea level by its reported GMSL uncertainty (taken as one standard
+# deviation), and the 'pairs' method also resamples the years with replacement. Replicates
+# are fitted a whole batch at a time with closed-form array operations, the batches are
+# spread over a process pool, and each batch draws from its own child of one SeedSequence,
+# so results only depend on the seed, never on the number of workers.
+
+BATCH_ELEMENTS = 4000000    # Replicates x rows held in memory per batch
+METHODS = ['pairs', 'mc']
+
+BootstrapResult = namedtuple('BootstrapResult', ['slope', 'intercept', 'slope_ci', 'intercept_ci'])
+BootstrapResult.__doc__ = '''Replicate coefficients (intercept is all zeros for fits through the
+    origin) and (low, high) percentile confidence intervals'''
+
+_shared = {}    # x, y and sigma, handed to each worker process once by _init_worker
+
+
+def _init_worker(x, y, sigma):
+    _shared.update(x=x, y=y, sigma=sigma)
+
+
+def _degenerate(xb, intercept):
+    # Replicates whose x leaves the slope undefined: a single x value drawn for every row,
+    # or only zeros for a fit through the origin
+    if intercept:
+        return xb.min(axis=1) == xb.max(axis=1)
+    return np.all(xb == 0, axis=1)
+
+
+def fit_batch(seed, size, method='pairs', intercept=True, x=None, y=None, sigma=None):
+    '''Draws and fits one batch of replicates. Without x/y/sigma the arrays handed to the
+        worker process are used.
+
+    Returns:    slope - array of size replicate slopes
+                intercept - array of size replicate intercepts'''
+    x = _shared['x'] if x is None else x
+    y = _shared['y'] if y is None else y
+    sigma = _shared['sigma'] if sigma is None else sigma
+    rng = np.random.default_rng(seed)
+    if method == 'pairs':
+        rows = rng.integers(0, len(y), size=(size, len(y)))
+        # Likely on short series, these are drawn again rather than fitted as NaN
+        bad = _degenerate(x[rows], intercept)
+        while bad.any():
+            rows[bad] = rng.integers(0, len(y), size=(bad.sum(), len(y)))
+            bad[bad] = _degenerate(x[rows[bad]], intercept)
+        xb = x[rows]
+        yb = y[rows] + rng.standard_normal(rows.shape)*sigma[rows]
+    else:
+        xb = np.broadcast_to(x, (size, len(x)))
+        yb = y + rng.standard_normal((size, len(y)))*sigma
+    if not intercept:
+        return np.einsum('ij,ij->i', xb, yb)/np.einsum('ij,ij->i', xb, xb), np.zeros(size)
+    xc = xb - xb.mean(axis=1, keepdims=True)
+    ymean = yb.mean(axis=1)
+    slope = np.einsum('ij,ij->i', xc, yb)/np.einsum('ij,ij->i', xc, xc)
+    return slope, ymean - slope*xb.mean(axis=1)
+
+
+def bootstrap_ols(y, x, sigma, samples=10000, intercept=True, method='pairs', seed=0,
+                  processes=None, level=0.95):
+    '''Refits sea level (y) on temp (x) for samples replicates drawn using the per-row
+        uncertainty sigma, and reports percentile confidence intervals at the given level.
+
+    Returns:    result - a BootstrapResult'''
+    if method not in METHODS:
+        raise ValueError('method must be one of %s' % METHODS)
+    if samples < 1:
+        raise ValueError('samples must be at least 1')
+    x, y, sigma = (np.ascontiguousarray(v, dtype=float) for v in (x, y, sigma))
+    if _degenerate(x[None], intercept)[0]:
+        raise ValueError('x must vary (and not be all zeros) for a slope to be fitted')
+    batch = max(1, min(samples, BATCH_ELEMENTS // len(y)))
+    sizes = [batch] * (samples // batch) + ([samples % batch] if samples % batch else [])
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [seeds, sizes, [method] * len(sizes), [intercept] * len(sizes)]
+    if len(sizes) > 1 and processes != 1:
+        workers = min(len(sizes), processes or os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(x, y, sigma)) as pool:
+            fits = list(pool.map(fit_batch, *jobs))
+    else:
+        _init_worker(x, y, sigma)
+        fits = list(map(fit_batch, *jobs))
+    slope = np.concatenate([f[0] for f in fits])
+    const = np.concatenate([f[1] for f in fits])
+    tails = [(1 - level)/2*100, (1 + level)/2*100]
+    return BootstrapResult(slope, const, tuple(np.percentile(slope, tails)),
+                           tuple(np.percentile(const, tails)))
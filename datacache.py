@@ -0,0 +1,131 @@
+import os
+import json
+import shutil
+import logging
+import numpy as np
+
+### Typed binary cache sitting next to a clean CSV file
+# Layout of e.g. GlobalTempClean.cache/:
+#   schema.json  - version, row count, column names/dtypes, a stamp of the clean CSV and
+#                  optional metadata of the ingest that wrote it (see ingest.py)
+#   0.bin, 1.bin - one raw little-endian column each, memory-mapped on load
+# schema.json is always written last, so a half written cache is never considered valid.
+# A cache written from scratch goes to .tmp column files renamed in place on commit, so a
+# reader still mapping the previous columns keeps seeing them whole. Appending rows only
+# grows the column files, but dropping stored rows (see CacheWriter) also goes through
+# .tmp copies, as shrinking a mapped file in place would pull pages from under a reader.
+
+CACHE_VERSION = 1
+
+
+def cache_dir(csv_file):
+    '''Returns the cache directory belonging to a clean CSV file'''
+    return os.path.splitext(csv_file)[0] + '.cache'
+
+
+def _stamp(csv_file):
+    '''Returns the size and modification time used to detect a stale cache'''
+    stat = os.stat(csv_file)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+class CacheWriter:
+    '''Streams typed columns into the cache of csv_file, one chunk at a time.
+        Call commit() once the clean CSV itself has been fully written. With rows > 0 the
+        chunks are appended after the first rows already in a current cache, any rows
+        after those being dropped.'''
+
+    def __init__(self, csv_file, names, dtypes, rows=0):
+        self.csv_file = csv_file
+        self.directory = cache_dir(csv_file)
+        self.names = list(names)
+        self.dtypes = [np.dtype(dtype).newbyteorder('<') for dtype in dtypes]
+        self.rows = rows
+        os.makedirs(self.directory, exist_ok=True)
+        schema = os.path.join(self.directory, 'schema.json')
+        if os.path.exists(schema):
+            os.remove(schema)       # Invalidates the old cache before touching its columns
+        self.files = []
+        paths = [os.path.join(self.directory, '%d.bin' % i) for i in range(len(self.dtypes))]
+        shrinks = rows and any(os.path.getsize(path) > rows * dtype.itemsize
+                               for path, dtype in zip(paths, self.dtypes))
+        self.suffix = '.tmp' if not rows or shrinks else ''
+        for path, dtype in zip(paths, self.dtypes):
+            if shrinks:
+                shutil.copyfile(path, path + self.suffix)
+            f = open(path + self.suffix, 'r+b' if rows else 'wb')
+            f.truncate(rows * dtype.itemsize)
+            f.seek(0, os.SEEK_END)
+            self.files.append(f)
+
+    def append(self, *columns):
+        '''Appends one chunk, given as one array per column'''
+        for f, dtype, values in zip(self.files, self.dtypes, columns):
+            f.write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+        self.rows += len(columns[0])
+
+    def commit(self, meta=None):
+        '''Closes the column files and writes the schema, stamped with the clean CSV.
+            meta is any JSON serializable value, returned by read_meta while the cache is current.'''
+        for i, f in enumerate(self.files):
+            f.close()
+            if self.suffix:
+                path = os.path.join(self.directory, '%d.bin' % i)
+                os.replace(path + self.suffix, path)
+        schema = {'version': CACHE_VERSION, 'rows': self.rows,
+                  'columns': [{'name': name, 'dtype': dtype.str, 'file': '%d.bin' % i}
+                              for i, (name, dtype) in enumerate(zip(self.names, self.dtypes))],
+                  'source': _stamp(self.csv_file), 'meta': meta}
+        tmp = os.path.join(self.directory, 'schema.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(schema, f)
+        os.replace(tmp, os.path.join(self.directory, 'schema.json'))
+        logging.debug('Binary cache written for %s...' % self.csv_file)
+
+
+def write_cache(csv_file, columns):
+    '''Writes a whole dict of column name -> array to the cache of csv_file'''
+    writer = CacheWriter(csv_file, columns.keys(), [np.asarray(v).dtype for v in columns.values()])
+    writer.append(*columns.values())
+    writer.commit()
+
+
+def read_cache(csv_file, names):
+    '''Opens the cache of csv_file without copying it
+
+    Returns:    dict of column name -> read-only memory-mapped array, or None if the
+                cache is missing, from another version/schema, or older than the CSV'''
+    try:
+        with open(os.path.join(cache_dir(csv_file), 'schema.json')) as f:
+            schema = json.load(f)
+        if (schema['version'] != CACHE_VERSION
+                or [c['name'] for c in schema['columns']] != list(names)
+                or schema['source'] != _stamp(csv_file)):
+            logging.debug('Binary cache for %s is stale...' % csv_file)
+            return None
+        rows = schema['rows']
+        columns = {}
+        for column in schema['columns']:
+            dtype = np.dtype(column['dtype'])
+            path = os.path.join(cache_dir(csv_file), column['file'])
+            if os.path.getsize(path) != rows * dtype.itemsize:
+                return None
+            if rows == 0:
+                columns[column['name']] = np.empty(0, dtype=dtype)
+            else:
+                columns[column['name']] = np.memmap(path, dtype=dtype, mode='r', shape=(rows,))
+        return columns
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def read_meta(csv_file, names):
+    '''Returns the metadata committed with the cache of csv_file, or None if there is none or
+        the cache is not current (see read_cache)'''
+    if read_cache(csv_file, names) is None:
+        return None
+    try:
+        with open(os.path.join(cache_dir(csv_file), 'schema.json')) as f:
+            return json.load(f).get('meta')
+    except (OSError, ValueError):
+        return None
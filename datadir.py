@@ -0,0 +1,77 @@
+import os
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError:     # No flock on Windows, builds stay atomic but may run more than once
+    fcntl = None
+
+### Location of the shared raw and clean data files, and the locks guarding them
+# The data files live in one folder: the working directory unless set_data_dir() (the
+# programs' --data-dir) or the DATA_DIR_ENV environment variable names another, so many
+# jobs can share one copy on a shared volume. Each dataset has a lock file next to its
+# clean file. Building (fetch + clean) holds it exclusively and re-checks what is on disk
+# once it has it, so when several jobs start cold only the first one fetches and cleans,
+# while the others wait and then load its result. Loading holds it shared, so a reader
+# never sees a clean file that is still being written. The analysis cache (memo.py) and
+# the plots (plots.py) are kept in the data folder as well, so parallel jobs share them.
+
+DATA_DIR_ENV = 'TEMPSEA_DATA_DIR'
+
+_data_dir = None
+
+
+def set_data_dir(path):
+    '''Points every data file at path (created if needed) instead of the working directory'''
+    global _data_dir
+    os.makedirs(path, exist_ok=True)
+    _data_dir = path
+
+
+def data_dir():
+    '''Returns the folder holding the data files'''
+    return _data_dir or os.environ.get(DATA_DIR_ENV) or '.'
+
+
+def add_data_dir_argument(parser):
+    '''Adds the --data-dir argument shared by the programs, applied with apply_data_dir'''
+    parser.add_argument('--data-dir', metavar='<folder>', dest='data_dir',
+                        help='Folder holding the raw and clean data files, shared between runs \
+                            (default $%s, or the current folder)' % DATA_DIR_ENV)
+
+
+def apply_data_dir(args):
+    '''Uses the folder given by --data-dir, if any'''
+    if args.data_dir:
+        set_data_dir(args.data_dir)
+
+
+def data_path(name):
+    '''Returns the path of a data file, e.g. data_path('GlobalTempClean.csv')'''
+    return os.path.join(data_dir(), name)
+
+
+@contextmanager
+def locked(name, shared=False, directory=None):
+    '''Holds the lock of the dataset whose clean file is name, exclusively (to build it)
+        or shared (to read it), across processes. Blocks until the lock is free. Other
+        shared files (the analysis cache, plot manifests) are locked the same way, with
+        their lock file in directory rather than the data folder if given.'''
+    directory = directory or data_dir()
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, '.%s.lock' % name), 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield       # Closing the file releases the lock
+
+
+def building(name):
+    '''Returns True while a process holds the lock of the dataset whose clean file is name
+        exclusively (building it), without waiting for it'''
+    if fcntl is None:
+        return False
+    with open(os.path.join(data_dir(), '.%s.lock' % name), 'a') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+    return False
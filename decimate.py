@@ -0,0 +1,69 @@
+import numpy as np
+
+### Point reduction in front of the plot renderer
+# A figure can only show so many distinct points, so long series are cut down to roughly
+# what its pixel grid can resolve before they reach matplotlib:
+#   lines    - x is split into one bin per pixel column and each bin keeps its first, last,
+#              lowest and highest point, so the drawn envelope and every extreme are exact
+#   markers  - (or x out of order) one point is kept per occupied pixel cell, in the
+#              original order, so the same cells are inked as with every point
+# Both are single vectorized passes. Short series are drawn unchanged.
+
+FIGURE_PIXELS = (640, 480)      # matplotlib's default 6.4 x 4.8 inch figure at 100 dpi
+KEEP_POINTS = 4                 # Series shorter than this many points per pixel column are kept
+
+
+def minmax_bins(x, y, bins):
+    '''Returns the sorted indices of the first, last, lowest and highest point of each of
+        bins equal-width bins of x. x must be ascending; NaN y values are never picked as
+        extremes.'''
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    edges = x[0] + (x[-1] - x[0]) * np.arange(bins) / bins
+    starts = np.unique(np.searchsorted(x, edges))
+    starts = starts[starts < n]
+    starts[0] = 0
+    ends = np.append(starts[1:], n)
+    bin_of = np.repeat(np.arange(len(starts)), ends - starts)
+    keep = [starts, ends - 1]
+    with np.errstate(invalid='ignore'):
+        for extreme in (np.fmin.reduceat(y, starts), np.fmax.reduceat(y, starts)):
+            hits = np.flatnonzero(y == extreme[bin_of])
+            first = np.unique(bin_of[hits], return_index=True)[1]     # First hit of each bin
+            keep.append(hits[first])
+    return np.unique(np.concatenate(keep))
+
+
+def _cells(values, size):
+    finite = np.isfinite(values)
+    if not finite.any():
+        return np.full(len(values), -1)
+    low, high = values[finite].min(), values[finite].max()
+    scaled = (values - low) / ((high - low) or 1) * (size - 1)
+    return np.where(finite, np.rint(np.where(finite, scaled, 0)), -1).astype(np.int64)
+
+
+def grid_sample(x, y, width, height):
+    '''Returns the sorted indices of the first point falling in each cell of a width x height
+        pixel grid spanning the data'''
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    cell = (_cells(x, width) + 1) * (height + 1) + _cells(y, height) + 1
+    return np.sort(np.unique(cell, return_index=True)[1])
+
+
+def decimate(x, y, line=True, pixels=FIGURE_PIXELS):
+    '''Reduces one plotted series to the points its figure can show, by min/max binning for
+        a line over ascending x, otherwise by keeping one point per pixel cell
+
+    Returns:    x, y - the kept points (the inputs themselves when the series is short)'''
+    width, height = pixels
+    if len(x) <= KEEP_POINTS * width:
+        return x, y
+    x = np.asarray(x)
+    if line and np.all(x[1:] >= x[:-1]):
+        index = minmax_bins(x, y, width)
+    else:
+        index = grid_sample(x, y, width, height)
+    return x[index], np.asarray(y)[index]
@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import logging
+
+### Shared download layer for the raw data files
+# Next to every downloaded file two small sidecars may exist:
+#   <file>.json      - url plus the ETag/Last-Modified the file was downloaded with
+#   <file>.part      - bytes received so far by an interrupted download
+#   <file>.part.json - url plus the validators of the response the .part came from
+# The real file is only ever replaced by an atomic rename of a finished .part file.
+
+CHUNK_BYTES = 1 << 16   # Bytes written to disk per streamed chunk
+TIMEOUT = 30            # Seconds to wait on connect / between bytes
+RETRIES = 3             # Extra attempts after a dropped connection or timeout
+BACKOFF = 1.0           # Seconds slept before the first retry, doubled each time
+
+
+class FetchError(IOError):
+    '''Raised when a source could not be downloaded. The requests error is chained as
+        __cause__; requests itself is only imported once a download is attempted.'''
+
+
+def _read_meta(path):
+    '''Returns the JSON sidecar at path, or an empty dict if there is none'''
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_meta(path, meta):
+    '''Atomically writes a JSON sidecar'''
+    with open(path + '.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(path + '.tmp', path)
+
+
+def _validators(url, response):
+    '''Returns the sidecar entry describing a response'''
+    return {'url': url, 'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified')}
+
+
+def _request_headers(url, dest):
+    '''Builds conditional and range headers from whatever is already on disk
+
+    Returns:    headers - dict of request headers
+                offset - number of bytes already held in the .part file'''
+    headers = {}
+    meta = _read_meta(dest + '.json')
+    if os.path.exists(dest) and meta.get('url') == url:
+        # Unchanged sources answer 304 and cost a single round trip
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+    offset = 0
+    part_meta = _read_meta(dest + '.part.json')
+    if os.path.exists(dest + '.part') and part_meta.get('url') == url:
+        offset = os.path.getsize(dest + '.part')
+    if offset:
+        headers['Range'] = 'bytes=%d-' % offset
+        # If-Range makes the server send the whole body again if the source changed
+        validator = part_meta.get('etag') or part_meta.get('last_modified')
+        if validator:
+            headers['If-Range'] = validator
+    return headers, offset
+
+
+def _discard_part(dest):
+    '''Removes the .part file of dest and its sidecar, if any'''
+    for path in [dest + '.part', dest + '.part.json']:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _download(url, dest, timeout, chunk_bytes):
+    '''Performs a single download attempt, see fetch'''
+    import requests
+    headers, offset = _request_headers(url, dest)
+    with requests.get(url, headers=headers, stream=True, timeout=timeout,
+                      allow_redirects=True) as response:
+        if response.status_code == 304:
+            logging.debug('%s unchanged since last download...' % url)
+            return False
+        if offset and not 200 <= response.status_code < 300:
+            # The .part cannot be resumed (e.g. 416 once the source shrank), start over
+            logging.debug('Resuming %s failed (%d), downloading it again...'
+                          % (url, response.status_code))
+            response.close()
+            _discard_part(dest)
+            return _download(url, dest, timeout, chunk_bytes)
+        response.raise_for_status()
+        resumed = (response.status_code == 206 and offset
+                   and response.headers.get('Content-Range', '').startswith('bytes %d-' % offset))
+        if resumed:
+            logging.debug('Resuming %s at byte %d...' % (url, offset))
+        else:
+            _write_meta(dest + '.part.json', _validators(url, response))
+        with open(dest + '.part', 'ab' if resumed else 'wb') as f:
+            for block in response.iter_content(chunk_bytes):
+                f.write(block)
+        meta = _read_meta(dest + '.part.json')
+    os.replace(dest + '.part', dest)
+    _write_meta(dest + '.json', meta)
+    os.remove(dest + '.part.json')
+    return True
+
+
+def fetch(url, dest, timeout=TIMEOUT, retries=RETRIES, chunk_bytes=CHUNK_BYTES):
+    '''Streams url to the file dest. Uses a conditional request when dest was downloaded
+        before, resumes an interrupted download with a Range request, and retries dropped
+        connections with exponential backoff. dest is replaced atomically, so readers never
+        see a half written file.
+
+    Returns:    True if dest was (re)written, False if the source was unchanged
+    Raises:     FetchError once the retries are used up, or on an HTTP error'''
+    import requests
+    retryable = (requests.ConnectionError, requests.Timeout,
+                 requests.exceptions.ChunkedEncodingError)
+    for attempt in range(retries + 1):
+        try:
+            return _download(url, dest, timeout, chunk_bytes)
+        except retryable as error:
+            if attempt == retries:
+                raise FetchError('Could not download %s' % url) from error
+            logging.debug('Download of %s interrupted (%s), retrying...' % (url, error))
+            time.sleep(BACKOFF * 2 ** attempt)
+        except requests.RequestException as error:
+            raise FetchError('Could not download %s' % url) from error
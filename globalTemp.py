@@ -1,91 +1,297 @@
 import os
-from numpy.lib.function_base import average
-import requests
 import logging
+import tempfile
+import itertools
+from contextlib import contextmanager
 import argparse
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
+from fetch import fetch, FetchError
+import instrument
+from datacache import read_cache, read_meta, write_cache
+from ingest import raw_changed, raw_extends, write_clean
+from aggregate import LEVELS, month_index, month_sums, merge_runs, monthly_table, aggregate
+from records import DataTable
+from datadir import data_path, locked, add_data_dir_argument, apply_data_dir
+from streamstats import StreamStats
+from plots import PlotSpec, Series, render_plots
+from output import add_output_arguments, select_rows, write_rows, closed_pipe
 
-### Adding a log handler for bugs
-logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
-fh = logging.FileHandler('logfile_GlobalTemp.log', 'w')
-fh.setLevel(logging.DEBUG)
-logger.addHandler(fh)
-logging.getLogger('matplotlib.font_manager').disabled = True # Disables annoying matplot messages
+### Adding a log handler for bugs, installed by main() so importing the module has no side effects
+def setup_logging():
+    '''Attaches the DEBUG file handler for this program to the root logger'''
+    instrument.setup_logging('logfile_GlobalTemp.log')
+
+CHUNK_ROWS = 200000     # Raw rows parsed per chunk while cleaning, keeps memory bounded
+TEMP_COLUMNS = ['Year', 'Annual Avg Temp', '5-Year Avg Temp']
+TEMP_DTYPES = ['int32', 'float64', 'float64']
+TEMP_SOURCES = ['GCAG', 'GISTEMP']      # Raw sources, cleaned into the annual and 5-year columns
+MONTHLY_COLUMNS = ['Month'] + TEMP_SOURCES
+MONTHLY_DTYPES = ['int32', 'float64', 'float64']
+TEMP_RAW, TEMP_CLEAN = 'GlobalTempData.csv', 'GlobalTempClean.csv'    # In the data folder, see datadir.py
+TEMP_MONTHLY = 'GlobalTempMonthly.csv'
+
+### Plots available through -pl, 'all' renders every one of them
+TEMP_PLOTS = {
+    'annual': PlotSpec('AnnualAvgTemp.png', [Series('Year', 'Annual Avg Temp')],
+                       'Year', 'Annual Average Temperature'),
+    '5year': PlotSpec('5-YearAvgTemp.png', [Series('Year', '5-Year Avg Temp', 'g-')],
+                      'Year', '5-Year Avgrage Temperature'),
+    'OLS': PlotSpec('AnnualAvgTempRegression.png', [Series('Year', 'Annual Avg Temp', 'o')],
+                    'Year', 'Annual Average Temperature', fit=('Year', 'Annual Avg Temp')),
+}
 
 ### Defining functions 
 # Pulls temp data
 def get_data_temp():
     '''Queries the url to generate a CSV file with Global temp data. CSV will be stored in 
-        folder used to run file.
+        folder used to run file. The download is streamed, resumable and conditional, so an
+        unchanged source is not downloaded again (see fetch.fetch).
 
-    Returns: None, but creates GlobalTempData.csv'''
+    Returns: True if GlobalTempData.csv was (re)written, False if the source was unchanged
+    Raises:  FetchError if the source could not be queried'''
     url = 'https://query.data.world/s/2rwx5ges7kbt3ouhzi2pe4dv2dxuit'
-    response = requests.get(url, allow_redirects=True)
-    if response:
+    try:
+        with instrument.span('fetch temp'):
+            changed = fetch(url, data_path(TEMP_RAW))
         logging.debug('Successfully connected to data source, grabbing Temp Data...')
-        open('GlobalTempData.csv', 'wb').write(response.content)
-    else:
+        return changed
+    except FetchError:
         logging.debug('Could not connect to data source...')
-        logging.debug('Exiting program')
-        print('Error querying data')
-        quit()
+        raise
+
+def _spill(part, folder, run):
+    # Writes one month_sums() result to folder, returns a function mapping it back
+    paths = [os.path.join(folder, '%d.%d.npy' % (run, k)) for k in range(len(part))]
+    for path, values in zip(paths, part):
+        np.save(path, values)
+    return lambda: tuple(np.load(path, mmap_mode='r') for path in paths)
+
+# Groups the raw temp rows by source and month
+@contextmanager
+def spilled_temp_months(file=None, chunksize=CHUNK_ROWS, offset=0):
+    '''Parses the raw GlobalTempData file in fixed-size chunks into the monthly table with
+        one column per source (see aggregate.pivot). Rows are keyed by their source and date
+        with vectorized operations, so their order in the file does not matter and monthly
+        rows keep their resolution; rows of other sources are ignored. A non-zero offset
+        starts parsing at that byte (the start of a row past the header).
+        Since a month may still get values from any later row, each chunk is reduced to a
+        sum and count per source and month and spilled to a temporary folder next to the
+        raw file, removed on exit. The sorted runs are merged back block by block (see
+        aggregate.merge_runs), so memory stays bounded by chunksize whatever the file size.
+
+    Yields:     months - function returning an iterator over the monthly table in ascending
+                blocks (DataTables of MONTHLY_COLUMNS) of whole years, which may be called
+                more than once'''
+    file = file or data_path(TEMP_RAW)
+    folder = os.path.dirname(os.path.abspath(file))
+    with tempfile.TemporaryDirectory(prefix='.spill-', dir=folder) as spill:
+        runs = []
+        with open(file, 'rb') as f:
+            f.seek(offset)
+            reader = pd.read_csv(f, header=None, skiprows=0 if offset else 1, usecols=[3, 4, 5],
+                                 dtype=str, chunksize=chunksize)
+            for chunk in reader:
+                part = month_sums(pd.Categorical(chunk[3], categories=TEMP_SOURCES).codes,
+                                  month_index(chunk[4].to_numpy()),
+                                  chunk[5].to_numpy(dtype=float), len(TEMP_SOURCES))
+                runs.append(_spill(part, spill, len(runs)))
+        yield lambda: (monthly_table(*block, TEMP_SOURCES) for block in merge_runs(runs, chunksize))
+
+def iter_temp_months(file=None, chunksize=CHUNK_ROWS, offset=0):
+    '''Yields the monthly table of the raw GlobalTempData file in ascending blocks of whole
+        years, see spilled_temp_months'''
+    with spilled_temp_months(file, chunksize, offset) as months:
+        yield from months()
+
+def _annual_chunks(monthly, chunksize):
+    # Aggregates a monthly table (a block of spilled_temp_months, or the stored months from
+    # some year on) slice by slice, each slice holding the months of whole years
+    months = monthly['Month']
+    step = max(1, chunksize // 2)     # Months per chunk, each raw month being two rows
+    start = 0
+    while start < len(months):
+        end = min(start + step, len(months))
+        end = int(np.searchsorted(months, (months[end - 1] // 12 + 1) * 12))
+        annual = aggregate(monthly.take(slice(start, end)), 'annual')
+        if any(np.isnan(annual[source]).any() for source in TEMP_SOURCES):
+            raise ValueError('Raw temp data has a year without a value from every source')
+        yield tuple(annual[name] for name in ['Year'] + TEMP_SOURCES)
+        start = end
+
+# Streams cleaned temp rows out of the raw file
+def iter_clean_temp(file=None, chunksize=CHUNK_ROWS, offset=0):
+    '''Cleans the raw GlobalTempData file into annual rows, the GCAG source giving the
+        annual-mean temp and the GISTEMP source the five-year-mean temp, each averaged over
+        the months the raw file holds for that year (one date per year in the annual file).
+        The raw rows are grouped by source and date (see spilled_temp_months), so their order
+        does not matter. A non-zero offset starts parsing at that byte.
+
+    Yields:     years - int array of at most chunksize/2 years
+                annual - float array of annual-mean temps
+                five - float array of five-year-mean temps
+    Raises:     ValueError if a year lacks a value from one of the sources'''
+    for monthly in iter_temp_months(file, chunksize, offset):
+        yield from _annual_chunks(monthly, chunksize)
+
+def _write_monthly(file, blocks, meta=None):
+    '''Stores the monthly blocks parsed from file, or appends them to the store of meta
+
+    Returns:    monthly - DataTable of the whole store, memory-mapped'''
+    write_clean(([monthly[name] for name in MONTHLY_COLUMNS] for monthly in blocks), file,
+                data_path(TEMP_MONTHLY), MONTHLY_COLUMNS, MONTHLY_DTYPES, meta)
+    return DataTable(read_cache(data_path(TEMP_MONTHLY), MONTHLY_COLUMNS))
+
+def _clean_temp_added(file, chunksize):
+    '''Cleans only the raw rows added since the last clean: their months are appended to the
+        monthly store, and the annual rows from the last stored year on are recomputed from
+        the store, replacing that year's row since it may have been partial.
+
+    Returns:    rows - number of years added, or None when the whole file must be cleaned'''
+    meta = read_meta(data_path(TEMP_CLEAN), TEMP_COLUMNS)
+    store = read_meta(data_path(TEMP_MONTHLY), MONTHLY_COLUMNS)
+    if not (meta and store and meta.get('raw') and meta.get('base') and store.get('stats')
+            and store.get('raw') == meta['raw'] and raw_extends(file, meta['raw'])):
+        return None
+    offset = meta['raw']['offset']
+    if os.path.getsize(file) == offset:
+        return 0    # Nothing was added
+    added = iter_temp_months(file, chunksize, offset)
+    first = next(added, None)
+    if first is not None and first['Month'][0] <= store['high_water']:
+        added.close()
+        return None     # Values for stored months, whose raw rows are not kept
+    monthly = _write_monthly(file, [] if first is None else itertools.chain([first], added), store)
+    last = meta['high_water']
+    return write_clean(_annual_chunks(monthly.between('Month', last*12), chunksize), file,
+                       data_path(TEMP_CLEAN), TEMP_COLUMNS, TEMP_DTYPES, meta, replace_last=True)
 
 # Cleans temp Data
-def clean_data_temp(file='GlobalTempData.csv'):
+def clean_data_temp(file=None, chunksize=CHUNK_ROWS, incremental=False):
     '''Processes raw GlobalTempData file and deletes unused columns as well as aggregates the
         annual-mean temp (second column) and five-year-mean temp (third column) onto same row. 
-        Cleans up year entry.
+        Cleans up year entry. The raw file is streamed chunk by chunk into per-month sums
+        (see spilled_temp_months), as rows of a year may come anywhere in the file. The
+        annual rows are aggregated from them block by block and written out in chunks of at
+        most chunksize/2 years. The same chunks are written to the typed binary cache read
+        by load_temp. The source-separated monthly table the annual rows are aggregated
+        from is stored as well, in GlobalTempMonthly.csv. With incremental=True and a raw file that only grew since it
+        was last cleaned, just the new rows are parsed (see _clean_temp_added).
 
-    Returns: None, but creates GlobalTempClean.csv'''
+    Returns: rows - number of rows added to GlobalTempClean.csv and GlobalTempClean.cache/
+    Raises:  ValueError if the raw file could not be cleaned'''
+    file = file or data_path(TEMP_RAW)
     try:
-        data = np.loadtxt(file,delimiter=',',dtype=str)
-        rows=[]
-        for i in range(1,len(data),2):
-            row = [int(data[i][4][1:5]),float(data[i][5]),float(data[i+1][5])]
-            rows.append(row)
-        clean_data = np.array(rows,dtype='O')
-        pd.DataFrame(clean_data).to_csv('GlobalTempClean.csv')
+        with instrument.span('clean temp', incremental=incremental):
+            rows = _clean_temp_added(file, chunksize) if incremental else None
+            if rows is None:
+                with spilled_temp_months(file, chunksize) as months:
+                    rows = write_clean((chunk for monthly in months()
+                                        for chunk in _annual_chunks(monthly, chunksize)),
+                                       file, data_path(TEMP_CLEAN), TEMP_COLUMNS, TEMP_DTYPES)
+                    _write_monthly(file, months())
         logging.debug(
-            'Temp Data Sucessfully Cleaned...')
-    except:
+            'Temp Data Sucessfully Cleaned, %d rows written...' % rows)
+        return rows
+    except Exception as error:
         logging.debug('Error cleaning data, check raw data file...')
-        print('Error Cleaning Data')
-        quit()
+        if os.path.exists(data_path(TEMP_CLEAN)):
+            os.remove(data_path(TEMP_CLEAN))       # Never leave a half written clean file behind
+        raise ValueError('Error cleaning GlobalTempData.csv') from error
 
 
 # Checks for data files in local folder, and generates them if unavailable
-def get_temp_csv():
-    '''Builds both the clean and raw CSV files for use in the module'''
-    if os.path.exists('GlobalTempClean.csv') == False:
+def get_temp_csv(refresh=False):
+    '''Builds both the clean and raw CSV files for use in the module. With refresh=True the
+        source is queried again, and the clean file is only updated if the raw data changed.
+        A raw file that grew since it was cleaned only has its new rows parsed (see
+        _clean_temp_added). Concurrent callers build the files once: the others wait for the
+        first one and then find its files up to date (see datadir.locked).'''
+    with locked(TEMP_CLEAN):
+        _build_temp(refresh)
+
+def _build_temp(refresh):
+    if refresh == True and get_data_temp() == True:
+        logging.debug('Temp source changed, updating clean file...')
+        clean_data_temp(data_path(TEMP_RAW), incremental=True)
+    elif os.path.exists(data_path(TEMP_CLEAN)) == False:
         # Searches for the clean CSV, and if it does not exist attempts to clean the raw CSV
         logging.debug('No clean Temp Data file found locally, creating clean file...')
-        if os.path.exists('GlobalTempData.csv') == False:
+        if os.path.exists(data_path(TEMP_RAW)) == False:
             # Searches for the raw CSV, and if it does not exist attempts to query data
             logging.debug('No Temp Data file found locally, querying data file from internet...')
             get_data_temp()
-            clean_data_temp('GlobalTempData.csv')  # Cleans raw CSV
+            clean_data_temp(data_path(TEMP_RAW))  # Cleans raw CSV
         else:
-            clean_data_temp('GlobalTempData.csv')  # Cleans raw CSV
+            clean_data_temp(data_path(TEMP_RAW))  # Cleans raw CSV
         logging.debug('Clean Temp Data generated...')
+    elif raw_changed(data_path(TEMP_RAW), data_path(TEMP_CLEAN), TEMP_COLUMNS):
+        # The raw file was replaced since it was cleaned, only new years are parsed if it grew
+        logging.debug('Temp Data file changed since cleaning, updating clean file...')
+        clean_data_temp(data_path(TEMP_RAW), incremental=True)
     else:
         logging.debug('Clean Temp Data found...')
 
 
+# Loads the clean temp data into typed column arrays
+def load_temp():
+    '''Returns the clean temp data as a DataTable of contiguous typed columns (int32
+        Year, float64 values). Opens the memory-mapped binary cache when it is current, and
+        only parses the CSV (rebuilding the cache) when the cache is missing or stale.
+
+    Returns:    table - A DataTable of the clean CSV data'''
+    with instrument.span('load temp'):
+        with locked(TEMP_CLEAN, shared=True):
+            columns = read_cache(data_path(TEMP_CLEAN), TEMP_COLUMNS)
+        if columns is None:
+            # Rebuilt under the exclusive lock, once: later jobs find the cache written
+            with locked(TEMP_CLEAN):
+                columns = read_cache(data_path(TEMP_CLEAN), TEMP_COLUMNS)
+                if columns is None:
+                    logging.debug('No current Temp cache, reading clean CSV...')
+                    df = pd.read_csv(data_path(TEMP_CLEAN), index_col=0)  # Creates dataframe from Clean CSV
+                    df.columns = TEMP_COLUMNS
+                    columns = DataTable.from_frame(df, TEMP_DTYPES).columns
+                    write_cache(data_path(TEMP_CLEAN), columns)
+        logging.debug('Temp DataTable created...')
+        return DataTable(columns)
+
+# Loads the source-separated monthly temp data
+def load_temp_monthly():
+    '''Returns the monthly temp table with one column per source (see spilled_temp_months),
+        from GlobalTempMonthly.cache/ when it is current, otherwise parsed again from the raw
+        file and stored.
+
+    Returns:    monthly - DataTable of MONTHLY_COLUMNS'''
+    with instrument.span('load temp monthly'), locked(TEMP_CLEAN):
+        columns = read_cache(data_path(TEMP_MONTHLY), MONTHLY_COLUMNS)
+        if columns is None:
+            logging.debug('No current monthly Temp store, parsing raw data...')
+            columns = _write_monthly(data_path(TEMP_RAW), iter_temp_months()).columns
+        return DataTable(columns)
+
+def parse_resolution(text):
+    '''argparse type for --resolution, a name from aggregate.LEVELS or a number of months'''
+    if text in LEVELS:
+        return text
+    try:
+        months = int(text)
+        if months > 0:
+            return months
+    except ValueError:
+        pass
+    raise argparse.ArgumentTypeError('expected one of %s or a number of months' % ', '.join(LEVELS))
+
 # Creates local data array and dataframe for use in arg parse
 def create_temp_local():
     '''Returns a dataframe and numpy array of the clean temp CSV and ensures 
-        that both are in proper format to be processed by command line arguments
-        
+        that both are in proper format to be processed by command line arguments.
+        Compatibility accessor over load_temp, new code should use the typed table.
+
     Returns:    df - A pandas dataframe of the clean CSV data
                 data - A numpy array of the clean CSV data
     '''
-    df = pd.read_csv('GlobalTempClean.csv', index_col=0)  # Creates dataframe from Clean CSV
-    df.columns = ['Year', 'Annual Avg Temp', '5-Year Avg Temp']
-    data = df.values.astype('object')    # Creates np array from Clean CSV
-    data[:, 0] = data[:, 0].astype('int')       # Insures correct datatype for year
+    df, data = load_temp().legacy()
     logging.debug('Temp Dataframe and numpy array created...')
     return df, data
 
@@ -121,67 +327,89 @@ def main():
                         action='store_true', help='Displays the average global temp and average \
                             yearly change over the timeframe')
 
+    # Queries the source again and rebuilds the clean data if it changed
+    parser.add_argument('-u', '--update', default=False, dest='update',
+                        action='store_true', help='Checks the data source for a newer file \
+                            (a single round trip if unchanged) and recleans it if needed')
+
+    # Displays the source-separated data averaged over windows instead of the clean table
+    parser.add_argument('-res', '--resolution', metavar='<window>', type=parse_resolution,
+                        dest='resolution', help='With -p or -st, displays GCAG and GISTEMP \
+                            averaged over "monthly", "annual", "5year" or "decade" windows, \
+                            or windows of this many months, instead of the clean table')
+
+    # Row selection and output format of -p and -st
+    add_output_arguments(parser)
+
+    # Records a timing and peak memory report of every stage
+    instrument.add_profile_argument(parser)
+
+    # Folder of the data files, e.g. on a volume shared by parallel jobs
+    add_data_dir_argument(parser)
+
     args = parser.parse_args()
+    setup_logging()
+    apply_data_dir(args)
+    instrument.apply_profile(args)
     ave = args.ave
     plot = args.plot
     display = args.display
     sortType = args.sorttemp
 
-    get_temp_csv()
-    df, data = create_temp_local()
-    if sortType == True:
-        print(df.sort_values(by=['Annual Avg Temp'],
-                             ascending=False).to_string())
-        logging.debug('Data sorted by temp and displayed...')
-    elif display == True:
-        print(df.to_string())
+    try:
+        get_temp_csv(refresh=args.update)
+    except FetchError:
+        print('Error querying data')
+        raise SystemExit(1)
+    except ValueError:
+        print('Error Cleaning Data')
+        raise SystemExit(1)
+    table = load_temp()
+    # Every operation below only touches the --years rows, a slice found by binary search
+    window = table.years(args.years)
+    if len(window) == 0:
+        print('No temp data in the selected years')
+        raise SystemExit(1)
+    if sortType == True or display == True:
+        shown, column = table, 'Annual Avg Temp'
+        if args.resolution != None:
+            monthly = load_temp_monthly()
+            if args.years != None:
+                start, end = args.years
+                monthly = monthly.between('Month', None if start is None else start*12,
+                                          None if end is None else end*12 + 11)
+            with instrument.span('aggregate', window=args.resolution):
+                shown, column = aggregate(monthly, args.resolution), 'GCAG'
+        # Streamed block by block, only the selected rows are ever formatted
+        rows = select_rows(shown, args.years, column if sortType else None,
+                           args.top, args.page, args.page_size)
+        write_rows(shown, rows, args.format)
         logging.debug('Data displayed...')
 
     if ave == True:
-        print('Average global temp from 1880 to 2016:',
-              round(data.mean(axis=0)[1], 5))
-        print('Average increase in global temperature per year:',
-              round((data[-1][1]-data[0][1])/len(data), 5))
+        with instrument.span('stats'):
+            meta = read_meta(data_path(TEMP_CLEAN), TEMP_COLUMNS) if args.years == None else None
+            if meta and meta.get('stats'):
+                # Statistics kept up to date by every ingest, no pass over the data
+                stats = StreamStats.from_dict(meta['stats'])
+            else:
+                stats = StreamStats.of_table(window)
+        print('Average global temp from %d to %d:' % (window['Year'][0], window['Year'][-1]),
+              round(float(stats.column_mean('Annual Avg Temp')), 5))
+        print('Average increase in global temperature per year:', round(float(stats.change('Annual Avg Temp')), 5))
+        print('OLS trend of global temperature per year:', round(float(stats.trend('Annual Avg Temp')[0]), 5))
         print('\n'+'NOTE: All temps are represented by change in global surface temperature relative to 1951-1980 average temperatures')
         logging.debug('Averages drawn...')
     if plot != None:
-        if plot == 'annual':
-            plt.plot(df['Year'], df['Annual Avg Temp'])
-            plt.xlabel('Year')
-            plt.ylabel('Annual Average Temperature')
-            plt.savefig('AnnualAvgTemp.png')
-        elif plot == '5year':
-            plt.plot(df['Year'], df['5-Year Avg Temp'], 'g-')
-            plt.xlabel('Year')
-            plt.ylabel('5-Year Avgrage Temperature')
-            plt.savefig('5-YearAvgTemp.png')
-        elif plot == 'OLS':
-            plt.plot(df['Year'], df['Annual Avg Temp'], 'o')
-            m, b = np.polyfit(df['Year'], df['Annual Avg Temp'], 1)
-            plt.xlabel('Year')
-            plt.ylabel('Annual Average Temperature')
-            plt.plot(df['Year'], m*df['Year']+b, 'r-')
-            plt.savefig('AnnualAvgTempRegression.png')
-        else:
-            plt.plot(df['Year'], df['Annual Avg Temp'])
-            plt.xlabel('Year')
-            plt.ylabel('Annual Average Temperature')
-            plt.savefig('AnnualAvgTemp.png')
-            plt.close()
-            plt.plot(df['Year'], df['5-Year Avg Temp'], 'g-')
-            plt.xlabel('Year')
-            plt.ylabel('5-Year Avgrage Temperature')
-            plt.savefig('5-YearAvgTemp.png')
-            plt.close()
-            plt.plot(df['Year'], df['Annual Avg Temp'], 'o')
-            m, b = np.polyfit(df['Year'], df['Annual Avg Temp'], 1)
-            plt.xlabel('Year')
-            plt.ylabel('Annual Average Temperature')
-            plt.plot(df['Year'], m*df['Year']+b, 'r-')
-            plt.savefig('AnnualAvgTempRegression.png')
+        names = list(TEMP_PLOTS) if plot == 'all' else [plot]
+        render_plots([(TEMP_PLOTS[name], window.columns) for name in names])
         logging.debug('Plot(s) created...')
+    instrument.finish(args)
     print('\n'+'Done!')
     logging.debug('Temp Program successfully ran!')
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    try:
+        main()
+    except BrokenPipeError:
+        closed_pipe()   # Output piped into a reader that stopped early
\ No newline at end of file
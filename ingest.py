@@ -0,0 +1,125 @@
+import os
+import hashlib
+import pandas as pd
+from datacache import CacheWriter, read_meta
+from streamstats import StreamStats
+
+### Clean store writer shared by globalTemp and seaLevels
+# Cleaned chunks go to the clean CSV and its binary cache together. The cache commit also
+# records how far the raw file was read (its size and a hash of the bytes just before that
+# point), the highest year stored and the running statistics of every column (see
+# streamstats.py). When a refreshed raw file still starts with exactly those bytes, only the
+# rows after that point have to be parsed and appended, and the statistics are carried
+# forward, so a yearly refresh costs O(new rows).
+# A raw file that was rewritten rather than extended is cleaned from scratch.
+
+TAIL_BYTES = 4096   # Bytes before the read position compared to detect a rewritten raw file
+
+
+def raw_mark(raw_file):
+    '''Returns the position reached by reading raw_file to its end, and a hash of the
+        bytes just before it'''
+    with open(raw_file, 'rb') as f:
+        size = f.seek(0, os.SEEK_END)
+        f.seek(max(0, size - TAIL_BYTES))
+        return {'offset': size, 'tail': hashlib.sha256(f.read()).hexdigest()}
+
+
+def raw_extends(raw_file, mark):
+    '''Returns True when raw_file still holds the bytes read up to mark, ending with a
+        complete line, so that everything after mark is new rows'''
+    offset = mark['offset']
+    try:
+        with open(raw_file, 'rb') as f:
+            if f.seek(0, os.SEEK_END) < offset:
+                return False
+            f.seek(max(0, offset - TAIL_BYTES))
+            tail = f.read(offset - max(0, offset - TAIL_BYTES))
+    except OSError:
+        return False
+    return tail.endswith(b'\n') and hashlib.sha256(tail).hexdigest() == mark['tail']
+
+
+def raw_changed(raw_file, csv_file, names):
+    '''Returns True when raw_file differs from the raw data last ingested into csv_file.
+        Without a record of that ingest (or without the raw file) the clean file is trusted.'''
+    meta = read_meta(csv_file, names)
+    if not meta or not meta.get('raw') or not os.path.exists(raw_file):
+        return False
+    return (os.path.getsize(raw_file) != meta['raw']['offset']
+            or not raw_extends(raw_file, meta['raw']))
+
+
+def _drop_last_row(csv_file):
+    # Truncates csv_file just before its last line
+    with open(csv_file, 'rb+') as f:
+        size = f.seek(0, os.SEEK_END)
+        f.seek(max(0, size - TAIL_BYTES))
+        tail = f.read()
+        f.truncate(size - len(tail) + tail.rfind(b'\n', 0, len(tail) - 1) + 1)
+
+
+def write_clean(chunks, raw_file, csv_file, names, dtypes, meta=None, replace_last=False):
+    '''Writes cleaned chunks (one array per column each, 'Year' first) to csv_file and its
+        binary cache. With the meta of the previous ingest the chunks are appended after
+        the stored rows, skipping any year at or below the highest year already stored.
+        With replace_last as well, the last stored row is dropped first and the chunks must
+        start with a new row for its year (e.g. a year that was still partial).
+        Otherwise the CSV is written to a .tmp file renamed over csv_file once complete, so
+        the previous clean file stays whole until then.
+
+    Returns:    rows - number of rows added'''
+    stored = meta['stats']['count'] if meta else 0
+    if meta and replace_last:
+        # The statistics of every row but the last are kept next to the full ones
+        stats = StreamStats.from_dict(meta['base'])
+        high = meta['high_water'] - 1
+        _drop_last_row(csv_file)
+    else:
+        stats = StreamStats.from_dict(meta['stats']) if meta else StreamStats(names)
+        high = meta['high_water'] if meta else None
+    base = StreamStats.from_dict(meta['base']) if meta and meta.get('base') else None
+    start = stats.count
+    cache = CacheWriter(csv_file, names, dtypes, rows=start)
+    offset = start
+    target = csv_file if start else csv_file + '.tmp'
+    try:
+        for columns in chunks:
+            if high is not None:
+                keep = columns[0] > high
+                columns = [values[keep] for values in columns]
+            if len(columns[0]) == 0:
+                continue
+            chunk = pd.DataFrame(dict(enumerate(columns)),
+                                 index=pd.RangeIndex(offset, offset + len(columns[0])))
+            chunk.to_csv(target, mode='w' if offset == 0 else 'a', header=offset == 0)
+            cache.append(*columns)
+            stats.update([values[:-1] for values in columns])
+            base = stats.copy()
+            stats.update([values[-1:] for values in columns])
+            high = int(columns[0].max()) if high is None else max(high, int(columns[0].max()))
+            offset += len(columns[0])
+    except Exception:
+        if target != csv_file and os.path.exists(target):
+            os.remove(target)
+        raise
+    if target != csv_file and os.path.exists(target):
+        os.replace(target, csv_file)
+    cache.commit({'raw': raw_mark(raw_file), 'high_water': high,
+                  'stats': stats.to_dict() if stats.count else None,
+                  'base': base.to_dict() if base else None})
+    return offset - stored
+
+
+def ingest(parse, raw_file, csv_file, names, dtypes, incremental=False):
+    '''Cleans raw_file into csv_file with parse(offset), a generator of cleaned chunks read
+        from that byte position of the raw file. With incremental=True, only the rows
+        added since the last ingest are parsed when the raw file was merely extended.
+
+    Returns:    rows - number of rows written'''
+    meta = read_meta(csv_file, names) if incremental else None
+    if meta and meta.get('raw') and meta.get('stats') and raw_extends(raw_file, meta['raw']):
+        if os.path.getsize(raw_file) == meta['raw']['offset']:
+            return 0    # Nothing was added
+        return write_clean(parse(meta['raw']['offset']), raw_file, csv_file, names, dtypes, meta)
+    return write_clean(parse(0), raw_file, csv_file, names, dtypes)
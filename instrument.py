@@ -0,0 +1,109 @@
+import os
+import json
+import time
+import logging
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+### Shared logging setup and timing spans for the command line programs
+# Every stage of a run (fetch, clean, load, merge, stats, regression, render) is wrapped in
+# a named span, which logs its duration at DEBUG level. Once enable_profile() has been
+# called, spans are also recorded with the peak traced memory reached while they were open,
+# and write_profile() saves them as a Chrome trace (open it in chrome://tracing or Perfetto).
+# Memory is traced for the whole process, so overlapping spans on two threads share peaks.
+
+_origin = time.perf_counter()
+_events = []        # Finished spans, only kept while profiling
+_open = []          # Running peak of every span currently open, while profiling
+_lock = threading.Lock()
+
+
+def setup_logging(filename):
+    '''Attaches a DEBUG file handler writing to filename to the root logger, once per file'''
+    logger = logging.getLogger()
+    logger.setLevel(logging.DEBUG)
+    path = os.path.abspath(filename)
+    if not any(getattr(handler, 'baseFilename', None) == path for handler in logger.handlers):
+        fh = logging.FileHandler(filename, 'w')
+        fh.setLevel(logging.DEBUG)
+        logger.addHandler(fh)
+    logging.getLogger('matplotlib.font_manager').disabled = True    # Disables annoying matplot messages
+
+
+def add_profile_argument(parser):
+    '''Adds the --profile argument shared by the programs, applied with apply_profile'''
+    parser.add_argument('--profile', metavar='<file>', nargs='?', const='profile.json',
+                        help='Writes a Chrome trace of the time and peak memory of every stage \
+                            to this file (profile.json if omitted) and prints a summary')
+
+
+def apply_profile(args):
+    '''Starts profiling when --profile was given'''
+    if args.profile != None:
+        enable_profile()
+
+
+def finish(args):
+    '''Writes the profile asked for by --profile, if any, and prints its summary'''
+    if args.profile != None:
+        write_profile(args.profile)
+        print('\n'.join(['\nProfile written to %s:' % args.profile] + summary()))
+
+
+def enable_profile():
+    '''Starts recording spans and tracing memory allocations'''
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def _fold_peak():
+    # Credits the peak since the last reset to every open span, then starts a new period
+    peak = tracemalloc.get_traced_memory()[1]
+    for entry in _open:
+        entry[0] = max(entry[0], peak)
+    tracemalloc.reset_peak()
+
+
+@contextmanager
+def span(name, **args):
+    '''Times the enclosed block as one named stage, args are added to the profile event'''
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        with _lock:
+            _fold_peak()
+            entry = [tracemalloc.get_traced_memory()[0]]
+            _open.append(entry)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if tracing:
+            with _lock:
+                _fold_peak()
+                _open.remove(entry)
+                _events.append({'name': name, 'ph': 'X', 'pid': os.getpid(),
+                                'tid': threading.get_ident(), 'ts': (start - _origin) * 1e6,
+                                'dur': elapsed * 1e6, 'args': dict(args, peak_bytes=entry[0])})
+        logging.debug('Span %s took %.4fs...' % (name, elapsed))
+
+
+def summary():
+    '''Returns one line per span name with its call count, total time and peak memory'''
+    totals = {}
+    for event in _events:
+        calls, dur, peak = totals.get(event['name'], (0, 0.0, 0))
+        totals[event['name']] = (calls + 1, dur + event['dur'], max(peak, event['args']['peak_bytes']))
+    return ['%-24s %4d x %10.4fs  peak %8.1f MB' % (name, calls, dur / 1e6, peak / 2**20)
+            for name, (calls, dur, peak) in totals.items()]
+
+
+def write_profile(path):
+    '''Writes the recorded spans as a Chrome trace JSON file'''
+    with _lock:
+        events = list(_events)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    os.replace(tmp, path)
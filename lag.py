@@ -0,0 +1,47 @@
+import numpy as np
+
+### Lagged cross-correlation between temperature and sea level
+# Sea level responds to temperature with a delay. The correlation of sea level with
+# temperature shifted by every lag is computed at once from one FFT product, which stays
+# O(n log n) however long (or finely resolved) the evenly spaced series are.
+
+
+def xcorr(x, y, max_lag=None):
+    '''Correlates y[t] with x[t - lag] for every lag in -max_lag..max_lag, so a positive lag
+        means y follows x. Both series must be evenly spaced and of equal length; values are
+        normalized as in the Pearson coefficient (biased estimator, divided by n).
+
+    Returns:    lags - array of lags
+                corr - array of correlations, one per lag'''
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if len(y) != n or n < 2:
+        raise ValueError('xcorr needs two series of the same length')
+    max_lag = n - 1 if max_lag is None else min(max_lag, n - 1)
+    x = x - x.mean()
+    y = y - y.mean()
+    nfft = 1 << (2*n - 1).bit_length()      # Zero padding turns the circular product linear
+    full = np.fft.irfft(np.fft.rfft(y, nfft) * np.conj(np.fft.rfft(x, nfft)), nfft)
+    lags = np.arange(-max_lag, max_lag + 1)
+    corr = full[lags % nfft] / (n * x.std() * y.std())
+    return lags, corr
+
+
+def best_lag(lags, corr, positive=True):
+    '''Returns the lag of strongest positive correlation (only lags >= 0 when positive)'''
+    keep = lags >= 0 if positive else np.ones(len(lags), dtype=bool)
+    i = np.argmax(corr[keep])
+    return int(lags[keep][i]), float(corr[keep][i])
+
+
+def lagged_pairs(x_years, x, y_years, y, lag):
+    '''Pairs every y value with the x value lag years earlier, matching on year so that
+        x may extend before y
+
+    Returns:    years - years of the y values kept
+                x - matched x values
+                y - matched y values'''
+    common, ix, iy = np.intersect1d(np.asarray(x_years) + lag, y_years, assume_unique=True,
+                                    return_indices=True)
+    return common, np.asarray(x)[ix], np.asarray(y)[iy]
@@ -0,0 +1,158 @@
+import os
+import json
+import pickle
+import hashlib
+import logging
+import argparse
+import numpy as np
+from datadir import data_path, locked, add_data_dir_argument, apply_data_dir
+
+### Disk cache of analysis results shared by the three programs
+# A result is stored under a hash of the operation, its parameters and the content of the
+# data it was computed from, so a rebuilt clean file (new content) simply stops matching
+# its old entries, which then age out. Entries are pickles in .memo/ in the data folder
+# (see datadir.py), written to a temporary file and renamed so concurrent readers never see
+# half an entry. Writes, LRU eviction and the hit/miss counters are serialized between
+# processes with a lock file (see datadir.locked). A hit refreshes the entry's mtime,
+# which is the LRU order used for eviction.
+
+MEMO_VERSION = 1                # Bump to stop matching every existing entry
+MEMO_DIR = '.memo'              # In the data folder
+MAX_BYTES = 64 * 1024 * 1024    # Total size of the entries kept on disk
+
+
+def _locked(directory):
+    # Exclusive lock on the memo directory, held across processes
+    return locked('memo', directory=directory)
+
+
+def fingerprint(columns):
+    '''Returns a hash of the names, dtypes and content of a dict of column arrays'''
+    h = hashlib.sha256()
+    for name in sorted(columns):
+        values = np.ascontiguousarray(columns[name])
+        h.update(name.encode() + values.dtype.str.encode())
+        h.update(memoryview(values).cast('B'))
+    return h.hexdigest()
+
+
+def _write(path, data):
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _read_stats(directory):
+    try:
+        with open(os.path.join(directory, 'stats.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'hits': 0, 'misses': 0}
+
+
+def _count(directory, outcome):
+    with _locked(directory):
+        stats = _read_stats(directory)
+        stats[outcome] = stats.get(outcome, 0) + 1
+        _write(os.path.join(directory, 'stats.json'), json.dumps(stats).encode())
+
+
+def _entries(directory):
+    '''Returns (mtime, size, path) of every entry, least recently used first'''
+    entries = []
+    for name in os.listdir(directory):
+        if name.endswith('.pkl'):
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue    # Evicted by another process meanwhile
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+    return sorted(entries)
+
+
+def _evict(directory, max_bytes):
+    entries = _entries(directory)
+    total = sum(size for mtime, size, path in entries)
+    for mtime, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+
+def memoize(operation, params, columns, compute, directory=None, max_bytes=MAX_BYTES):
+    '''Returns compute() for an operation run with params on the data in columns (a dict
+        of arrays), loading it from disk when the same computation was stored before.
+        compute's result must be picklable. Entries are kept in directory, MEMO_DIR in the
+        data folder by default.
+
+    Returns:    result - the stored or freshly computed result'''
+    directory = directory or data_path(MEMO_DIR)
+    h = hashlib.sha256(repr((MEMO_VERSION, operation, sorted(params.items()))).encode())
+    h.update(fingerprint(columns).encode())
+    path = os.path.join(directory, h.hexdigest() + '.pkl')
+    os.makedirs(directory, exist_ok=True)
+    try:
+        with open(path, 'rb') as f:
+            result = pickle.load(f)
+        os.utime(path)      # Most recently used
+        _count(directory, 'hits')
+        logging.debug('Memo hit for %s...' % operation)
+        return result
+    except FileNotFoundError:
+        pass
+    except Exception:
+        logging.debug('Unreadable memo entry for %s, recomputing...' % operation)
+    result = compute()
+    with _locked(directory):
+        _write(path, pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+        _evict(directory, max_bytes)
+    _count(directory, 'misses')
+    logging.debug('Memo miss for %s, result stored...' % operation)
+    return result
+
+
+def memo_stats(directory=None):
+    '''Returns the hit and miss counters plus the number and total size of stored entries'''
+    directory = directory or data_path(MEMO_DIR)
+    stats = _read_stats(directory)
+    entries = _entries(directory) if os.path.isdir(directory) else []
+    stats.update(entries=len(entries), bytes=sum(size for mtime, size, path in entries))
+    return stats
+
+
+def clear(directory=None):
+    '''Removes every entry and resets the counters'''
+    directory = directory or data_path(MEMO_DIR)
+    if not os.path.isdir(directory):
+        return
+    with _locked(directory):
+        for mtime, size, path in _entries(directory):
+            os.remove(path)
+        _write(os.path.join(directory, 'stats.json'), json.dumps({'hits': 0, 'misses': 0}).encode())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Shows the hit/miss counters of the analysis \
+        result cache kept in .memo/ in the data folder')
+    parser.add_argument('--clear', default=False, action='store_true',
+                        help='Removes every stored result and resets the counters')
+    add_data_dir_argument(parser)
+    args = parser.parse_args()
+    apply_data_dir(args)
+    if args.clear:
+        clear()
+    stats = memo_stats()
+    lookups = stats['hits'] + stats['misses']
+    print('Hits: %d, misses: %d (hit rate %.1f%%)'
+          % (stats['hits'], stats['misses'], 100.0*stats['hits']/lookups if lookups else 0))
+    print('Entries: %d, %.1f kB of %d kB' % (stats['entries'], stats['bytes']/1024, MAX_BYTES//1024))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import os
+from itertools import combinations
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+### Ranking of multi-predictor sea level models by AIC/BIC
+# The design matrix holds every candidate predictor: each temp column lagged by every offset
+# (matched on year, so lags may reach back before the sea level record) and a year trend.
+# All models are fitted on the same rows, those where every lag exists, so their criteria
+# are comparable. The centered cross products X'X, X'y and y'y are computed once; fitting a
+# subset of predictors (always with an intercept) then only solves its small block of X'X,
+# and all subsets of one size are solved together as one stacked array. Chunks of subsets
+# are spread over a process pool when there are many.
+
+MAX_TERMS = 3           # Largest number of predictors in one model
+CHUNK_MODELS = 4096     # Models solved per stacked call (and per pool task)
+
+Gram = namedtuple('Gram', ['xx', 'xy', 'yy', 'nobs'])
+Gram.__doc__ = '''Centered cross products of the predictors (xx, xy) and response (yy)'''
+
+
+def lag_name(column, lag):
+    return column if lag == 0 else '%s (lag %d)' % (column, lag)
+
+
+def design(temp, sea, columns, lags, trend=True):
+    '''Builds the candidate predictors of sea level: every temp column of columns at every lag
+        of lags (years earlier), plus Year when trend is set, on the sea level years where
+        every lagged temp exists
+
+    Returns:    names - list of predictor names
+                X - float array with one predictor per column
+                y - sea level values
+                years - years of the rows'''
+    temp_years, years = temp['Year'], sea['Year']
+    positions, keep = [], np.ones(len(years), dtype=bool)
+    for lag in lags:
+        at = np.searchsorted(temp_years, years - lag)
+        found = at < len(temp_years)
+        found[found] = temp_years[at[found]] == (years - lag)[found]
+        positions.append(np.minimum(at, len(temp_years) - 1))
+        keep &= found
+    names = [lag_name(column, lag) for column in columns for lag in lags]
+    X = [temp[column][at[keep]] for column in columns for at in positions]
+    if trend:
+        names.append('Year')
+        X.append(years[keep])
+    return names, np.column_stack(X).astype(float), sea['Sea Level'][keep].astype(float), years[keep]
+
+
+def gram(X, y):
+    '''Returns the Gram of X and y, centered so that every fit has an intercept'''
+    X = X - X.mean(axis=0)
+    y = y - y.mean()
+    return Gram(X.T @ X, X.T @ y, y @ y, len(y))
+
+
+def subset_ssr(g, index):
+    '''Returns the residual sum of squares of the fit on every subset of predictors given
+        by the rows of index (an (models, terms) int array), from the Gram alone'''
+    xx = g.xx[index[:, :, None], index[:, None, :]]
+    xy = g.xy[index]
+    try:
+        params = np.linalg.solve(xx, xy[:, :, None])[:, :, 0]
+    except np.linalg.LinAlgError:      # Collinear subset somewhere in the chunk
+        params = np.einsum('mij,mj->mi', np.linalg.pinv(xx), xy)
+    return g.yy - np.einsum('mi,mi->m', params, xy)
+
+
+def candidates(predictors, max_terms=MAX_TERMS):
+    '''Yields int arrays of the subsets of range(predictors), at most CHUNK_MODELS subsets of
+        one size per array, for every size from 1 to max_terms'''
+    for terms in range(1, min(max_terms, predictors) + 1):
+        subsets = np.array(list(combinations(range(predictors), terms)))
+        for start in range(0, len(subsets), CHUNK_MODELS):
+            yield subsets[start:start + CHUNK_MODELS]
+
+
+def search(names, X, y, max_terms=MAX_TERMS, criterion='bic', processes=None):
+    '''Fits sea level on every subset of at most max_terms predictors and ranks the models
+        by criterion ('aic' or 'bic', lowest first). Chunks are solved in a pool of at most
+        processes workers (one per CPU by default) when there is more than one.
+
+    Returns:    ranked - dataframe of Predictors, Terms, R-squared, AIC and BIC, one row
+                per model, best first'''
+    if max_terms < 1 or len(y) < min(max_terms, len(names)) + 2:
+        raise ValueError('max_terms must be at least 1, with more rows than parameters')
+    g = gram(X, y)
+    chunks = list(candidates(len(names), max_terms))
+    if len(chunks) > 1 and processes != 1:
+        workers = min(len(chunks), processes or os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            ssr = list(pool.map(subset_ssr, [g] * len(chunks), chunks))
+    else:
+        ssr = [subset_ssr(g, index) for index in chunks]
+    n = g.nobs
+    terms = np.concatenate([np.full(len(index), index.shape[1]) for index in chunks])
+    ssr = np.maximum(np.concatenate(ssr), 0)     # Exact fits may come out a hair below 0
+    k = terms + 1       # Parameters including the intercept
+    llf = -n/2 * (np.log(2*np.pi*ssr/n) + 1)
+    ranked = pd.DataFrame({
+        'Predictors': [' + '.join(names[i] for i in subset) for index in chunks for subset in index],
+        'Terms': terms, 'R-squared': 1 - ssr/g.yy, 'AIC': -2*llf + 2*k, 'BIC': -2*llf + np.log(n)*k})
+    return ranked.sort_values(criterion.upper(), kind='stable').reset_index(drop=True)
@@ -0,0 +1,123 @@
+import os
+import sys
+import json
+import math
+import argparse
+import numpy as np
+from records import bounds
+
+### Row selection and streamed output for the print and sort modes
+# Rows are picked as an index array (year range, then sort, then top N / page) and the
+# table is written out block by block, so no more than BLOCK_ROWS formatted rows are ever
+# held in memory and the output can be piped into head, grep or another program.
+
+FORMATS = ['table', 'csv', 'jsonl']
+BLOCK_ROWS = 65536      # Rows formatted per write
+
+
+def parse_years(text):
+    '''argparse type for a START:END year range, either end may be left out (1950:, :2000)'''
+    try:
+        start, end = text.split(':') if ':' in text else (text, text)
+        return (int(start) if start else None, int(end) if end else None)
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected START:END years, got %r' % text)
+
+
+def _count(lowest):
+    # argparse type for an integer of at least lowest
+    def parse(text):
+        try:
+            value = int(text)
+        except ValueError:
+            value = None
+        if value is None or value < lowest:
+            raise argparse.ArgumentTypeError('expected an integer of at least %d, got %r' % (lowest, text))
+        return value
+    return parse
+
+
+def add_output_arguments(parser):
+    '''Adds the row selection and output format arguments shared by the print modes'''
+    parser.add_argument('--top', metavar='<N>', type=_count(0), dest='top',
+                        help='Only displays the first N rows (of the sorted order when sorting)')
+    parser.add_argument('--years', metavar='<START:END>', type=parse_years, dest='years',
+                        help='Only uses the years in this inclusive range, e.g. 1950:2000 or 1990:, \
+                            for every operation (display, averages, regressions and plots)')
+    parser.add_argument('--page', metavar='<page>', type=_count(1), default=1, dest='page',
+                        help='Page of --page-size rows to display (default 1)')
+    parser.add_argument('--page-size', metavar='<rows>', type=_count(0), default=0, dest='page_size',
+                        help='Rows per page, 0 displays every row (default 0)')
+    parser.add_argument('--format', choices=FORMATS, default='table', dest='format',
+                        help='Output format of the displayed rows: a fixed-width "table", "csv" \
+                            or "jsonl" (one JSON object per line). Default table')
+
+
+def select_rows(table, years=None, sort=None, top=None, page=1, page_size=0):
+    '''Returns the index of the rows to display: rows in the years range, ordered by the
+        sort column (highest first) when given, then cut to the top rows and the page.
+        With top, only the top rows are sorted (argpartition) instead of the whole table.
+        Years are found by binary search of the ascending Year column.'''
+    index = np.arange(*bounds(table['Year'], *years)) if years is not None else np.arange(len(table))
+    if sort is not None:
+        values = -table[sort][index]       # Ascending on the negated values, NaN last
+        if top is not None and 0 < top < len(index):
+            part = np.argpartition(values, top - 1)[:top]
+            index = index[part[np.argsort(values[part], kind='stable')]]
+        else:
+            index = index[np.argsort(values, kind='stable')]
+    if top is not None:
+        index = index[:max(top, 0)]
+    if page_size > 0:
+        index = index[(page - 1) * page_size:page * page_size]
+    return index
+
+
+def closed_pipe():
+    '''Points stdout at devnull once the reader closed the pipe (e.g. head), so later
+        prints and the interpreter's final flush go nowhere instead of raising'''
+    os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+
+
+def _format_value(value):
+    return '%d' % value if isinstance(value, int) else '%.6g' % value
+
+
+def _json_value(value):
+    # NaN and infinities are not valid JSON, missing values are written as null
+    return None if isinstance(value, float) and not math.isfinite(value) else value
+
+
+def _block_lines(names, columns, labels, fmt, widths):
+    rows = zip(*[values.tolist() for values in columns])
+    if fmt == 'csv':
+        return [','.join(map(str, row)) for row in rows]
+    if fmt == 'jsonl':
+        return [json.dumps(dict(zip(names, map(_json_value, row))), allow_nan=False) for row in rows]
+    return [''.join('%*s' % (width, text) for width, text in
+                    zip(widths, [str(label)] + [_format_value(value) for value in row]))
+            for label, row in zip(labels.tolist(), rows)]
+
+
+def write_rows(table, index, fmt='table', out=None):
+    '''Streams the rows of table selected by index to out (stdout by default) in one of
+        FORMATS. The table format keeps the row number of the clean data on the left.
+
+    Returns:    written - False if the reader closed the pipe before the end'''
+    out = out or sys.stdout
+    names = table.names
+    widths = [len(str(len(table)))] + [max(len(name), 10) + 2 for name in names]
+    try:
+        if fmt == 'csv':
+            out.write(','.join(names) + '\n')
+        elif fmt == 'table':
+            out.write(''.join('%*s' % item for item in zip(widths, [''] + names)) + '\n')
+        for start in range(0, len(index), BLOCK_ROWS):
+            rows = index[start:start + BLOCK_ROWS]
+            lines = _block_lines(names, [table[name][rows] for name in names], rows, fmt, widths)
+            out.write('\n'.join(lines) + '\n')
+        out.flush()
+        return True
+    except BrokenPipeError:
+        closed_pipe()
+        return False
@@ -0,0 +1,156 @@
+import os
+import json
+import hashlib
+import logging
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import instrument
+from datadir import data_path, locked
+from decimate import decimate
+
+### Declarative, headless plot rendering shared by the three programs
+# A plot is described by a PlotSpec holding one or more Series of named columns. Plots are
+# rendered with the non-interactive Agg backend, in a process pool when there are several,
+# and a plot is skipped when its spec and the data it draws are unchanged since the last
+# render (digests are kept in a .plots.json manifest next to the images). Relative outputs
+# are written to the data folder (see datadir.py), so parallel jobs share them, and the
+# manifests are updated under a lock. Long series are
+# decimated to what the figure can show before drawing (see decimate.py), while the OLS
+# line is fitted on the full data.
+
+RENDER_VERSION = 2      # Bump to force every plot to be rendered again
+
+Series = namedtuple('Series', ['x', 'y', 'style', 'label'], defaults=['-', None])
+PlotSpec = namedtuple('PlotSpec', ['output', 'series', 'xlabel', 'ylabel', 'title', 'legend', 'fit'],
+                      defaults=[None, None, None])
+PlotSpec.__doc__ = '''A figure saved to output. fit is an optional (x, y) pair of columns whose
+    OLS line is drawn in red, legend an optional legend location.'''
+
+
+def spec_columns(spec):
+    '''Returns the names of the columns a spec draws, in a stable order'''
+    names = []
+    for series in spec.series:
+        names += [series.x, series.y]
+    if spec.fit:
+        names += list(spec.fit)
+    return sorted(set(names))
+
+
+def digest(spec, columns):
+    '''Returns a hash of the spec and of the data it draws'''
+    h = hashlib.sha256(repr((RENDER_VERSION, tuple(spec))).encode())
+    for name in spec_columns(spec):
+        values = np.ascontiguousarray(columns[name])
+        h.update(name.encode() + values.dtype.str.encode())
+        h.update(memoryview(values).cast('B'))
+    return h.hexdigest()
+
+
+def prepare(spec, columns):
+    '''Returns what render draws for a spec: the (x, y) points of every series, decimated
+        to what the figure can show, and the OLS line fitted on the full data as
+        (xmin, xmax, slope, intercept), or None without a fit'''
+    points = [decimate(columns[series.x], columns[series.y],
+                       line='-' in series.style or ':' in series.style)
+              for series in spec.series]
+    line = None
+    if spec.fit:
+        x, y = columns[spec.fit[0]], columns[spec.fit[1]]
+        m, b = np.polyfit(x, y, 1)
+        line = (np.min(x), np.max(x), m, b)
+    return points, line
+
+
+def render(spec, columns, prepared=None):
+    '''Draws a single spec to its output file with the Agg backend, from the columns or
+        from what prepare() returned for them
+
+    Returns:    output - the file written'''
+    points, line = prepared or prepare(spec, columns)
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots()
+    for series, (x, y) in zip(spec.series, points):
+        ax.plot(x, y, series.style, label=series.label)
+    if line:
+        x = np.array(line[:2])
+        ax.plot(x, line[2]*x+line[3], 'r-')
+    ax.set_xlabel(spec.xlabel)
+    ax.set_ylabel(spec.ylabel)
+    if spec.title:
+        ax.set_title(spec.title)
+    if spec.legend:
+        ax.legend(loc=spec.legend)
+    root, ext = os.path.splitext(spec.output)
+    tmp = '%s.%d.tmp%s' % (root, os.getpid(), ext)   # Keeps the format matplotlib infers from the extension
+    os.makedirs(os.path.dirname(os.path.abspath(spec.output)), exist_ok=True)
+    fig.savefig(tmp)
+    plt.close(fig)
+    os.replace(tmp, spec.output)
+    return spec.output
+
+
+def _manifest_path(output):
+    return os.path.join(os.path.dirname(os.path.abspath(output)), '.plots.json')
+
+
+def _read_manifest(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def render_plots(jobs, processes=None):
+    '''Renders a batch of plots, each job being a (spec, columns) pair where columns maps
+        column names to arrays. Relative outputs are written to the data folder. Up-to-date
+        plots are skipped and the rest are rendered in a process pool of at most processes
+        workers (one per CPU by default).
+
+    Returns:    rendered - list of the output files that were (re)drawn, as named by their specs'''
+    with instrument.span('render', plots=len(jobs)):
+        return _render_jobs(jobs, processes)
+
+
+def _render_jobs(jobs, processes):
+    manifests = {}
+    stale = []
+    outputs = []    # As named by the specs
+    for spec, columns in jobs:
+        key = digest(spec, columns)
+        output = spec.output
+        spec = spec._replace(output=data_path(output))
+        path = _manifest_path(spec.output)
+        manifest = manifests.setdefault(path, _read_manifest(path))
+        if os.path.exists(spec.output) and manifest.get(os.path.basename(spec.output)) == key:
+            logging.debug('%s is up to date, skipping...' % spec.output)
+            continue
+        # Workers only receive the decimated points and the fitted line
+        stale.append((spec, prepare(spec, columns), key))
+        outputs.append(output)
+
+    if len(stale) > 1 and processes != 1:
+        workers = min(len(stale), processes or os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(render, [s for s, p, k in stale], [None] * len(stale),
+                          [p for s, p, k in stale]))
+    else:
+        for spec, prepared, key in stale:
+            render(spec, None, prepared)
+
+    # Other jobs may have rendered plots meanwhile, so each manifest is read again
+    with locked('plots'):
+        for path in set(_manifest_path(spec.output) for spec, prepared, key in stale):
+            manifest = _read_manifest(path)
+            for spec, prepared, key in stale:
+                if _manifest_path(spec.output) == path:
+                    manifest[os.path.basename(spec.output)] = key
+            tmp = '%s.%d.tmp' % (path, os.getpid())
+            with open(tmp, 'w') as f:
+                json.dump(manifest, f)
+            os.replace(tmp, path)
+    return outputs
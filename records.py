@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+### Typed container shared by globalTemp, seaLevels and TempVsSeaLevel
+def bounds(values, low=None, high=None):
+    '''Returns the (start, stop) positions of the values within [low, high] (either end may
+        be None) in an ascending array, by binary search'''
+    start = 0 if low is None else int(np.searchsorted(values, low, 'left'))
+    stop = len(values) if high is None else int(np.searchsorted(values, high, 'right'))
+    return start, max(start, stop)
+
+
+class DataTable:
+    '''A clean dataset held as contiguous typed column arrays, 'Year' first (int32) followed
+        by float64 value columns. Columns may be read-only memory maps of the binary cache,
+        so the table never modifies them in place.'''
+
+    def __init__(self, columns):
+        self.columns = {name: np.ascontiguousarray(values) for name, values in columns.items()}
+
+    def __len__(self):
+        return len(self.columns['Year'])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    @property
+    def names(self):
+        return list(self.columns)
+
+    @classmethod
+    def from_frame(cls, df, dtypes=None):
+        '''Builds a table from a dataframe, optionally casting columns to the given dtypes'''
+        dtypes = dtypes or [df[name].dtype for name in df.columns]
+        return cls({name: df[name].to_numpy(dtype=dtype) for name, dtype in zip(df.columns, dtypes)})
+
+    def take(self, index):
+        '''Returns a new table holding the rows selected by an index array or slice'''
+        return DataTable({name: values[index] for name, values in self.columns.items()})
+
+    def between(self, column, low=None, high=None):
+        '''Returns the rows whose value of an ascending column lies within [low, high], as
+            a table of views (no copy) found by binary search, so the cost does not depend on
+            the size of the table'''
+        return self.take(slice(*bounds(self[column], low, high)))
+
+    def years(self, years):
+        '''Returns the rows in a (start, end) range of years as given by --years (the whole
+            table for None). Clean tables are stored in ascending year order.'''
+        return self if years is None else self.between('Year', *years)
+
+    def frame(self):
+        '''Returns a pandas dataframe of the table (copies the columns)'''
+        return pd.DataFrame(self.columns)
+
+    def legacy(self):
+        '''Compatibility accessor for the original (df, data) tuple, where data is an object
+            array with Python int years and float values
+
+        Returns:    df - A pandas dataframe of the table
+                    data - A numpy object array of the table'''
+        df = self.frame()
+        data = df.values.astype('object')
+        data[:, 0] = data[:, 0].astype('int')       # Insures correct datatype for year
+        return df, data
@@ -0,0 +1,111 @@
+import numpy as np
+
+### Small closed-form least squares engine used in place of statsmodels for the -r path
+# Fits go through a QR decomposition of the design matrix, which is cheap and numerically
+# stable for the handful of predictors used here, and needs nothing beyond NumPy.
+
+class OLSResult:
+    '''Result of fit_ols. Array attributes follow the order of names (the 'const' term first
+        when an intercept was fitted).'''
+
+    def __init__(self, names, yname, params, bse, resid, nobs, intercept, ssr, tss):
+        self.names = names
+        self.yname = yname
+        self.params = params
+        self.bse = bse
+        self.tvalues = params/bse
+        self.resid = resid
+        self.nobs = nobs
+        self.intercept = intercept
+        self.df_model = len(params) - intercept
+        self.df_resid = nobs - len(params)
+        self.ssr = ssr
+        self.rsquared = 1 - ssr/tss     # Uncentered when there is no intercept, as statsmodels
+        self.rsquared_adj = 1 - (nobs - intercept)/self.df_resid * (1 - self.rsquared)
+        self.fvalue = (tss - ssr)/self.df_model/(ssr/self.df_resid) if self.df_model else np.nan
+        self.llf = -nobs/2 * (np.log(2*np.pi*ssr/nobs) + 1)
+        self.aic = -2*self.llf + 2*len(params)
+        self.bic = -2*self.llf + np.log(nobs)*len(params)
+        # Residual diagnostics
+        centered = resid - resid.mean()
+        m2 = (centered**2).mean()
+        self.durbin_watson = np.sum(np.diff(resid)**2)/ssr
+        self.skew = (centered**3).mean()/m2**1.5
+        self.kurtosis = (centered**4).mean()/m2**2
+        self.jarque_bera = nobs/6 * (self.skew**2 + (self.kurtosis - 3)**2/4)
+
+    def summary(self):
+        '''Returns a plain text report of the fit'''
+        r2 = 'R-squared:' if self.intercept else 'R-squared (uncentered):'
+        rows = [('Dep. Variable:', self.yname, r2, '%.3f' % self.rsquared),
+                ('No. Observations:', '%d' % self.nobs, 'Adj. ' + r2, '%.3f' % self.rsquared_adj),
+                ('Df Residuals:', '%d' % self.df_resid, 'F-statistic:', '%.4g' % self.fvalue),
+                ('Df Model:', '%d' % self.df_model, 'Log-Likelihood:', '%.5g' % self.llf),
+                ('Intercept:', 'yes' if self.intercept else 'no', 'AIC / BIC:',
+                 '%.4g / %.4g' % (self.aic, self.bic))]
+        lines = ['OLS Regression Results'.center(78), '=' * 78]
+        lines += ['%-18s%16s    %-29s%11s' % row for row in rows]
+        lines += ['=' * 78, '%-30s%16s%16s%16s' % ('', 'coef', 'std err', 't'), '-' * 78]
+        lines += ['%-30s%16.4f%16.3f%16.3f' % row
+                  for row in zip(self.names, self.params, self.bse, self.tvalues)]
+        lines += ['=' * 78,
+                  '%-18s%16.3f    %-29s%11.3f' % ('Durbin-Watson:', self.durbin_watson,
+                                                  'Jarque-Bera (JB):', self.jarque_bera),
+                  '%-18s%16.3f    %-29s%11.3f' % ('Skew:', self.skew, 'Kurtosis:', self.kurtosis),
+                  '=' * 78]
+        return '\n'.join(lines)
+
+
+def fit_ols(y, x, intercept=True, names=None, yname='y'):
+    '''Fits y on the predictor(s) x by ordinary least squares. x may be a single 1-D array
+        or a 2-D array with one predictor per column.
+
+    Returns:    result - an OLSResult with coefficients, standard errors, R² and diagnostics'''
+    y = np.asarray(y, dtype=float)
+    X = np.asarray(x, dtype=float)
+    if X.ndim == 1:
+        X = X[:, None]
+    names = list(names) if names is not None else ['x%d' % (i + 1) for i in range(X.shape[1])]
+    if intercept:
+        X = np.column_stack([np.ones(len(y)), X])
+        names = ['const'] + names
+    q, r = np.linalg.qr(X)
+    params = np.linalg.solve(r, q.T @ y)
+    resid = y - X @ params
+    ssr = resid @ resid
+    r_inv = np.linalg.inv(r)
+    cov = ssr/(len(y) - X.shape[1]) * (r_inv @ r_inv.T)
+    tss = np.sum((y - y.mean())**2) if intercept else y @ y
+    return OLSResult(names, yname, params, np.sqrt(np.diag(cov)), resid, len(y), int(intercept), ssr, tss)
+
+
+def _window_sums(values, window):
+    '''Returns the sum of every run of window consecutive values, from one prefix sum'''
+    prefix = np.concatenate([[0.0], np.cumsum(values)])
+    return prefix[window:] - prefix[:-window]
+
+
+def rolling_ols(y, x, window):
+    '''Fits y = intercept + slope*x over every sliding window of consecutive rows. Each fit
+        comes from prefix sums of x, y, x², y² and xy, so the whole series costs O(n)
+        rather than one refit per window.
+
+    Returns:    slope - array of n-window+1 slopes, one per window start
+                intercept - array of intercepts
+                rsquared - array of R² values'''
+    y = np.asarray(y, dtype=float)
+    x = np.asarray(x, dtype=float)
+    if not 2 < window <= len(y):
+        raise ValueError('window must be between 3 and the number of rows')
+    # Centering on the overall means keeps the running sums small and limits cancellation
+    xmean, ymean = x.mean(), y.mean()
+    x, y = x - xmean, y - ymean
+    sx, sy = _window_sums(x, window), _window_sums(y, window)
+    sxx = _window_sums(x*x, window) - sx*sx/window
+    syy = _window_sums(y*y, window) - sy*sy/window
+    sxy = _window_sums(x*y, window) - sx*sy/window
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = sxy/sxx
+        rsquared = sxy*sxy/(sxx*syy)
+    intercept = (sy - slope*sx)/window + ymean - slope*xmean
+    return slope, intercept, rsquared
@@ -1,93 +1,171 @@
 import os
-from numpy.lib.function_base import average
-import requests
 import logging
 import argparse
 import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
+from fetch import fetch, FetchError
+import instrument
+from datacache import read_cache, read_meta, write_cache
+from ingest import ingest, raw_changed
+from records import DataTable
+from datadir import data_path, locked, add_data_dir_argument, apply_data_dir
+from streamstats import StreamStats
+from plots import PlotSpec, Series, render_plots
+from output import add_output_arguments, select_rows, write_rows, closed_pipe
 
-### Adds a log handler for bugs
-logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
-fh = logging.FileHandler('logfile_seaLevels.log', 'w')
-fh.setLevel(logging.DEBUG)
-logger.addHandler(fh)
-logging.getLogger('matplotlib.font_manager').disabled = True # Disables annoying matplot messages
+### Adds a log handler for bugs, installed by main() so importing the module has no side effects
+def setup_logging():
+    '''Attaches the DEBUG file handler for this program to the root logger'''
+    instrument.setup_logging('logfile_seaLevels.log')
+
+CHUNK_ROWS = 200000     # Raw rows parsed per chunk while cleaning, keeps memory bounded
+SEA_COLUMNS = ['Year', 'Sea Level', 'Uncertainty']
+SEA_DTYPES = ['int32', 'float64', 'float64']
+SEA_RAW, SEA_CLEAN = 'SeaLevelData.csv', 'SeaLevelClean.csv'   # In the data folder, see datadir.py
+
+### Plots available through -pl, 'all' renders every one of them
+SEA_PLOTS = {
+    'annual': PlotSpec('AnnualSeaLevel.png', [Series('Year', 'Sea Level')],
+                       'Year', 'Sea Level (GMSL)'),
+    'uncert': PlotSpec('GMSL_Uncertainty.png', [Series('Year', 'Uncertainty', 'g-')],
+                       'Year', 'GMSL Uncertainty'),
+    'OLS': PlotSpec('AnnualSeaLevelRegression.png', [Series('Year', 'Sea Level', 'o')],
+                    'Year', 'Sea Level (GMSL)', fit=('Year', 'Sea Level')),
+}
 
 ### Defining Functions
 # Pulls temp data
 def get_data_level():
     '''Queries the url to generate a CSV file with Global temp data. CSV
-        will be stored in folder used to run file
+        will be stored in folder used to run file. The download is streamed, resumable and
+        conditional, so an unchanged source is not downloaded again (see fetch.fetch).
 
-    Returns: None, but creates SeaLevelData.csv'''
+    Returns: True if SeaLevelData.csv was (re)written, False if the source was unchanged
+    Raises:  FetchError if the source could not be queried'''
     url = 'https://datahub.io/core/sea-level-rise/r/csiro_recons_gmsl_yr_2015.csv'
-    response = requests.get(url, allow_redirects=True)
-    if response:
+    try:
+        with instrument.span('fetch sea'):
+            changed = fetch(url, data_path(SEA_RAW))
         logging.debug('Successfully connected to data source, grabbing Sea Data...')
-        open('SeaLevelData.csv', 'wb').write(response.content)
-    else:
+        return changed
+    except FetchError:
         logging.debug('Could not connect to data source...')
-        logging.debug('Exiting program')
-        print('Error querying data')
-        quit()
+        raise
+
+# Streams cleaned sea level rows out of the raw file
+def iter_clean_level(file=None, chunksize=CHUNK_ROWS, offset=0):
+    '''Parses the raw SeaLevelData file in fixed-size chunks. Year is cut from the date
+        prefix and the level columns are converted with vectorized operations, so only
+        one chunk is ever held in memory. A non-zero offset starts parsing at that byte
+        (the start of a row past the header).
+
+    Yields:     years - int array of years in the chunk
+                level - float array of GMSL values
+                uncert - float array of GMSL uncertainty values'''
+    with open(file or data_path(SEA_RAW), 'rb') as f:
+        f.seek(offset)
+        reader = pd.read_csv(f, header=None, skiprows=0 if offset else 1, usecols=[0, 1, 2],
+                             dtype=str, chunksize=chunksize)
+        for chunk in reader:
+            years = chunk[0].str.partition('-')[0].to_numpy(dtype=int)   # Years of any width
+            yield years, chunk[1].to_numpy(dtype=float), chunk[2].to_numpy(dtype=float)
 
 # Cleans temp Data
-def clean_data_level(file='SeaLevelData.csv'):
+def clean_data_level(file=None, chunksize=CHUNK_ROWS, incremental=False):
     '''Processes raw SeaLevelData file. Removes Uncertainty column, and cleans up year entry.
+        The raw file is streamed chunk by chunk (see iter_clean_level), and each cleaned
+        chunk is appended to the output as soon as it is parsed. The same chunks are
+        written to the typed binary cache read by load_level. With incremental=True and a
+        raw file that only grew since it was last cleaned, just the new years are parsed
+        and appended (see ingest.ingest).
 
-    Returns: None, but creates SeaLevelClean.csv'''
+    Returns: rows - number of rows written to SeaLevelClean.csv and SeaLevelClean.cache/
+    Raises:  ValueError if the raw file could not be cleaned'''
+    file = file or data_path(SEA_RAW)
     try:
-        data = np.loadtxt(file, delimiter=',', dtype=str)
-        rows = []
-        for i in range(1,len(data)):
-            row = [int(data[i][0][0:4]), float(data[i][1]), float(data[i][2])]
-            rows.append(row)
-        clean_data = np.array(rows, dtype='O')
-        pd.DataFrame(clean_data).to_csv('SeaLevelClean.csv')
+        with instrument.span('clean sea', incremental=incremental):
+            rows = ingest(lambda offset: iter_clean_level(file, chunksize, offset), file,
+                          data_path(SEA_CLEAN), SEA_COLUMNS, SEA_DTYPES, incremental)
         logging.debug(
-            'Sea Data Sucessfully Cleaned...')
-    except:
+            'Sea Data Sucessfully Cleaned, %d rows written...' % rows)
+        return rows
+    except Exception as error:
         logging.debug('Error cleaning data, check raw data file...')
-        print('Error Cleaning Data')
-        quit()
+        if os.path.exists(data_path(SEA_CLEAN)):
+            os.remove(data_path(SEA_CLEAN))       # Never leave a half written clean file behind
+        raise ValueError('Error cleaning SeaLevelData.csv') from error
 
 
 # Checks for data files in local folder, and generates them if unavailable
-def get_sea_csv():
-    '''Builds both the clean and raw CSV files for use in the module'''
-    if os.path.exists('SeaLevelClean.csv') == False:
+def get_sea_csv(refresh=False):
+    '''Builds both the clean and raw CSV files for use in the module. With refresh=True the
+        source is queried again, and the clean file is only updated if the raw data changed.
+        A raw file that grew since it was cleaned only has its new years parsed and appended.
+        Concurrent callers build the files once: the others wait for the first one and then
+        find its files up to date (see datadir.locked).'''
+    with locked(SEA_CLEAN):
+        _build_sea(refresh)
+
+def _build_sea(refresh):
+    if refresh == True and get_data_level() == True:
+        logging.debug('Sea source changed, updating clean file...')
+        clean_data_level(data_path(SEA_RAW), incremental=True)
+    elif os.path.exists(data_path(SEA_CLEAN)) == False:
         # Searches for the clean CSV, and if it does not exist attempts to clean the raw CSV
         logging.debug('No clean Sea Data file found locally, creating clean file...')
-        if os.path.exists('SeaLevelData.csv') == False:
+        if os.path.exists(data_path(SEA_RAW)) == False:
             # Searches for the raw CSV, and if it does not exist attempts to query data
             logging.debug(
                 'No Sea Data file found locally, querying data file from internet...')
             get_data_level()
-            clean_data_level('SeaLevelData.csv')  # Cleans raw CSV
+            clean_data_level(data_path(SEA_RAW))  # Cleans raw CSV
         else:
-            clean_data_level('SeaLevelData.csv')  # Cleans raw CSV
+            clean_data_level(data_path(SEA_RAW))  # Cleans raw CSV
         logging.debug('Clean Sea Data generated...')
+    elif raw_changed(data_path(SEA_RAW), data_path(SEA_CLEAN), SEA_COLUMNS):
+        # The raw file was replaced since it was cleaned, only new years are parsed if it grew
+        logging.debug('Sea Data file changed since cleaning, updating clean file...')
+        clean_data_level(data_path(SEA_RAW), incremental=True)
     else:
         logging.debug('Clean Sea Data found...')
 
 
-### Creates local data array and dataframe for use in arg parse
+# Loads the clean sea level data into typed column arrays
+def load_level():
+    '''Returns the clean sea level data as a DataTable of contiguous typed columns (int32
+        Year, float64 values). Opens the memory-mapped binary cache when it is current, and
+        only parses the CSV (rebuilding the cache) when the cache is missing or stale.
+
+    Returns:    table - A DataTable of the clean CSV data'''
+    with instrument.span('load sea'):
+        with locked(SEA_CLEAN, shared=True):
+            columns = read_cache(data_path(SEA_CLEAN), SEA_COLUMNS)
+        if columns is None:
+            # Rebuilt under the exclusive lock, once: later jobs find the cache written
+            with locked(SEA_CLEAN):
+                columns = read_cache(data_path(SEA_CLEAN), SEA_COLUMNS)
+                if columns is None:
+                    logging.debug('No current Sea cache, reading clean CSV...')
+                    df = pd.read_csv(data_path(SEA_CLEAN), index_col=0)  # Creates dataframe from Clean CSV
+                    df.columns = SEA_COLUMNS
+                    columns = DataTable.from_frame(df, SEA_DTYPES).columns
+                    write_cache(data_path(SEA_CLEAN), columns)
+        logging.debug('Sea DataTable created...')
+        return DataTable(columns)
+
+# Creates local data array and dataframe for use in arg parse
 def create_sea_local():
     '''Returns a dataframe and numpy array of the clean sea level CSV and ensures 
-        that both are in proper format to be processed by command line arguments
-        
+        that both are in proper format to be processed by command line arguments.
+        Compatibility accessor over load_level, new code should use the typed table.
+
     Returns:    df - A pandas dataframe of the clean CSV data
                 data - A numpy array of the clean CSV data
     '''
-    df = pd.read_csv('SeaLevelClean.csv', index_col=0)     # Creates dataframe from Clean CSV
-    df.columns = ['Year', 'Sea Level', 'Uncertainty']
-    data = df.values.astype('object')    # Creates np array from Clean CSV
-    data[:, 0] = data[:, 0].astype('int')       # Insures correct datatype for year
+    df, data = load_level().legacy()
     logging.debug('Sea Dataframe and numpy array created...')
     return df, data
 
+
 def main():
     ### Configuring arg parser (Adding Command line arguments)
     parser = argparse.ArgumentParser(
@@ -115,67 +193,71 @@ def main():
                         action='store_true', help='Displays the average global mean sea level and \
                             average change over the timeframe')
 
+    parser.add_argument('-u', '--update', default=False, dest='update',
+                        action='store_true', help='Checks the data source for a newer file \
+                            (a single round trip if unchanged) and recleans it if needed')
+
+    add_output_arguments(parser)
+
+    instrument.add_profile_argument(parser)
+
+    # Folder of the data files, e.g. on a volume shared by parallel jobs
+    add_data_dir_argument(parser)
+
     args = parser.parse_args()
+    setup_logging()
+    apply_data_dir(args)
+    instrument.apply_profile(args)
     ave = args.ave
     plot = args.plot
     display = args.display
     sortType = args.sortlevel
 
-    get_sea_csv()
-    df, data = create_sea_local()
-    if sortType == True:
-        print(df.sort_values(by=['Sea Level'],
-                             ascending=False).to_string())
-        logging.debug('Data sorted by sea level and displayed...')
-    elif display == True:
-        print(df.to_string())
+    try:
+        get_sea_csv(refresh=args.update)
+    except FetchError:
+        print('Error querying data')
+        raise SystemExit(1)
+    except ValueError:
+        print('Error Cleaning Data')
+        raise SystemExit(1)
+    table = load_level()
+    # Every operation below only touches the --years rows, a slice found by binary search
+    window = table.years(args.years)
+    if len(window) == 0:
+        print('No sea level data in the selected years')
+        raise SystemExit(1)
+    if sortType == True or display == True:
+        # Streamed block by block, only the selected rows are ever formatted
+        rows = select_rows(table, args.years, 'Sea Level' if sortType else None,
+                           args.top, args.page, args.page_size)
+        write_rows(table, rows, args.format)
         logging.debug('Data displayed...')
 
     if ave == True:
-        print('Average sea level from 1880 to 2013:',
-              round(data.mean(axis=0)[1], 5))
-        print('Average increase in sea level per year:',
-              round((data[-1][1]-data[0][1])/len(data), 5))
+        with instrument.span('stats'):
+            meta = read_meta(data_path(SEA_CLEAN), SEA_COLUMNS) if args.years == None else None
+            if meta and meta.get('stats'):
+                # Statistics kept up to date by every ingest, no pass over the data
+                stats = StreamStats.from_dict(meta['stats'])
+            else:
+                stats = StreamStats.of_table(window)
+        print('Average sea level from %d to %d:' % (window['Year'][0], window['Year'][-1]),
+              round(float(stats.column_mean('Sea Level')), 5))
+        print('Average increase in sea level per year:', round(float(stats.change('Sea Level')), 5))
+        print('OLS trend of sea level per year:', round(float(stats.trend('Sea Level')[0]), 5))
         print('\n'+'NOTE: Sea levels are represented by Reconstructed Global Mean Sea Level in mm (GMSL)')
         logging.debug('Averages drawn...')
     if plot != None:
-        if plot == 'annual':
-            plt.plot(df['Year'], df['Sea Level'])
-            plt.xlabel('Year')
-            plt.ylabel('Sea Level (GMSL)')
-            plt.savefig('AnnualSeaLevel.png')
-        elif plot == 'uncert':
-            plt.plot(df['Year'], df['Uncertainty'], 'g-')
-            plt.xlabel('Year')
-            plt.ylabel('GMSL Uncertainty')
-            plt.savefig('GMSL_Uncertainty.png')
-        elif plot == 'OLS':
-            plt.plot(df['Year'], df['Sea Level'], 'o')
-            m, b = np.polyfit(df['Year'], df['Sea Level'], 1)
-            plt.xlabel('Year')
-            plt.ylabel('Sea Level (GMSL)')
-            plt.plot(df['Year'], m*df['Year']+b, 'r-')
-            plt.savefig('AnnualSeaLevelRegression.png')
-        else:
-            plt.plot(df['Year'], df['Sea Level'])
-            plt.xlabel('Year')
-            plt.ylabel('Sea Level (GMSL)')
-            plt.savefig('AnnualSeaLevel.png')
-            plt.close()
-            plt.plot(df['Year'], df['Uncertainty'], 'g-')
-            plt.xlabel('Year')
-            plt.ylabel('GMSL Uncertainty')
-            plt.savefig('GMSL_Uncertainty.png')
-            plt.close()
-            plt.plot(df['Year'], df['Sea Level'], 'o')
-            m, b = np.polyfit(df['Year'], df['Sea Level'], 1)
-            plt.xlabel('Year')
-            plt.ylabel('Sea Level (GMSL)')
-            plt.plot(df['Year'], m*df['Year']+b, 'r-')
-            plt.savefig('AnnualSeaLevelRegression.png')
+        names = list(SEA_PLOTS) if plot == 'all' else [plot]
+        render_plots([(SEA_PLOTS[name], window.columns) for name in names])
         logging.debug('Plot(s) created...')
+    instrument.finish(args)
     print('\n'+'Done!')
     logging.debug('Program successfully ran!')
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    except BrokenPipeError:
+        closed_pipe()   # Output piped into a reader that stopped early
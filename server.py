@@ -0,0 +1,236 @@
+import os
+import json
+import time
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+import numpy as np
+from fetch import FetchError
+from datacache import cache_dir
+from records import DataTable
+from datadir import data_path, building, add_data_dir_argument, apply_data_dir
+from streamstats import StreamStats
+from align import align
+from regression import fit_ols
+from plots import render_plots
+import instrument
+from globalTemp import get_temp_csv, load_temp, TEMP_COLUMNS, TEMP_PLOTS, TEMP_CLEAN
+from seaLevels import get_sea_csv, load_level, SEA_COLUMNS, SEA_PLOTS, SEA_CLEAN
+from TempVsSeaLevel import PREDICTORS, MERGED_PLOTS, plot_columns
+
+### Query daemon keeping the clean datasets resident in memory
+# The clean data is loaded once and answered from memory over HTTP/JSON, so a dashboard
+# polling the numbers pays neither the interpreter start nor the load for every query.
+# Every request stats the clean files (a few microseconds); when a clean file has been
+# rebuilt (e.g. by globalTemp.py -u) the tables are reloaded. A rebuild is only picked up
+# once it releases its build lock (see datadir.locked), so a half written clean file is
+# never served; a clean file left without a current cache is loaded, rebuilding the cache.
+# Responses are kept per data version, so repeated queries are a dictionary lookup.
+#
+# Endpoints (GET, JSON):
+#   /status                         data version, load time and row counts
+#   /temp, /sea, /merged            the table as {column: [values]}; ?sort=1 orders temp by
+#                                   annual temp and sea by sea level, highest first
+#   /temp/avg, /sea/avg             average value and average change per year (as -a)
+#   /ols?var=annual|5year&intercept=1
+#                                   sea level regressed on temp (as TempVsSeaLevel.py -r)
+#   /plot?set=temp|sea|merged&name=<plot>
+#                                   renders one plot (as -pl), returns its file name
+
+PORT = 8750
+
+# Clean file (in the data folder), acquire function, loader, cache columns, sort column and
+# -pl plots per dataset
+SOURCES = {'temp': (TEMP_CLEAN, get_temp_csv, load_temp, TEMP_COLUMNS,
+                    'Annual Avg Temp', TEMP_PLOTS),
+           'sea': (SEA_CLEAN, get_sea_csv, load_level, SEA_COLUMNS,
+                   'Sea Level', SEA_PLOTS)}
+
+def setup_logging():
+    '''Attaches the DEBUG file handler for this program to the root logger'''
+    instrument.setup_logging('logfile_Server.log')
+
+
+def _stat(path):
+    try:
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+    except OSError:
+        return None
+
+
+class Datasets:
+    '''The temp, sea and merged DataTables held in memory, reloaded when the clean files change'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tables = None
+        self.stamps = None
+        self.version = 0
+        self.loaded = None
+        self.responses = {}
+
+    def _stamps(self):
+        paths = [data_path(csv) for csv, *rest in SOURCES.values()]
+        return tuple((_stat(path), _stat(os.path.join(cache_dir(path), 'schema.json')))
+                     for path in paths)
+
+    def _load(self):
+        tables = {}
+        for kind, (csv, get_csv, load, names, *rest) in SOURCES.items():
+            if self.tables is not None and building(csv):
+                return None     # A rebuild is still being written, keep serving the old data
+            get_csv()
+            # Copied out of the cache memmaps, which a rebuild truncates and rewrites in place
+            tables[kind] = DataTable({name: np.array(values)
+                                      for name, values in load().columns.items()})
+        tables['merged'] = align(tables['temp'], tables['sea'])
+        return tables
+
+    def current(self):
+        '''Returns the tables and the response cache of the current data version,
+            reloading the tables first if a clean file changed'''
+        stamps = self._stamps()
+        with self.lock:
+            if stamps != self.stamps:
+                try:
+                    tables = self._load()
+                except (IOError, ValueError):
+                    if self.tables is None:
+                        raise
+                    logging.debug('Reload failed, serving the previous data...')
+                    tables = None
+                if tables is not None:
+                    self.tables, self.stamps = tables, self._stamps()
+                    self.version += 1
+                    self.loaded = time.time()
+                    self.responses = {}
+                    logging.debug('Datasets loaded, version %d...' % self.version)
+            return self.tables, self.responses
+
+
+def _columns(table):
+    return {name: table[name].tolist() for name in table.names}
+
+
+def averages(table, column):
+    '''Returns the average value, average change and OLS trend per year, as printed by -a'''
+    stats = StreamStats(['Year', column]).update([table['Year'], table[column]])
+    return {'mean': float(stats.column_mean(column)), 'yearly_change': float(stats.change(column)),
+            'trend': float(stats.trend(column)[0])}
+
+
+_plot_lock = threading.Lock()
+
+
+def query(tables, path, params):
+    '''Answers one request from the resident tables
+
+    Returns:    body - the JSON serializable answer
+    Raises:     KeyError for an unknown path, ValueError for bad parameters'''
+    parts = path.strip('/').split('/')
+    if len(parts) == 1 and parts[0] in tables:
+        table = tables[parts[0]]
+        if params.get('sort') == '1' and parts[0] in SOURCES:
+            order = np.argsort(-table[SOURCES[parts[0]][4]], kind='stable')
+            table = table.take(order)
+        return _columns(table)
+    if len(parts) == 2 and parts[0] in SOURCES and parts[1] == 'avg':
+        return averages(tables[parts[0]], SOURCES[parts[0]][4])
+    if parts == ['ols']:
+        predictor = PREDICTORS[params.get('var', 'annual')]
+        merged = tables['merged']
+        fit = fit_ols(merged['Sea Level'], merged[predictor], intercept=params.get('intercept') == '1',
+                      names=[predictor], yname='Sea Level')
+        return {'names': fit.names, 'params': fit.params.tolist(), 'bse': fit.bse.tolist(),
+                'tvalues': fit.tvalues.tolist(), 'nobs': fit.nobs, 'rsquared': fit.rsquared,
+                'rsquared_adj': fit.rsquared_adj, 'aic': fit.aic, 'bic': fit.bic}
+    if parts == ['plot']:
+        kind = params.get('set', 'merged')
+        specs = MERGED_PLOTS if kind == 'merged' else SOURCES[kind][5]
+        spec = specs[params['name']]
+        columns = plot_columns(tables['merged']) if kind == 'merged' else tables[kind].columns
+        with _plot_lock:    # pyplot keeps global state, one figure at a time
+            rendered = render_plots([(spec, columns)], processes=1)
+        return {'output': spec.output, 'rendered': bool(rendered)}
+    raise KeyError(path)
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    '''Serves query() answers as JSON, keeping connections alive between polls'''
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        datasets = self.server.datasets
+        try:
+            tables, responses = datasets.current()
+            key = (url.path, tuple(sorted(params.items())))
+            body = responses.get(key)
+            if url.path == '/status':
+                body = json.dumps({'version': datasets.version, 'loaded': datasets.loaded,
+                                   'rows': {kind: len(t) for kind, t in tables.items()}}).encode()
+            elif body is None:
+                body = json.dumps(query(tables, url.path, params)).encode()
+                if url.path != '/plot':     # Plots are checked against their file every time
+                    responses[key] = body
+            status = 200
+        except KeyError as error:
+            status, body = 404, json.dumps({'error': 'Unknown path or name %s' % error}).encode()
+        except ValueError as error:
+            status, body = 400, json.dumps({'error': str(error)}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+
+def make_server(datasets, host='127.0.0.1', port=PORT):
+    '''Returns a ThreadingHTTPServer answering queries on the datasets'''
+    server = ThreadingHTTPServer((host, port), QueryHandler)
+    server.daemon_threads = True
+    server.datasets = datasets
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Keeps the clean temp and sea level data in memory and answers the print, \
+            sort, average, OLS and plot operations as JSON over HTTP, reloading the data \
+            whenever the clean files are rebuilt.')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='Address to listen on (default 127.0.0.1)')
+    parser.add_argument('--port', default=PORT, type=int,
+                        help='Port to listen on (default %d)' % PORT)
+    add_data_dir_argument(parser)
+    args = parser.parse_args()
+    setup_logging()
+    apply_data_dir(args)
+    datasets = Datasets()
+    try:
+        datasets.current()
+    except FetchError:
+        print('Error querying data')
+        raise SystemExit(1)
+    except ValueError:
+        print('Error Cleaning Data')
+        raise SystemExit(1)
+    server = make_server(datasets, args.host, args.port)
+    print('Serving on http://%s:%d/ (Ctrl-C to stop)' % server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
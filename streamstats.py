@@ -0,0 +1,106 @@
+import numpy as np
+
+### Single-pass, mergeable statistics of a table's columns
+# StreamStats is fed one chunk of columns at a time and never holds more than its summary:
+# the row count, the first, last, lowest and highest value of every column, the column means
+# and the matrix of centered co-moments (sums of products of deviations from the mean).
+# Each chunk is summarized with numpy and folded in with Chan's pairwise update, which is
+# the same formula that merges two summaries, so partitions cleaned separately (or by other
+# processes) combine exactly as if the rows had been read in one pass. Centered sums keep
+# the variance and covariance accurate where raw sums of squares would cancel.
+
+
+class StreamStats:
+    '''Running summary of named float columns, updated chunk by chunk'''
+
+    def __init__(self, names):
+        self.names = list(names)
+        p = len(self.names)
+        self.count = 0
+        self.mean = np.zeros(p)
+        self.comoment = np.zeros((p, p))
+        self.min = np.full(p, np.nan)
+        self.max = np.full(p, np.nan)
+        self.first = np.full(p, np.nan)
+        self.last = np.full(p, np.nan)
+
+    def update(self, columns):
+        '''Folds one chunk (one array per name, in order) into the summary
+
+        Returns:    self'''
+        chunk = np.column_stack([np.asarray(values, dtype=float) for values in columns])
+        if len(chunk) == 0:
+            return self
+        part = StreamStats(self.names)
+        part.count = len(chunk)
+        part.mean = chunk.mean(axis=0)
+        centered = chunk - part.mean
+        part.comoment = centered.T @ centered
+        part.min, part.max = np.fmin.reduce(chunk), np.fmax.reduce(chunk)
+        part.first, part.last = chunk[0], chunk[-1]
+        return self.merge(part)
+
+    def merge(self, other):
+        '''Folds the summary of the rows following ours (e.g. the next partition) into this one
+
+        Returns:    self'''
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.first = other.first.copy()
+        n = self.count + other.count
+        delta = other.mean - self.mean
+        self.comoment = self.comoment + other.comoment + np.outer(delta, delta) * self.count * other.count / n
+        self.mean = self.mean + delta * other.count / n
+        self.min, self.max = np.fmin(self.min, other.min), np.fmax(self.max, other.max)
+        self.last = other.last.copy()
+        self.count = n
+        return self
+
+    def copy(self):
+        '''Returns an independent copy of the summary'''
+        return StreamStats.from_dict(self.to_dict())
+
+    def _index(self, name):
+        return self.names.index(name)
+
+    def variance(self, name, ddof=0):
+        '''Returns the variance of a column (population variance by default, as numpy)'''
+        i = self._index(name)
+        return self.comoment[i, i] / (self.count - ddof)
+
+    def covariance(self, a, b, ddof=0):
+        '''Returns the covariance of two columns'''
+        return self.comoment[self._index(a), self._index(b)] / (self.count - ddof)
+
+    def column_mean(self, name):
+        return self.mean[self._index(name)]
+
+    def change(self, name):
+        '''Returns the average change of a column per row, from its first to its last value'''
+        i = self._index(name)
+        return (self.last[i] - self.first[i]) / self.count
+
+    def trend(self, y, x='Year'):
+        '''Returns the OLS slope and intercept of column y on column x'''
+        slope = self.comoment[self._index(x), self._index(y)] / self.comoment[self._index(x), self._index(x)]
+        return slope, self.column_mean(y) - slope * self.column_mean(x)
+
+    def to_dict(self):
+        '''Returns a JSON serializable copy of the summary (see from_dict)'''
+        return {'names': self.names, 'count': self.count, 'mean': self.mean.tolist(),
+                'comoment': self.comoment.tolist(), 'min': self.min.tolist(),
+                'max': self.max.tolist(), 'first': self.first.tolist(), 'last': self.last.tolist()}
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls(data['names'])
+        stats.count = data['count']
+        for key in ['mean', 'comoment', 'min', 'max', 'first', 'last']:
+            setattr(stats, key, np.array(data[key], dtype=float))
+        return stats
+
+    @classmethod
+    def of_table(cls, table):
+        '''Returns the summary of every column of a DataTable, in one pass'''
+        return cls(table.names).update([table[name] for name in table.names])
@@ -0,0 +1,70 @@
+import unittest
+import numpy as np
+import pandas as pd
+from aggregate import month_index, month_sums, merge_sums, merge_runs, monthly_table, pivot, aggregate
+
+
+class TestAggregate(unittest.TestCase):
+
+    def setUp(self):
+        # Two sources, monthly from 1951 to 1978 with gaps, in shuffled order
+        rng = np.random.default_rng(5)
+        months = np.arange(1951*12, 1979*12)
+        self.frame = pd.DataFrame({'source': np.repeat([0, 1], len(months)),
+                                   'month': np.tile(months, 2),
+                                   'value': rng.normal(0, 1, 2*len(months))})
+        self.frame = self.frame.drop(index=rng.choice(len(self.frame), 40, replace=False))
+        self.frame = self.frame.sample(frac=1, random_state=1)
+        self.monthly = pivot(self.frame['source'].to_numpy(), self.frame['month'].to_numpy(),
+                             self.frame['value'].to_numpy(), ['A', 'B'])
+
+    def expected(self, window):
+        frame = self.frame.assign(start=self.frame['month'] // window * window)
+        return frame.pivot_table(index='start', columns='source', values='value', aggfunc='mean')
+
+    def testMonthIndex(self):
+        self.assertEqual(list(month_index(['1880-12-06', '1881-01', '1882', '12000-03'])),
+                         [1880*12 + 11, 1881*12, 1882*12, 12000*12 + 2])
+
+    def testPivotKeysBySourceAndMonth(self):
+        self.assertTrue(np.all(np.diff(self.monthly['Month']) > 0))
+        present = (~np.isnan(self.monthly['A'])).sum() + (~np.isnan(self.monthly['B'])).sum()
+        self.assertEqual(int(present), len(self.frame))
+
+    def testChunkedSumsMatchPivot(self):
+        columns = [self.frame[name].to_numpy() for name in ['source', 'month', 'value']]
+        parts = [month_sums(*[values[start:start + 100] for values in columns], 2)
+                 for start in range(0, len(self.frame), 100)]
+        merged = monthly_table(*merge_sums(parts), ['A', 'B'])
+        self.assertTrue(np.array_equal(merged['Month'], self.monthly['Month']))
+        for name in ['A', 'B']:
+            np.testing.assert_allclose(merged[name], self.monthly[name])
+
+    def testMergedRunsMatchPivot(self):
+        columns = [self.frame[name].to_numpy() for name in ['source', 'month', 'value']]
+        parts = [month_sums(*[values[start:start + 100] for values in columns], 2)
+                 for start in range(0, len(self.frame), 100)]
+        blocks = [monthly_table(*block, ['A', 'B'])
+                  for block in merge_runs([lambda part=part: part for part in parts], 30)]
+        for block in blocks:
+            self.assertTrue(len(block['Month']) <= 30 or block['Month'][0] // 12 == block['Month'][-1] // 12)
+        self.assertTrue(all(a['Month'][-1] // 12 < b['Month'][0] // 12 for a, b in zip(blocks, blocks[1:])))
+        months = np.concatenate([block['Month'] for block in blocks])
+        self.assertTrue(np.array_equal(months, self.monthly['Month']))
+        for name in ['A', 'B']:
+            np.testing.assert_allclose(np.concatenate([block[name] for block in blocks]), self.monthly[name])
+
+    def testLevelsMatchGroupBy(self):
+        for level, window in [('annual', 12), ('5year', 60), ('decade', 120), (7, 7)]:
+            table = aggregate(self.monthly, level)
+            expected = self.expected(window)
+            self.assertTrue(np.allclose(table['A'], expected[0]))
+            self.assertTrue(np.allclose(table['B'], expected[1]))
+            starts = table['Year'] * 12 + table['Month'] - 1
+            self.assertTrue(np.array_equal(starts, expected.index))
+        decades = aggregate(self.monthly, 'decade')
+        self.assertEqual(list(decades['Year']), [1950, 1960, 1970])
+
+
+if __name__ == "__main__":
+    unittest.main()
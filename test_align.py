@@ -0,0 +1,46 @@
+import unittest
+import numpy as np
+from records import DataTable
+from align import align, year_index
+
+
+class TestAlign(unittest.TestCase):
+
+    def setUp(self):
+        years = np.arange(1880, 2017, dtype='int32')
+        self.temp = DataTable({'Year': years, 'Temp': years * 0.01})
+        years = np.arange(1880, 2014, dtype='int32')
+        self.sea = DataTable({'Year': years, 'Sea Level': years * 1.5,
+                              'Uncertainty': np.ones(len(years))})
+
+    def testCommonYears(self):
+        merged = align(self.temp, self.sea)
+        self.assertTrue(np.array_equal(merged['Year'], np.arange(1880, 2014)))
+        self.assertTrue(np.allclose(merged['Temp'] * 150, merged['Sea Level']))
+        self.assertEqual(merged.names, ['Year', 'Temp', 'Sea Level', 'Uncertainty'])
+
+    def testContiguousRunsAreViews(self):
+        merged = align(self.temp, self.sea)
+        self.assertTrue(np.shares_memory(merged['Temp'], self.temp['Temp']))
+        self.assertTrue(np.shares_memory(merged['Sea Level'], self.sea['Sea Level']))
+
+    def testUnsortedAndGappySources(self):
+        # Newest-first temp file that is missing a year, sea level starting later
+        temp = self.temp.take(np.delete(np.arange(len(self.temp))[::-1], 10))
+        sea = self.sea.take(slice(20, None))
+        merged = align(temp, sea)
+        expected = np.setdiff1d(np.arange(1900, 2014), [2016 - 10])
+        self.assertTrue(np.array_equal(merged['Year'], expected))
+        self.assertTrue(np.allclose(merged['Temp'] * 150, merged['Sea Level']))
+
+    def testManySeries(self):
+        other = DataTable({'Year': np.arange(1950, 2030, dtype='int32'), 'Other': np.zeros(80)})
+        self.assertTrue(np.array_equal(year_index(self.temp, self.sea, other), np.arange(1950, 2014)))
+
+    def testDuplicateColumnRejected(self):
+        with self.assertRaises(ValueError):
+            align(self.sea, self.sea)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+import os
+import tempfile
+import numpy as np
+from batch import read_manifest, run_batch, clean_source
+from regression import fit_ols
+from test_globalTemp import write_raw_temp
+from test_seaLevels import write_raw_level
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        folder = self.tmp.name
+        write_raw_temp(os.path.join(folder, 'temp.csv'), range(1880, 2017))
+        for i, start in enumerate([1880, 1900, 1950]):
+            write_raw_level(os.path.join(folder, 'sea%d.csv' % i), range(start, 2014))
+        with open(os.path.join(folder, 'broken.csv'), 'w') as f:
+            f.write('Time,GMSL,GMSL uncertainty\nnot,a,number\n')
+        with open(os.path.join(folder, 'manifest.csv'), 'w') as f:
+            f.write('name,temp,sea\n')
+            for i in range(3):
+                f.write('gauge%d,temp.csv,sea%d.csv\n' % (i, i))
+            f.write('bad,temp.csv,broken.csv\n')
+        self.manifest = read_manifest(os.path.join(folder, 'manifest.csv'))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def testMatchesSingleFit(self):
+        results = run_batch(self.manifest, processes=2)
+        self.assertEqual(list(results['Name']), ['gauge0', 'gauge1', 'gauge2', 'bad'])
+        self.assertEqual(list(results['First Year'][:3]), [1880, 1900, 1950])
+        # gauge1 by hand, following the value patterns of the synthetic writers
+        i = np.arange(20, 134)
+        sea = np.arange(0, 114) * 1.5 - 160
+        fit = fit_ols(sea, np.round((i % 17) / 10 - 0.8, 4))
+        self.assertAlmostEqual(results['Slope'][1], fit.params[1])
+        self.assertAlmostEqual(results['R-squared'][1], fit.rsquared)
+
+    def testBadSourceIsReported(self):
+        results = run_batch(self.manifest, processes=1)
+        self.assertIn('broken.csv', results['Error'][3])
+        self.assertTrue(np.isnan(results['Slope'][3]))
+        self.assertTrue((results['Error'][:3] == '').all())
+
+    def testFailedSourceLeavesNoCache(self):
+        for name in ['broken.csv', 'missing.csv']:
+            self.assertIn(name, clean_source('sea', os.path.join(self.tmp.name, name)))
+        self.assertEqual(sorted(n for n in os.listdir(self.tmp.name) if n.endswith('.cache')), [])
+        self.assertIsNone(clean_source('sea', os.path.join(self.tmp.name, 'sea0.csv')))
+        self.assertTrue(os.path.isdir(os.path.join(self.tmp.name, 'sea0.cache')))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+import numpy as np
+import bootstrap
+from bootstrap import bootstrap_ols, fit_batch
+
+
+class TestBootstrap(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.x = np.linspace(-0.5, 0.9, 134)
+        self.sigma = np.full(134, 8.0)
+        self.y = 120*self.x - 60 + rng.normal(0.0, 8.0, 134)
+
+    def testReproducibleAcrossWorkers(self):
+        elements, bootstrap.BATCH_ELEMENTS = bootstrap.BATCH_ELEMENTS, 134*700   # Forces 5 batches
+        try:
+            one = bootstrap_ols(self.y, self.x, self.sigma, 3000, seed=5, processes=1)
+            many = bootstrap_ols(self.y, self.x, self.sigma, 3000, seed=5, processes=3)
+        finally:
+            bootstrap.BATCH_ELEMENTS = elements
+        self.assertTrue(np.array_equal(one.slope, many.slope))
+        self.assertEqual(len(one.slope), 3000)
+
+    def testIntervalCoversTruth(self):
+        result = bootstrap_ols(self.y, self.x, self.sigma, 4000, processes=1)
+        self.assertTrue(result.slope_ci[0] < 120 < result.slope_ci[1])
+        self.assertTrue(result.intercept_ci[0] < -60 < result.intercept_ci[1])
+
+    def testRejectsNoSamples(self):
+        for samples in [0, -5]:
+            with self.assertRaises(ValueError):
+                bootstrap_ols(self.y, self.x, self.sigma, samples)
+
+    def testShortSeriesHasNoDegenerateReplicates(self):
+        # One in nine pairs resamples of 3 rows draws a single year
+        result = bootstrap_ols(self.y[:3], self.x[:3], self.sigma[:3], 20000, processes=1)
+        self.assertTrue(np.all(np.isfinite(result.slope)) and np.all(np.isfinite(result.intercept)))
+        self.assertTrue(np.all(np.isfinite(result.slope_ci)))
+        with self.assertRaises(ValueError):
+            bootstrap_ols(self.y[:3], np.ones(3), self.sigma[:3], 10)
+
+    def testZeroUncertaintyIsExactFit(self):
+        slope, const = fit_batch(np.random.SeedSequence(1), 10, 'mc', True,
+                                 self.x, self.y, np.zeros(134))
+        m, b = np.polyfit(self.x, self.y, 1)
+        self.assertTrue(np.allclose(slope, m) and np.allclose(const, b))
+
+    def testThroughOrigin(self):
+        slope, const = fit_batch(np.random.SeedSequence(1), 4, 'mc', False,
+                                 self.x, self.y, np.zeros(134))
+        self.assertTrue(np.allclose(slope, self.x @ self.y/(self.x @ self.x)))
+        self.assertTrue(np.all(const == 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+import os
+import tempfile
+import numpy as np
+from decimate import minmax_bins, grid_sample, decimate, FIGURE_PIXELS
+from plots import PlotSpec, Series, render_plots, prepare
+
+
+class TestDecimate(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.x = np.arange(200000, dtype=float)
+        self.y = np.cumsum(rng.normal(0, 1, len(self.x)))
+
+    def testMinMaxKeepsExtremes(self):
+        index = minmax_bins(self.x, self.y, 100)
+        self.assertLessEqual(len(index), 400)
+        self.assertEqual(index[0], 0)
+        self.assertEqual(index[-1], len(self.x) - 1)
+        # Every bin keeps its extremes, so the overall ones survive too
+        self.assertIn(np.argmin(self.y), index)
+        self.assertIn(np.argmax(self.y), index)
+        for lo, hi in [(0, 2000), (98000, 100000)]:
+            self.assertIn(lo + np.argmax(self.y[lo:hi]), index)
+
+    def testMinMaxSkipsNaN(self):
+        y = self.y.copy()
+        y[::3] = np.nan
+        index = minmax_bins(self.x, y, 50)
+        self.assertEqual(np.nanmax(y[index]), np.nanmax(y))
+        self.assertEqual(np.nanmin(y[index]), np.nanmin(y))
+
+    def testGridSampleOnePointPerCell(self):
+        x = np.tile([0.0, 1.0], 500)
+        y = np.repeat([0.0, 1.0], 500)
+        self.assertEqual(grid_sample(x, y, 10, 10).tolist(), [0, 1, 500, 501])
+
+    def testShortSeriesUnchanged(self):
+        x, y = self.x[:100], self.y[:100]
+        kept = decimate(x, y)
+        self.assertIs(kept[0], x)
+        self.assertIs(kept[1], y)
+
+    def testLongSeriesReduced(self):
+        x, y = decimate(self.x, self.y)
+        self.assertLessEqual(len(x), 4 * FIGURE_PIXELS[0])
+        self.assertEqual((y.min(), y.max()), (self.y.min(), self.y.max()))
+        x, y = decimate(self.x, self.y, line=False)
+        self.assertLessEqual(len(x), FIGURE_PIXELS[0] * FIGURE_PIXELS[1])
+
+    def testFitUsesFullData(self):
+        columns = {'X': self.x, 'Y': 2 * self.x + 1}
+        spec = PlotSpec('Fit.png', [Series('X', 'Y', 'o')], 'X', 'Y', fit=('X', 'Y'))
+        points, line = prepare(spec, columns)
+        self.assertLess(len(points[0][0]), len(self.x))
+        self.assertEqual(line[:2], (0.0, len(self.x) - 1.0))
+        np.testing.assert_allclose(line[2:], (2.0, 1.0))
+
+    def testRendersLongSeries(self):
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as folder:
+            os.chdir(folder)
+            try:
+                spec = PlotSpec('Long.png', [Series('X', 'Y')], 'X', 'Y', fit=('X', 'Y'))
+                rendered = render_plots([(spec, {'X': self.x, 'Y': self.y})], processes=1)
+                self.assertEqual(rendered, ['Long.png'])
+                self.assertTrue(os.path.getsize('Long.png') > 0)
+            finally:
+                os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    unittest.main()
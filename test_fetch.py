@@ -0,0 +1,122 @@
+import unittest
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import fetch
+from fetch import fetch as fetch_file
+
+PAYLOAD = b''.join(b'%d-06-15,%d.5,12.0\n' % (year, year - 2000) for year in range(1880, 2014))
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    '''Serves PAYLOAD with an ETag, honouring If-None-Match and Range requests. When
+        server.truncate is set, the next full response is cut off halfway, and when
+        server.reject_range is set, Range requests are answered 416.'''
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        etag = '"v%d"' % server.version
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = server.payload
+        start = 0
+        rng = self.headers.get('Range')
+        if rng and server.reject_range:
+            self.send_response(416)
+            self.send_header('Content-Range', 'bytes */%d' % len(body))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if rng and self.headers.get('If-Range', etag) == etag:
+            start = int(rng.split('=')[1].rstrip('-'))
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, len(body) - 1, len(body)))
+        else:
+            self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body) - start))
+        self.end_headers()
+        if server.truncate:
+            server.truncate = False
+            self.wfile.write(body[start:len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body[start:])
+
+    def log_message(self, *args):
+        pass
+
+
+class TestFetch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dest = os.path.join(self.tmp.name, 'SeaLevelData.csv')
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        self.server.payload, self.server.version = PAYLOAD, 1
+        self.server.truncate, self.server.requests = False, []
+        self.server.reject_range = False
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:%d/gmsl.csv' % self.server.server_address[1]
+        self.backoff, fetch.BACKOFF = fetch.BACKOFF, 0
+
+    def tearDown(self):
+        fetch.BACKOFF = self.backoff
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def read(self):
+        with open(self.dest, 'rb') as f:
+            return f.read()
+
+    def testDownload(self):
+        self.assertTrue(fetch_file(self.url, self.dest, chunk_bytes=64))
+        self.assertEqual(self.read(), PAYLOAD)
+        self.assertFalse(os.path.exists(self.dest + '.part'))
+
+    def testUnchangedIsOneRoundTrip(self):
+        fetch_file(self.url, self.dest)
+        self.assertFalse(fetch_file(self.url, self.dest))
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.server.requests[-1].get('If-None-Match'), '"v1"')
+
+    def testChangedSourceIsDownloaded(self):
+        fetch_file(self.url, self.dest)
+        self.server.payload, self.server.version = PAYLOAD + b'2014-06-15,14.5,11.0\n', 2
+        self.assertTrue(fetch_file(self.url, self.dest))
+        self.assertEqual(self.read(), self.server.payload)
+
+    def testResumesInterruptedDownload(self):
+        self.server.truncate = True
+        self.assertTrue(fetch_file(self.url, self.dest, chunk_bytes=64))
+        self.assertEqual(self.read(), PAYLOAD)
+        self.assertTrue(self.server.requests[-1].get('Range', '').startswith('bytes='))
+        self.assertNotEqual(self.server.requests[-1].get('Range'), 'bytes=0-')
+
+    def testUnresumablePartIsDownloadedAgain(self):
+        self.server.truncate = True
+        with self.assertRaises(Exception):
+            fetch_file(self.url, self.dest, retries=0, chunk_bytes=64)
+        self.assertTrue(os.path.getsize(self.dest + '.part'))
+        self.server.reject_range = True
+        self.assertTrue(fetch_file(self.url, self.dest))
+        self.assertEqual(self.read(), PAYLOAD)
+        self.assertEqual(self.server.requests[-1].get('Range'), None)
+        self.assertFalse(os.path.exists(self.dest + '.part'))
+
+    def testFailedDownloadKeepsOldFile(self):
+        fetch_file(self.url, self.dest)
+        self.server.payload, self.server.version, self.server.truncate = b'x' * 4096, 2, True
+        with self.assertRaises(Exception):
+            fetch_file(self.url, self.dest, retries=0)
+        self.assertEqual(self.read(), PAYLOAD)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,24 @@
 import unittest
 from globalTemp import *
 import os
+import tempfile
+import tracemalloc
+
+def write_raw_temp(path, years):
+    '''Writes a synthetic raw temp file in the source layout, two rows per year'''
+    with open(path, 'w') as f:
+        f.write('Country,Code,Indicator,Source,Date,Mean\n')
+        for i, year in enumerate(years):
+            f.write('World,WLD,Temp,GCAG,"%d-12-06",%.4f\n' % (year, (i % 17) / 10 - 0.8))
+            f.write('World,WLD,Temp,GISTEMP,"%d-12-06",%.2f\n' % (year, (i % 11) / 10 - 0.5))
+
+def append_raw_months(path, months):
+    '''Appends monthly rows of both sources, months being year*12 + month-1'''
+    with open(path, 'a') as f:
+        for month in months:
+            value = (month % 12) / 10
+            f.write('World,WLD,Temp,GCAG,"%d-%02d",%.2f\n' % (month // 12, month % 12 + 1, value))
+            f.write('World,WLD,Temp,GISTEMP,"%d-%02d",%.2f\n' % (month // 12, month % 12 + 1, value))
 
 class TestTemp(unittest.TestCase):
 
@@ -44,5 +62,143 @@ class TestTemp(unittest.TestCase):
         df, data = create_temp_local()
         self.assertTrue(len(df) == len(data))
 
+class TestTempOffline(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        write_raw_temp('GlobalTempData.csv', range(1880, 2017))
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def testChunkedCleanMatchesLoop(self):
+        data = np.loadtxt('GlobalTempData.csv', delimiter=',', dtype=str)
+        rows = [[int(data[i][4][1:5]), float(data[i][5]), float(data[i+1][5])]
+                for i in range(1, len(data), 2)]
+        pd.DataFrame(np.array(rows, dtype='O')).to_csv('Expected.csv')
+        clean_data_temp(chunksize=7)    # Odd size forces uneven chunk boundaries
+        with open('Expected.csv') as a, open('GlobalTempClean.csv') as b:
+            self.assertEqual(a.read(), b.read())
+
+    def testCleanMemoryBounded(self):
+        # The peak of a clean depends on chunksize (and the parser's read buffer, which both
+        # files fill), not on the number of years in the file
+        peaks = []
+        for years in [8000, 24000]:
+            write_raw_temp('GlobalTempData.csv', range(1000, 1000 + years))
+            instrument._events.clear()
+            instrument.enable_profile()
+            try:
+                clean_data_temp(chunksize=2000)
+            finally:
+                tracemalloc.stop()
+            peaks.append(instrument._events[-1]['args']['peak_bytes'])
+        instrument._events.clear()
+        self.assertLess(peaks[1], 1.25 * peaks[0])
+        self.assertEqual(len(load_temp()), 24000)
+
+    def testIterChunksBounded(self):
+        sizes = [len(years) for years, annual, five in iter_clean_temp(chunksize=20)]
+        self.assertTrue(max(sizes) == 10 and sum(sizes) == 2017 - 1880)
+
+    def testCacheMatchesCsv(self):
+        clean_data_temp()
+        self.assertIsNotNone(read_cache('GlobalTempClean.csv', TEMP_COLUMNS))
+        df, data = create_temp_local()
+        csv = pd.read_csv('GlobalTempClean.csv', index_col=0)
+        self.assertTrue(np.array_equal(df.values, csv.values))
+        self.assertTrue(type(data[0][0]) == int and type(data[0][1]) == float)
+
+    def testTypedTable(self):
+        clean_data_temp()
+        table = load_temp()
+        self.assertEqual(table['Year'].dtype, np.int32)
+        self.assertEqual(table['Annual Avg Temp'].dtype, np.float64)
+        self.assertTrue(table['Annual Avg Temp'].flags['C_CONTIGUOUS'])
+        df, data = create_temp_local()
+        self.assertTrue(len(table) == len(df) == len(data))
+
+    def testBadRawFileRaises(self):
+        with open('GlobalTempData.csv', 'a') as f:
+            f.write('World,WLD,Temp,GCAG,"2017-12-06",0.9\n')     # Unpaired final row
+        with self.assertRaises(ValueError):
+            clean_data_temp(chunksize=50)
+        self.assertFalse(os.path.exists('GlobalTempClean.csv'))
+
+    def testIncrementalMatchesFullClean(self):
+        write_raw_temp('GlobalTempData.csv', range(1880, 2000))
+        clean_data_temp(chunksize=7)
+        write_raw_temp('GlobalTempData.csv', range(1880, 2017))     # Source grew by 17 years
+        self.assertEqual(clean_data_temp(chunksize=7, incremental=True), 17)
+        self.assertEqual(clean_data_temp(incremental=True), 0)
+        with open('GlobalTempClean.csv') as f:
+            incremental = f.read()
+        clean_data_temp(chunksize=7)
+        with open('GlobalTempClean.csv') as f:
+            self.assertEqual(incremental, f.read())
+        meta = read_meta('GlobalTempClean.csv', TEMP_COLUMNS)
+        table = load_temp()
+        stats = StreamStats.from_dict(meta['stats'])
+        self.assertAlmostEqual(stats.column_mean('Annual Avg Temp'), table['Annual Avg Temp'].mean())
+        self.assertEqual(meta['high_water'], 2016)
+
+    def testIncrementalCompletesPartialYear(self):
+        write_raw_temp('GlobalTempData.csv', [])
+        append_raw_months('GlobalTempData.csv', range(2000*12, 2003*12))
+        get_temp_csv()
+        append_raw_months('GlobalTempData.csv', [2003*12])              # January only
+        get_temp_csv()
+        mapped = load_temp()
+        self.assertAlmostEqual(mapped['Annual Avg Temp'][-1], 0.0)
+        append_raw_months('GlobalTempData.csv', range(2003*12 + 1, 2004*12))
+        self.assertEqual(clean_data_temp(incremental=True), 0)        # 2003 replaced, none added
+        self.assertAlmostEqual(mapped['Annual Avg Temp'][-1], 0.0)    # Readers keep their columns
+        self.assertAlmostEqual(load_temp()['Annual Avg Temp'][-1], 0.55)
+        with open('GlobalTempClean.csv') as f:
+            incremental = f.read()
+        meta = read_meta('GlobalTempClean.csv', TEMP_COLUMNS)
+        clean_data_temp()
+        with open('GlobalTempClean.csv') as f:
+            self.assertEqual(incremental, f.read())
+        full = read_meta('GlobalTempClean.csv', TEMP_COLUMNS)
+        np.testing.assert_allclose(meta['stats']['mean'], full['stats']['mean'])
+        np.testing.assert_allclose(meta['stats']['comoment'], full['stats']['comoment'], atol=1e-9)
+        self.assertEqual(list(load_temp()['Year']), [2000, 2001, 2002, 2003])
+
+    def testRewrittenRawIsCleanedAgain(self):
+        clean_data_temp()
+        write_raw_temp('GlobalTempData.csv', range(1900, 2018))     # Not an extension
+        self.assertTrue(raw_changed('GlobalTempData.csv', 'GlobalTempClean.csv', TEMP_COLUMNS))
+        get_temp_csv()
+        self.assertEqual(list(load_temp()['Year']), list(range(1900, 2018)))
+        self.assertFalse(raw_changed('GlobalTempData.csv', 'GlobalTempClean.csv', TEMP_COLUMNS))
+
+    def testRowOrderDoesNotMatter(self):
+        clean_data_temp()
+        with open('GlobalTempClean.csv') as f:
+            expected = f.read()
+        with open('GlobalTempData.csv') as f:
+            header, *rows = f.readlines()
+        with open('GlobalTempData.csv', 'w') as f:
+            f.writelines([header] + rows[1::2] + rows[0::2][::-1])     # Sources and years shuffled
+        clean_data_temp()
+        with open('GlobalTempClean.csv') as f:
+            self.assertEqual(f.read(), expected)
+        monthly = load_temp_monthly()
+        self.assertEqual(monthly.names, MONTHLY_COLUMNS)
+        self.assertTrue(np.array_equal(monthly['GCAG'], load_temp()['Annual Avg Temp']))
+
+    def testStaleCacheFallsBack(self):
+        clean_data_temp()
+        csv = pd.read_csv('GlobalTempClean.csv', index_col=0)
+        csv.iloc[:5].to_csv('GlobalTempClean.csv')     # Clean file changes behind the cache
+        self.assertIsNone(read_cache('GlobalTempClean.csv', TEMP_COLUMNS))
+        df, data = create_temp_local()
+        self.assertEqual(len(df), 5)
+        self.assertEqual(len(read_cache('GlobalTempClean.csv', TEMP_COLUMNS)['Year']), 5)
+
 if __name__ == "__main__":
     unittest.main()
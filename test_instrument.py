@@ -0,0 +1,77 @@
+import unittest
+import os
+import json
+import logging
+import argparse
+import tempfile
+import tracemalloc
+import numpy as np
+import instrument
+
+
+class TestInstrument(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        instrument._events.clear()
+
+    def tearDown(self):
+        tracemalloc.stop()
+        instrument._events.clear()
+        self.tmp.cleanup()
+
+    def testSpansOnlyRecordedWhileProfiling(self):
+        with instrument.span('quiet'):
+            pass
+        self.assertEqual(instrument._events, [])
+
+    def testNestedPeaks(self):
+        instrument.enable_profile()
+        with instrument.span('outer'):
+            with instrument.span('inner', rows=10):
+                block = np.ones(2**20)      # 8 MB
+                del block
+            small = np.ones(10)
+        inner, outer = instrument._events
+        self.assertEqual((inner['name'], inner['args']['rows']), ('inner', 10))
+        self.assertGreaterEqual(inner['args']['peak_bytes'], 8 * 2**20)
+        self.assertGreaterEqual(outer['args']['peak_bytes'], inner['args']['peak_bytes'])
+        self.assertGreaterEqual(outer['dur'], inner['dur'])
+        self.assertEqual(len(instrument.summary()), 2)
+
+    def testChromeTrace(self):
+        instrument.enable_profile()
+        with instrument.span('clean temp'):
+            pass
+        path = os.path.join(self.tmp.name, 'profile.json')
+        instrument.write_profile(path)
+        with open(path) as f:
+            trace = json.load(f)
+        self.assertEqual(trace['traceEvents'][0]['ph'], 'X')
+
+    def testProfileArgument(self):
+        parser = argparse.ArgumentParser()
+        instrument.add_profile_argument(parser)
+        self.assertEqual(parser.parse_args(['--profile']).profile, 'profile.json')
+        path = os.path.join(self.tmp.name, 'run.json')
+        args = parser.parse_args(['--profile', path])
+        instrument.apply_profile(args)
+        with instrument.span('stats'):
+            pass
+        instrument.finish(args)
+        self.assertTrue(os.path.exists(path))
+
+    def testHandlerAttachedOnce(self):
+        logger = logging.getLogger()
+        path = os.path.join(self.tmp.name, 'logfile_Test.log')
+        before = len(logger.handlers)
+        instrument.setup_logging(path)
+        instrument.setup_logging(path)
+        self.assertEqual(len(logger.handlers), before + 1)
+        handler = logger.handlers[-1]
+        logger.removeHandler(handler)
+        handler.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
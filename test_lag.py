@@ -0,0 +1,37 @@
+import unittest
+import numpy as np
+from lag import xcorr, best_lag, lagged_pairs
+
+
+class TestLag(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(11)
+        self.x = np.cumsum(rng.normal(0.0, 1.0, 300))
+        self.y = np.roll(self.x, 7) + rng.normal(0.0, 0.1, 300)    # y follows x by 7 steps
+        self.y[:7] = self.y[7]
+
+    def testMatchesDirectSums(self):
+        lags, corr = xcorr(self.x, self.y, 12)
+        x, y = self.x - self.x.mean(), self.y - self.y.mean()
+        for lag in [-12, -3, 0, 5, 12]:
+            if lag >= 0:
+                direct = np.sum(y[lag:] * x[:len(x)-lag])
+            else:
+                direct = np.sum(y[:lag] * x[-lag:])
+            self.assertAlmostEqual(corr[lags == lag][0], direct/(len(x)*x.std()*y.std()))
+
+    def testFindsDelay(self):
+        lags, corr = xcorr(self.x, self.y, 30)
+        self.assertEqual(best_lag(lags, corr)[0], 7)
+
+    def testLaggedPairsMatchOnYear(self):
+        years, x, y = lagged_pairs(np.arange(1880, 2017), np.arange(137.0),
+                                   np.arange(1880, 2014), np.arange(134.0) + 1000, 5)
+        self.assertEqual(years[0], 1885)
+        self.assertTrue(np.array_equal(x, years - 5 - 1880))
+        self.assertTrue(np.array_equal(y, years - 1880 + 1000))
+
+
+if __name__ == "__main__":
+    unittest.main()
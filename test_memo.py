@@ -0,0 +1,81 @@
+import unittest
+import os
+import tempfile
+from unittest import mock
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from memo import memoize, memo_stats, clear
+from datadir import DATA_DIR_ENV
+
+
+def _square_sum(directory):
+    values = np.arange(1000.0)
+    return memoize('square', {}, {'x': values}, lambda: float((values**2).sum()), directory)
+
+
+class TestMemo(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = os.path.join(self.tmp.name, '.memo')
+        self.calls = 0
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def compute(self):
+        self.calls += 1
+        return {'calls': self.calls}
+
+    def testHitAndMiss(self):
+        columns = {'Year': np.arange(1880, 2014), 'Sea Level': np.linspace(0, 1, 134)}
+        first = memoize('ols', {'intercept': True}, columns, self.compute, self.dir)
+        second = memoize('ols', {'intercept': True}, columns, self.compute, self.dir)
+        self.assertEqual(first, second)
+        self.assertEqual(self.calls, 1)
+        memoize('ols', {'intercept': False}, columns, self.compute, self.dir)
+        self.assertEqual(self.calls, 2)
+        stats = memo_stats(self.dir)
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (1, 2, 2))
+
+    def testNewDataMisses(self):
+        columns = {'Year': np.arange(1880, 2014)}
+        memoize('avg', {}, columns, self.compute, self.dir)
+        memoize('avg', {}, {'Year': np.arange(1880, 2015)}, self.compute, self.dir)
+        self.assertEqual(self.calls, 2)
+
+    def testEvictsLeastRecentlyUsed(self):
+        for i in range(4):
+            memoize('op', {'i': i}, {}, lambda: bytes(1000), self.dir, max_bytes=3500)
+        self.assertEqual(memo_stats(self.dir)['entries'], 3)
+        memoize('op', {'i': 0}, {}, self.compute, self.dir, max_bytes=3500)
+        self.assertEqual(self.calls, 1)     # The oldest entry was the one evicted
+
+    def testCorruptEntryIsRecomputed(self):
+        memoize('op', {}, {}, self.compute, self.dir)
+        for name in os.listdir(self.dir):
+            if name.endswith('.pkl'):
+                with open(os.path.join(self.dir, name), 'wb') as f:
+                    f.write(b'garbage')
+        self.assertEqual(memoize('op', {}, {}, self.compute, self.dir), {'calls': 2})
+        clear(self.dir)
+        self.assertEqual(memo_stats(self.dir)['entries'], 0)
+
+    def testKeptInDataFolder(self):
+        shared = os.path.join(self.tmp.name, 'shared')
+        with mock.patch.dict(os.environ, {DATA_DIR_ENV: shared}):
+            memoize('op', {}, {}, self.compute, max_bytes=3500)
+            self.assertEqual(memo_stats()['entries'], 1)
+        self.assertTrue(os.path.isdir(os.path.join(shared, '.memo')))
+
+    def testSharedBetweenProcesses(self):
+        with ProcessPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(_square_sum, [self.dir] * 16))
+        self.assertEqual(len(set(results)), 1)
+        stats = memo_stats(self.dir)
+        self.assertEqual(stats['hits'] + stats['misses'], 16)
+        self.assertEqual(stats['entries'], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
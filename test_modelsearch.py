@@ -0,0 +1,77 @@
+import unittest
+from math import comb
+import numpy as np
+from records import DataTable
+from regression import fit_ols
+from lag import lagged_pairs
+import modelsearch
+from modelsearch import design, gram, subset_ssr, search
+
+
+class TestModelSearch(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        years = np.arange(1850, 2017, dtype='int32')
+        self.temp = DataTable({'Year': years, 'Annual Avg Temp': np.cumsum(rng.normal(0, 0.1, len(years))),
+                               '5-Year Avg Temp': np.cumsum(rng.normal(0, 0.05, len(years)))})
+        sea_years = years[30:-3]
+        # Sea level follows annual temp from 4 years earlier plus a trend
+        lagged = self.temp['Annual Avg Temp'][30 - 4:-3 - 4]
+        self.sea = DataTable({'Year': sea_years,
+                              'Sea Level': 40*lagged + 0.8*(sea_years - 1900) + rng.normal(0, 1, len(sea_years))})
+        self.names, self.X, self.y, self.years = design(
+            self.temp, self.sea, ['Annual Avg Temp', '5-Year Avg Temp'], range(9))
+
+    def testDesignMatchesLaggedPairs(self):
+        self.assertEqual(len(self.names), 2*9 + 1)
+        column = self.names.index('Annual Avg Temp (lag 6)')
+        years, x, y = lagged_pairs(self.temp['Year'], self.temp['Annual Avg Temp'],
+                                   self.sea['Year'], self.sea['Sea Level'], 6)
+        self.assertEqual(list(years), list(self.years))     # Every lag exists for every sea year
+        np.testing.assert_array_equal(self.X[:, column], x)
+        np.testing.assert_array_equal(self.y, y)
+
+    def testGramMatchesDirectFits(self):
+        g = gram(self.X, self.y)
+        index = np.array([[0, 5, 18], [3, 9, 12], [1, 2, 17]])
+        ssr = subset_ssr(g, index)
+        for subset, value in zip(index, ssr):
+            fit = fit_ols(self.y, self.X[:, subset])
+            self.assertAlmostEqual(value / fit.ssr, 1.0, places=8)
+
+    def testCriteriaMatchOLS(self):
+        ranked = search(self.names, self.X, self.y, max_terms=2, processes=1)
+        row = ranked[ranked['Predictors'] == 'Annual Avg Temp (lag 4) + Year'].iloc[0]
+        fit = fit_ols(self.y, self.X[:, [self.names.index('Annual Avg Temp (lag 4)'), -1]])
+        self.assertAlmostEqual(row['AIC'], fit.aic)
+        self.assertAlmostEqual(row['BIC'], fit.bic)
+        self.assertAlmostEqual(row['R-squared'], fit.rsquared)
+
+    def testFindsTrueModel(self):
+        ranked = search(self.names, self.X, self.y, criterion='bic', processes=1)
+        self.assertEqual(len(ranked), comb(19, 1) + comb(19, 2) + comb(19, 3))
+        self.assertEqual(ranked['Predictors'][0], 'Annual Avg Temp (lag 4) + Year')
+
+    def testRejectsEmptySearch(self):
+        with self.assertRaises(ValueError):
+            search(self.names, self.X, self.y, max_terms=0)
+        names, X, y, years = design(self.temp, self.sea, ['Annual Avg Temp'], range(200))
+        self.assertEqual(len(y), 0)
+        with self.assertRaises(ValueError):
+            search(names, X, y)
+
+    def testPoolMatchesSerial(self):
+        chunk = modelsearch.CHUNK_MODELS
+        modelsearch.CHUNK_MODELS = 100
+        try:
+            pooled = search(self.names, self.X, self.y, processes=2)
+        finally:
+            modelsearch.CHUNK_MODELS = chunk
+        serial = search(self.names, self.X, self.y, processes=1)
+        self.assertEqual(list(pooled['Predictors']), list(serial['Predictors']))
+        np.testing.assert_allclose(pooled['BIC'], serial['BIC'])
+
+
+if __name__ == '__main__':
+    unittest.main()
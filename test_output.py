@@ -0,0 +1,80 @@
+import unittest
+import io
+import json
+import argparse
+import contextlib
+import numpy as np
+import output
+from output import parse_years, select_rows, write_rows, add_output_arguments
+from records import DataTable
+
+
+class TestOutput(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.table = DataTable({'Year': np.arange(1880, 2014, dtype='int32'),
+                                'Sea Level': rng.permutation(134) * 1.5 - 100})
+
+    def testTopMatchesFullSort(self):
+        full = np.argsort(-self.table['Sea Level'], kind='stable')
+        for top in [1, 7, 134, 500]:
+            self.assertTrue(np.array_equal(select_rows(self.table, sort='Sea Level', top=top),
+                                           full[:top]))
+
+    def testYearsAndPages(self):
+        rows = select_rows(self.table, years=(1990, 1999))
+        self.assertEqual(list(self.table['Year'][rows]), list(range(1990, 2000)))
+        rows = select_rows(self.table, years=(2010, None), page=2, page_size=3)
+        self.assertEqual(list(self.table['Year'][rows]), [2013])
+        self.assertEqual(parse_years('1950:'), (1950, None))
+        self.assertEqual(parse_years('2000'), (2000, 2000))
+        with self.assertRaises(argparse.ArgumentTypeError):
+            parse_years('a:b')
+
+    def testYearWindowIsView(self):
+        window = self.table.years((1990, 1999))
+        self.assertEqual(list(window['Year']), list(range(1990, 2000)))
+        self.assertTrue(np.shares_memory(window['Sea Level'], self.table['Sea Level']))
+        self.assertEqual(len(self.table.years((None, 1879))), 0)
+        self.assertEqual(len(self.table.years((2000, 1990))), 0)
+        self.assertIs(self.table.years(None), self.table)
+        months = DataTable({'Year': np.arange(0, 120, 3, dtype='int32')})     # Any ascending column
+        self.assertEqual(list(months.between('Year', 10, 20)['Year']), [12, 15, 18])
+
+    def testFormats(self):
+        rows = np.arange(len(self.table))
+        block, output.BLOCK_ROWS = output.BLOCK_ROWS, 10     # Many blocks
+        try:
+            for fmt in output.FORMATS:
+                out = io.StringIO()
+                self.assertTrue(write_rows(self.table, rows, fmt, out))
+                lines = out.getvalue().splitlines()
+                self.assertEqual(len(lines), len(self.table) + (fmt != 'jsonl'))
+        finally:
+            output.BLOCK_ROWS = block
+        out = io.StringIO()
+        write_rows(self.table, rows[-1:], 'jsonl', out)
+        self.assertEqual(json.loads(out.getvalue())['Year'], 2013)
+        out = io.StringIO()
+        write_rows(self.table, rows[:1], 'csv', out)
+        self.assertEqual(out.getvalue().splitlines()[1].split(',')[0], '1880')
+
+    def testJsonlMissingValuesAreNull(self):
+        table = DataTable({'Year': np.array([1, 2], dtype='int32'), 'GCAG': np.array([0.5, np.nan])})
+        out = io.StringIO()
+        write_rows(table, np.arange(2), 'jsonl', out)
+        self.assertEqual([json.loads(line, parse_constant=self.fail) for line in out.getvalue().splitlines()],
+                         [{'Year': 1, 'GCAG': 0.5}, {'Year': 2, 'GCAG': None}])
+
+    def testRejectsBadPages(self):
+        parser = argparse.ArgumentParser()
+        add_output_arguments(parser)
+        self.assertEqual(parser.parse_args(['--page', '2', '--top', '0']).page, 2)
+        for args in [['--page', '0'], ['--page', '-1'], ['--top', '-3'], ['--page-size', '-1']]:
+            with self.assertRaises(SystemExit), contextlib.redirect_stderr(io.StringIO()):
+                parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+import os
+import tempfile
+import numpy as np
+from unittest import mock
+from plots import PlotSpec, Series, render_plots, digest
+from datadir import DATA_DIR_ENV
+
+
+class TestPlots(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        years = np.arange(1880, 2014, dtype='int32')
+        self.columns = {'Year': years, 'Level': np.linspace(-150.0, 50.0, len(years))}
+        self.specs = [PlotSpec('Line.png', [Series('Year', 'Level')], 'Year', 'Level'),
+                      PlotSpec('Fit.png', [Series('Year', 'Level', 'o', 'GMSL')], 'Year', 'Level',
+                               title='Fit', legend='upper left', fit=('Year', 'Level'))]
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def testRendersInPool(self):
+        rendered = render_plots([(spec, self.columns) for spec in self.specs], processes=2)
+        self.assertEqual(sorted(rendered), ['Fit.png', 'Line.png'])
+        self.assertTrue(os.path.getsize('Fit.png') > 0 and os.path.getsize('Line.png') > 0)
+
+    def testUnchangedIsSkipped(self):
+        jobs = [(spec, self.columns) for spec in self.specs]
+        render_plots(jobs, processes=1)
+        self.assertEqual(render_plots(jobs, processes=1), [])
+
+    def testChangedDataIsRendered(self):
+        render_plots([(spec, self.columns) for spec in self.specs], processes=1)
+        self.columns['Level'] = self.columns['Level'] + 1
+        self.assertEqual(len(render_plots([(self.specs[0], self.columns)], processes=1)), 1)
+
+    def testWrittenToDataFolder(self):
+        with mock.patch.dict(os.environ, {DATA_DIR_ENV: 'shared'}):
+            render_plots([(self.specs[0], self.columns)], processes=1)
+        self.assertTrue(os.path.exists(os.path.join('shared', 'Line.png')))
+        self.assertTrue(os.path.exists(os.path.join('shared', '.plots.json')))
+        self.assertFalse(os.path.exists('Line.png'))
+
+    def testDigestIgnoresUnusedColumns(self):
+        other = dict(self.columns, Unused=np.zeros(3))
+        self.assertEqual(digest(self.specs[0], self.columns), digest(self.specs[0], other))
+
+
+if __name__ == "__main__":
+    unittest.main()
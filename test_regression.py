@@ -0,0 +1,64 @@
+import unittest
+import numpy as np
+from regression import fit_ols, rolling_ols
+
+try:
+    import statsmodels.api as sm
+except ImportError:
+    sm = None
+
+
+class TestRegression(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.x = rng.normal(0.0, 0.4, 134)
+        self.x2 = rng.normal(0.0, 1.0, 134)
+        self.y = 60*self.x + 5*self.x2 - 80 + rng.normal(0.0, 10.0, 134)
+
+    def testRecoversLine(self):
+        x = np.arange(50.0)
+        result = fit_ols(3*x + 2, x)
+        self.assertTrue(np.allclose(result.params, [2, 3]))
+        self.assertAlmostEqual(result.rsquared, 1.0)
+
+    @unittest.skipIf(sm is None, 'statsmodels not installed')
+    def testMatchesStatsmodelsThroughOrigin(self):
+        ours = fit_ols(self.y, self.x, intercept=False)
+        theirs = sm.OLS(self.y, self.x).fit()
+        for name in ['params', 'bse', 'tvalues', 'rsquared', 'rsquared_adj', 'fvalue',
+                     'llf', 'aic', 'bic', 'ssr']:
+            self.assertTrue(np.allclose(getattr(ours, name), getattr(theirs, name)), name)
+
+    @unittest.skipIf(sm is None, 'statsmodels not installed')
+    def testMatchesStatsmodelsWithIntercept(self):
+        from statsmodels.stats.stattools import durbin_watson, jarque_bera
+        ours = fit_ols(self.y, np.column_stack([self.x, self.x2]))
+        theirs = sm.OLS(self.y, sm.add_constant(np.column_stack([self.x, self.x2]))).fit()
+        for name in ['params', 'bse', 'tvalues', 'rsquared', 'rsquared_adj', 'fvalue',
+                     'llf', 'aic', 'bic', 'resid']:
+            self.assertTrue(np.allclose(getattr(ours, name), getattr(theirs, name)), name)
+        jb, jbpv, skew, kurtosis = jarque_bera(theirs.resid)
+        self.assertTrue(np.allclose([ours.jarque_bera, ours.skew, ours.kurtosis], [jb, skew, kurtosis]))
+        self.assertAlmostEqual(ours.durbin_watson, durbin_watson(theirs.resid))
+
+    def testRollingMatchesRefits(self):
+        slope, intercept, rsquared = rolling_ols(self.y, self.x, 30)
+        self.assertEqual(len(slope), 134 - 30 + 1)
+        for start in [0, 41, 104]:
+            fit = fit_ols(self.y[start:start+30], self.x[start:start+30])
+            self.assertTrue(np.allclose([intercept[start], slope[start], rsquared[start]],
+                                        [fit.params[0], fit.params[1], fit.rsquared]))
+
+    def testRollingRejectsBadWindow(self):
+        with self.assertRaises(ValueError):
+            rolling_ols(self.y, self.x, 500)
+
+    def testSummaryNamesTerms(self):
+        text = fit_ols(self.y, self.x, names=['Annual Avg Temp'], yname='Sea Level').summary()
+        self.assertIn('const', text)
+        self.assertIn('Annual Avg Temp', text)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,19 @@
 import unittest
 from seaLevels import *
 import os
+import tempfile
+import shutil
+import threading
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from datadir import DATA_DIR_ENV
+
+def write_raw_level(path, years):
+    '''Writes a synthetic raw GMSL file in the source layout, one date-prefixed row per year'''
+    with open(path, 'w') as f:
+        f.write('Time,GMSL,GMSL uncertainty\n')
+        for i, year in enumerate(years):
+            f.write('%d-06-15,%.1f,%.1f\n' % (year, i * 1.5 - 160, 25 - (i % 20)))
 
 
 class TestTemp(unittest.TestCase):
@@ -46,5 +59,85 @@ class TestTemp(unittest.TestCase):
         self.assertTrue(len(df) == len(data))
 
 
+def _load_size(i):
+    return len(load_level())
+
+
+class TestSeaOffline(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        write_raw_level('SeaLevelData.csv', range(1880, 2014))
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def testChunkedCleanMatchesLoop(self):
+        data = np.loadtxt('SeaLevelData.csv', delimiter=',', dtype=str)
+        rows = [[int(data[i][0][0:4]), float(data[i][1]), float(data[i][2])]
+                for i in range(1, len(data))]
+        pd.DataFrame(np.array(rows, dtype='O')).to_csv('Expected.csv')
+        clean_data_level(chunksize=9)
+        with open('Expected.csv') as a, open('SeaLevelClean.csv') as b:
+            self.assertEqual(a.read(), b.read())
+
+    def testIterChunksBounded(self):
+        sizes = [len(years) for years, level, uncert in iter_clean_level(chunksize=25)]
+        self.assertTrue(max(sizes) == 25 and sum(sizes) == 2014 - 1880)
+
+    def testCacheMatchesCsv(self):
+        clean_data_level()
+        self.assertIsNotNone(read_cache('SeaLevelClean.csv', SEA_COLUMNS))
+        df, data = create_sea_local()
+        csv = pd.read_csv('SeaLevelClean.csv', index_col=0)
+        self.assertTrue(np.array_equal(df.values, csv.values))
+        self.assertTrue(type(data[0][0]) == int and type(data[0][1]) == float)
+
+    def testConcurrentBuildWaitsForFirst(self):
+        with locked(SEA_CLEAN):       # Another job is building the clean files
+            waiter = threading.Thread(target=get_sea_csv)
+            waiter.start()
+            waiter.join(0.3)
+            self.assertTrue(waiter.is_alive())
+            clean_data_level()
+            stamp = os.stat('SeaLevelClean.csv').st_mtime_ns
+        waiter.join()
+        self.assertEqual(os.stat('SeaLevelClean.csv').st_mtime_ns, stamp)   # Reused, not rebuilt
+        self.assertFalse(os.path.exists('SeaLevelClean.csv.tmp'))
+
+    def testParallelLoadsRebuildCacheOnce(self):
+        clean_data_level()
+        shutil.rmtree('SeaLevelClean.cache')        # e.g. first run after an upgrade
+        with ProcessPoolExecutor(max_workers=8) as pool:
+            sizes = list(pool.map(_load_size, range(16)))
+        self.assertEqual(sizes, [2014 - 1880] * 16)
+        self.assertIsNotNone(read_cache('SeaLevelClean.csv', SEA_COLUMNS))
+
+    def testDataDirFromEnvironment(self):
+        os.makedirs('shared')
+        os.replace('SeaLevelData.csv', os.path.join('shared', 'SeaLevelData.csv'))
+        os.environ[DATA_DIR_ENV] = 'shared'
+        self.addCleanup(os.environ.pop, DATA_DIR_ENV)
+        get_sea_csv()
+        self.assertTrue(os.path.exists(os.path.join('shared', 'SeaLevelClean.csv')))
+        self.assertFalse(os.path.exists('SeaLevelClean.csv'))
+        self.assertEqual(len(load_level()), 2014 - 1880)
+
+    def testIncrementalMatchesFullClean(self):
+        write_raw_level('SeaLevelData.csv', range(1880, 1990))
+        clean_data_level(chunksize=9)
+        write_raw_level('SeaLevelData.csv', range(1880, 2014))
+        get_sea_csv()       # Picks up the grown raw file by itself
+        with open('SeaLevelClean.csv') as f:
+            incremental = f.read()
+        clean_data_level(chunksize=9)
+        with open('SeaLevelClean.csv') as f:
+            self.assertEqual(incremental, f.read())
+        self.assertEqual(read_meta('SeaLevelClean.csv', SEA_COLUMNS)['stats']['count'], 2014 - 1880)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+import os
+import json
+import tempfile
+import shutil
+import threading
+from urllib.request import urlopen
+from urllib.error import HTTPError
+from server import Datasets, make_server
+from datacache import cache_dir
+from datadir import locked
+from globalTemp import clean_data_temp, load_temp
+from seaLevels import clean_data_level, SEA_CLEAN
+from regression import fit_ols
+from test_globalTemp import write_raw_temp
+from test_seaLevels import write_raw_level
+
+
+class TestServer(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        write_raw_temp('GlobalTempData.csv', range(1880, 2017))
+        write_raw_level('SeaLevelData.csv', range(1880, 2014))
+        clean_data_temp()
+        clean_data_level()
+        self.server = make_server(Datasets(), port=0)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def get(self, path):
+        with urlopen(self.url + path) as response:
+            return json.load(response)
+
+    def testTables(self):
+        temp = self.get('/temp')
+        self.assertEqual(temp['Year'], list(load_temp()['Year']))
+        ranked = self.get('/temp?sort=1')['Annual Avg Temp']
+        self.assertEqual(ranked, sorted(temp['Annual Avg Temp'], reverse=True))
+        self.assertEqual(len(self.get('/merged')['Year']), 134)
+
+    def testOls(self):
+        merged = self.get('/merged')
+        fit = fit_ols(merged['Sea Level'], merged['5-Year Avg Temp'])
+        answer = self.get('/ols?var=5year&intercept=1')
+        self.assertEqual(answer['names'], ['const', '5-Year Avg Temp'])
+        self.assertAlmostEqual(answer['params'][1], fit.params[1])
+        self.assertAlmostEqual(answer['rsquared'], fit.rsquared)
+
+    def testUnknownPath(self):
+        with self.assertRaises(HTTPError) as raised:
+            self.get('/nothing')
+        self.assertEqual(raised.exception.code, 404)
+
+    def testHotReload(self):
+        self.assertEqual(self.get('/status')['version'], 1)
+        before = self.get('/sea/avg')
+        write_raw_level('SeaLevelData.csv', range(1900, 2014))
+        clean_data_level()
+        self.assertEqual(self.get('/status')['version'], 2)
+        self.assertEqual(self.get('/status')['rows']['sea'], 114)
+        self.assertNotEqual(self.get('/sea/avg'), before)
+
+    def testReloadRebuildsCache(self):
+        self.assertEqual(self.get('/status')['version'], 1)
+        shutil.rmtree(cache_dir(SEA_CLEAN))
+        with locked(SEA_CLEAN):     # A build in progress, the old data is served meanwhile
+            self.assertEqual(self.get('/status')['version'], 1)
+        self.assertEqual(self.get('/status')['version'], 2)
+        self.assertEqual(self.get('/status')['rows']['sea'], 134)
+        self.assertTrue(os.path.exists(os.path.join(cache_dir(SEA_CLEAN), 'schema.json')))
+
+
+if __name__ == "__main__":
+    unittest.main()
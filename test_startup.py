@@ -0,0 +1,35 @@
+import unittest
+import os
+import sys
+import tempfile
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+class TestStartup(unittest.TestCase):
+
+    def run_python(self, code):
+        '''Runs code in a fresh interpreter inside an empty folder, returns (stdout, files)'''
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, PYTHONPATH=HERE)
+            out = subprocess.run([sys.executable, '-c', code], cwd=tmp, env=env, check=True,
+                                 capture_output=True, text=True).stdout
+            return out.strip(), os.listdir(tmp)
+
+    def testImportsAreLight(self):
+        out, files = self.run_python(
+            'import sys, globalTemp, seaLevels, TempVsSeaLevel\n'
+            'print(",".join(m for m in ("matplotlib", "statsmodels", "requests") if m in sys.modules))')
+        self.assertEqual(out, '')
+
+    def testImportHasNoSideEffects(self):
+        out, files = self.run_python(
+            'import logging, TempVsSeaLevel\n'
+            'print(len(logging.getLogger().handlers))')
+        self.assertEqual(out, '0')
+        self.assertEqual(files, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+import numpy as np
+from records import DataTable
+from streamstats import StreamStats
+
+
+class TestStreamStats(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.years = np.arange(1880, 2014, dtype='int32')
+        self.level = 1.5 * (self.years - 1990) + rng.normal(0, 5, len(self.years))
+        self.names = ['Year', 'Sea Level']
+
+    def chunks(self, size):
+        for start in range(0, len(self.years), size):
+            yield [self.years[start:start + size], self.level[start:start + size]]
+
+    def assertMatchesNumpy(self, stats):
+        self.assertEqual(stats.count, len(self.years))
+        self.assertAlmostEqual(stats.column_mean('Sea Level'), self.level.mean())
+        self.assertAlmostEqual(stats.variance('Sea Level'), self.level.var())
+        self.assertAlmostEqual(stats.covariance('Year', 'Sea Level'), np.cov(self.years, self.level, bias=True)[0, 1])
+        np.testing.assert_allclose(stats.trend('Sea Level'), np.polyfit(self.years, self.level, 1))
+        self.assertEqual((stats.min[1], stats.max[1]), (self.level.min(), self.level.max()))
+        self.assertAlmostEqual(stats.change('Sea Level'), (self.level[-1] - self.level[0]) / len(self.years))
+
+    def testChunkedMatchesNumpy(self):
+        for size in [1, 7, 1000]:
+            stats = StreamStats(self.names)
+            for chunk in self.chunks(size):
+                stats.update(chunk)
+            self.assertMatchesNumpy(stats)
+
+    def testMergedPartitions(self):
+        parts = [StreamStats(self.names).update(chunk) for chunk in self.chunks(40)]
+        total = StreamStats(self.names)
+        for part in parts:
+            total.merge(part)
+        self.assertMatchesNumpy(total)
+
+    def testRoundTrip(self):
+        stats = StreamStats.of_table(DataTable({'Year': self.years, 'Sea Level': self.level}))
+        self.assertMatchesNumpy(StreamStats.from_dict(stats.to_dict()))
+
+    def testLargeOffsetKeepsVariance(self):
+        values = 1e9 + np.arange(10.0)
+        stats = StreamStats(['x'])
+        for chunk in np.split(values, 5):
+            stats.update([chunk])
+        self.assertAlmostEqual(stats.variance('x'), values.var())
+
+
+if __name__ == '__main__':
+    unittest.main()